@@ -1,6 +1,10 @@
+import asyncio
+import copy
 import json
 import os
 import threading
+import time
+from types import MappingProxyType
 
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
@@ -8,9 +12,14 @@ from slack_bolt.adapter.socket_mode import SocketModeHandler
 from bottypes.invalid_console_command import InvalidConsoleCommand
 from handlers import *
 from handlers import handler_factory
+from util.cache import TTLCache
+from util.command_executor import AsyncCommandExecutor, CommandExecutor
 from util.loghandler import log
 from util.slack_wrapper import SlackWrapper
-from util.storage_service import StorageService
+from util.storage_backend import create_storage_service
+
+
+CONFIG_PATH = "./config/config.json"
 
 
 class BotServer:
@@ -20,10 +29,26 @@ class BotServer:
     def __init__(self):
         log.debug("Parse config file and initialize threading...")
         self.running = False
-        self.config = {}
+        self.config = MappingProxyType({})
+        self._config_mtime = None
         self.load_config()
         self.slack_wrapper = SlackWrapper()
-        self.storage_service = StorageService()
+        self.storage_service = create_storage_service()
+
+        # Commands are run off the Slack listener thread, one at a time per CTF
+        self.executor = CommandExecutor(
+            max_workers=int(os.environ.get("BOT_WORKERS", default=4))
+        )
+        # Channel id => id of the CTF the channel belongs to, or the channel id
+        # itself for channels outside of a CTF. Channels never change their CTF.
+        self.channel_ctfs = TTLCache(maxsize=1000, ttl=3600)
+
+        # Event loop and Slack wrapper for async commands, set up on first use
+        # unless the server runs on a loop itself
+        self.loop = None
+        self._async_slack_wrapper = None
+        self._loop_lock = threading.Lock()
+        self.async_storage_service = self.storage_service.create_async_service()
         self.init_bot_data()
 
     def lock(self):
@@ -40,39 +65,91 @@ class BotServer:
         self.running = False
 
     def load_config(self):
-        """Load configuration file."""
-        self.lock()
-        with open("./config/config.json") as f:
-            self.config = json.load(f)
-        self.release()
+        """Load configuration file and swap it in as the current configuration."""
+        with BotServer.thread_lock:
+            with open(CONFIG_PATH) as f:
+                config = json.load(f)
+            self._config_mtime = os.stat(CONFIG_PATH).st_mtime
+            self.config = MappingProxyType(config)
 
-    def get_config_option(self, option):
-        """Get configuration option."""
-        self.lock()
-        result = self.config.get(option)
-        self.release()
+    def watch_config(self, interval):
+        """Reload the configuration file, whenever it changed, every interval seconds."""
 
-        return result
+        def watch():
+            while self.running:
+                time.sleep(interval)
+                try:
+                    if os.stat(CONFIG_PATH).st_mtime != self._config_mtime:
+                        self.load_config()
+                        log.info("Reloaded configuration")
+                except (OSError, ValueError) as e:
+                    log.warning(f"Failed to reload configuration: {e}")
 
-    def set_config_option(self, option, value):
-        """Set configuration option."""
-        self.lock()
+        threading.Thread(target=watch, name="config-watch", daemon=True).start()
 
-        try:
-            if option in self.config:
-                self.config[option] = value
-                log.info("Updated configuration: %s => %s", option, value)
+    def get_config_option(self, option):
+        """
+        Get configuration option. The configuration is never changed in place,
+        but replaced as a whole, so reading it needs no lock.
+        """
+        return self.config.get(option)
 
-                with open("./config/config.json", "w") as f:
-                    json.dump(self.config, f, indent=4)
-            else:
+    def set_config_option(self, option, value):
+        """Set configuration option."""
+        with BotServer.thread_lock:
+            if option not in self.config:
                 raise InvalidConsoleCommand(
                     "The specified configuration option doesn't exist: {}".format(
                         option
                     )
                 )
-        finally:
-            self.release()
+
+            config = copy.deepcopy(dict(self.config))
+            config[option] = value
+            with open(CONFIG_PATH, "w") as f:
+                json.dump(config, f, indent=4)
+            self._config_mtime = os.stat(CONFIG_PATH).st_mtime
+            self.config = MappingProxyType(config)
+
+        log.info("Updated configuration: %s => %s", option, value)
+
+    @property
+    def async_slack_wrapper(self):
+        """
+        Slack wrapper for async commands, sharing rate limits and members with
+        the sync one.
+        """
+        if self._async_slack_wrapper is None:
+            from util.async_slack_wrapper import AsyncSlackWrapper
+
+            self._async_slack_wrapper = AsyncSlackWrapper(
+                rate_limiter=self.slack_wrapper.rate_limiter,
+                members=self.slack_wrapper.members,
+            )
+        return self._async_slack_wrapper
+
+    def run_on_loop(self, loop):
+        """
+        Run commands on the server's event loop: async commands are awaited on
+        the loop instead of blocking a worker until they are done.
+        """
+        self.loop = loop
+        self.executor.shutdown()
+        self.executor = AsyncCommandExecutor(loop, self.executor.max_workers)
+
+    def run_coroutine(self, coro):
+        """
+        Run a coroutine on the bot's event loop and wait for its result. Must be
+        called from a command thread, not from the loop. Without a running
+        server loop, a loop is started on a background thread.
+        """
+        with self._loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self.loop.run_forever, name="asyncio", daemon=True
+                ).start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
 
     def parse_slack_message(self, msg):
         """
@@ -93,7 +170,48 @@ class BotServer:
         log.info("Initializing handlers...")
         handler_factory.initialize(self.slack_wrapper, self, self.storage_service)
 
+    def dispatch_message(self, body):
+        """
+        Queue a message for handling on the command executor. Commands of the
+        same CTF, from its own or its challenges' channels, are handled in order,
+        others in parallel. Nothing here may block, as Slack is waiting for the
+        message to be acknowledged, so the CTF is looked up on a worker.
+        """
+        command, params, channel, time_stamp, user = self.parse_slack_message(body)
+
+        # On the server's loop, the executor awaits async commands itself
+        if isinstance(self.executor, AsyncCommandExecutor):
+            handle = self.process_message
+        else:
+            handle = self.handle_message
+
+        self.executor.submit(
+            channel,
+            lambda: handle(body),
+            handler_factory.command_name(command, params),
+            route=lambda: self.ordering_key(channel),
+        )
+
+    def ordering_key(self, channel_id):
+        """Return the id of the CTF a channel belongs to, or the channel id itself."""
+        ctf_id = self.channel_ctfs.get(channel_id)
+        if ctf_id is None:
+            challenge = self.storage_service.get_challenge(challenge_id=channel_id)
+            ctf_id = challenge.ctf_channel_id if challenge else channel_id
+            self.channel_ctfs.put(channel_id, ctf_id)
+        return ctf_id
+
     def handle_message(self, body):
+        """Handle a message, waiting for async commands on the bot's loop."""
+        command = self.process_message(body)
+        if command is not None:
+            self.run_coroutine(command)
+
+    def process_message(self, body):
+        """
+        Handle a message. Return the coroutine of an async command, which is
+        left to the caller to await, or None.
+        """
         command, params, channel, time_stamp, user = self.parse_slack_message(body)
 
         try:
@@ -104,27 +222,83 @@ class BotServer:
                 user,
                 channel,
             )
-            handler_factory.process(
+            return handler_factory.process(
                 self.slack_wrapper, self.storage_service, command, params, time_stamp, channel, user
             )
         except Exception as e:
             log.exception(e)
 
 
-app = App(token=os.environ.get("SLACK_BOT_TOKEN"))
+def create_app(botserver):
+    """Create the Slack app, passing the bot's commands to botserver."""
+    app = App(token=os.environ.get("SLACK_BOT_TOKEN"))
 
-botserver = BotServer()
+    @app.command("/admin")
+    @app.command("/bot")
+    @app.command("/ctf")
+    @app.command("/syscalls")
+    def handle_message(ack, body):
+        ack()
+        botserver.dispatch_message(body)
 
+    @app.event("team_join")
+    @app.event("user_change")
+    def handle_user_event(event):
+        botserver.slack_wrapper.update_member(event["user"])
 
-@app.command("/admin")
-@app.command("/bot")
-@app.command("/ctf")
-@app.command("/syscalls")
-def handle_message(ack, body):
-    ack()
-    botserver.handle_message(body)
+    return app
+
+
+def create_async_app(botserver):
+    """
+    Create the Slack app on asyncio, passing the bot's commands to botserver.
+    Needs the aiohttp package.
+    """
+    from slack_bolt.async_app import AsyncApp
+
+    app = AsyncApp(token=os.environ.get("SLACK_BOT_TOKEN"))
+
+    @app.command("/admin")
+    @app.command("/bot")
+    @app.command("/ctf")
+    @app.command("/syscalls")
+    async def handle_message(ack, body):
+        await ack()
+        botserver.dispatch_message(body)
+
+    @app.event("team_join")
+    @app.event("user_change")
+    async def handle_user_event(event):
+        botserver.slack_wrapper.update_member(event["user"])
+
+    return app
+
+
+async def serve_async(botserver):
+    """Run the bot on asyncio, with async commands running on the server's loop."""
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+    botserver.run_on_loop(asyncio.get_running_loop())
+    handler = AsyncSocketModeHandler(
+        create_async_app(botserver), os.environ["SLACK_APP_TOKEN"]
+    )
+    await handler.start_async()
 
 
 if __name__ == "__main__":
-    handler = SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"])
-    handler.start()
+    botserver = BotServer()
+
+    # Don't hang on a slow storage, commands will set it up on first use then
+    botserver.storage_service.wait_until_ready(
+        float(os.environ.get("STORAGE_STARTUP_TIMEOUT", default=60))
+    )
+
+    config_watch_interval = float(os.environ.get("CONFIG_WATCH_INTERVAL", default=5))
+    if config_watch_interval > 0:
+        botserver.watch_config(config_watch_interval)
+
+    if os.environ.get("BOT_MODE", default="sync").lower() == "async":
+        asyncio.run(serve_async(botserver))
+    else:
+        handler = SocketModeHandler(create_app(botserver), os.environ["SLACK_APP_TOKEN"])
+        handler.start()
@@ -1,23 +1,21 @@
 from typing import List
 
-from pydantic import BaseModel
-
 from bottypes.challenge import Challenge
+from bottypes.ctf_summary import CTFSummary
 
 
-class CTF(BaseModel):
+class CTF(CTFSummary):
     """
     An object representation of an ongoing CTF.
     """
 
-    channel_id: str
-    name: str
-    long_name: str = ""
     challenges: List[Challenge] = []
-    cred_user = ""
-    cred_pw = ""
-    finished = False
-    finished_on = 0
+
+    def summary(self) -> CTFSummary:
+        """
+        Return the CTF-level fields only.
+        """
+        return CTFSummary.parse_obj(self.dict(exclude={"challenges"}))
 
     def add_challenge(self, _challenge):
         """
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+
+
+class CTFSummary(BaseModel):
+    """
+    An object representation of an ongoing CTF, without its challenges.
+    """
+
+    channel_id: str
+    name: str
+    long_name: str = ""
+    cred_user = ""
+    cred_pw = ""
+    finished = False
+    finished_on = 0
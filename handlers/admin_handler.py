@@ -82,6 +82,27 @@ class ToggleMaintenanceModeCommand(Command):
         slack_wrapper.post_message(channel_id, text)
 
 
+class MigrateStorageCommand(Command):
+    """
+    Migrate the storage to the current index layout.
+    Must be in maintenance mode to use, as writes during a migration can get lost.
+    """
+
+    @classmethod
+    def execute(
+        cls, slack_wrapper, storage_service, args, timestamp, channel_id, user_id, user_is_admin
+    ):
+        if not handler_factory.botserver.get_config_option("maintenance_mode"):
+            raise InvalidCommand("Must be in maintenance mode to migrate the storage")
+
+        steps = storage_service.migrate()
+        if steps:
+            text = "Storage migrated:\n" + "\n".join(f"- {step}" for step in steps)
+        else:
+            text = "Storage is up to date."
+        slack_wrapper.post_message(channel_id, text)
+
+
 class ShowAdminsCommand(Command):
     """Shows list of users in the admin user group."""
 
@@ -133,7 +154,8 @@ class AddAdminCommand(Command):
 
         if user_object["ok"] and admin_users:
             if user_object["user"]["id"] not in admin_users:
-                admin_users.append(user_object["user"]["id"])
+                # The configuration is a shared snapshot, don't change it in place
+                admin_users = [*admin_users, user_object["user"]["id"]]
 
                 handler_factory.botserver.set_config_option("admin_users", admin_users)
 
@@ -166,7 +188,7 @@ class RemoveAdminCommand(Command):
         admin_users = handler_factory.botserver.get_config_option("admin_users")
 
         if admin_users and user in admin_users:
-            admin_users.remove(user)
+            admin_users = [admin for admin in admin_users if admin != user]
             handler_factory.botserver.set_config_option("admin_users", admin_users)
 
             response = "User *{}* removed from the admin group.".format(user)
@@ -195,7 +217,7 @@ class AsCommand(Command):
             dest_user_id = user_obj["user"]["id"]
 
             # Redirecting command execution to handler factory
-            handler_factory.process_command(
+            return handler_factory.process_command(
                 slack_wrapper,
                 storage_service,
                 dest_command,
@@ -245,6 +267,11 @@ class AdminHandler(BaseHandler):
                 description="Toggle maintenance mode",
                 is_admin_cmd=True,
             ),
+            "migrate_storage": CommandDesc(
+                command=MigrateStorageCommand,
+                description="Migrate the storage to the current index layout (requires maintenance mode)",
+                is_admin_cmd=True,
+            ),
             "debug": CommandDesc(
                 command=StartDebuggerCommand,
                 description="Break into a debugger shell",
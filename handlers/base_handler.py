@@ -1,30 +1,26 @@
+import inspect
 from abc import ABC
-from typing import Dict
+from typing import Dict, List, Tuple
 
 from bottypes.command_descriptor import CommandDesc
 from bottypes.invalid_command import InvalidCommand
 from bottypes.reaction_descriptor import ReactionDesc
 from handlers import handler_factory
 
+# Maximum length of the text of a Block Kit section
+MAX_BLOCK_TEXT_LENGTH = 3000
+
 
 class BaseHandler(ABC):
     commands: Dict[str, CommandDesc] = {}  # Overridden by concrete class
     aliases: Dict[str, str] = {}  # Overridden by concrete class
     reactions: Dict[str, ReactionDesc] = {}
     handler_name: str = ""  # Overridden by concrete class
+    _usage: Dict[bool, Tuple[str, List[Dict]]] | None = None  # See build_usage
 
     def can_handle(self, command, user_is_admin):
-        if command in self.commands:
-            cmd_desc = self.commands[command]
-            # Hide admin commands
-            if user_is_admin or not cmd_desc.is_admin_cmd:
-                return True
-
-        if command in self.aliases:
-            if self.can_handle(self.aliases[command], user_is_admin):
-                return True
-
-        return False
+        key = (self.handler_name, command, bool(user_is_admin))
+        return key in handler_factory.dispatch_table
 
     def can_handle_reaction(self, reaction):
         if reaction in self.reactions:
@@ -35,12 +31,9 @@ class BaseHandler(ABC):
         pass
 
     def get_aliases_for_command(self, command):
-        cmd_aliases = []
-
-        if self.aliases:
-            for alias in self.aliases:
-                if self.aliases[alias] == command:
-                    cmd_aliases.append(alias)
+        cmd_aliases = [
+            alias for alias, aliased in self.aliases.items() if aliased == command
+        ]
 
         if cmd_aliases:
             return " `(Alias: {})`".format(", ".join(cmd_aliases))
@@ -72,22 +65,69 @@ class BaseHandler(ABC):
         usage = self.parse_command_usage(command, descriptor)
         return "Usage: {}".format(usage)
 
+    def build_usage(self):
+        """
+        Render the usage of this handler as text and as Block Kit blocks, for
+        admins and non-admins. Done on first use after clear_usage.
+        """
+        usage = {}
+
+        for user_is_admin in (False, True):
+            lines = [
+                self.parse_command_usage(command, descriptor)
+                for command, descriptor in self.commands.items()
+                if (not descriptor.is_admin_cmd) or user_is_admin
+            ]
+            text = "".join("{}\n".format(line) for line in lines)
+            usage[user_is_admin] = (text, self.build_usage_blocks(lines))
+
+        self._usage = usage
+        return usage
+
+    def build_usage_blocks(self, lines):
+        """Return Block Kit blocks listing the given usage lines."""
+        if not lines:
+            return []
+
+        blocks = [
+            {
+                "type": "header",
+                "text": {"type": "plain_text", "text": "/{}".format(self.handler_name)},
+            }
+        ]
+
+        # Fill each section up to the maximum text length of a block
+        section = ""
+        for line in lines:
+            if section and len(section) + len(line) + 1 > MAX_BLOCK_TEXT_LENGTH:
+                blocks.append(self._usage_section(section))
+                section = ""
+            section += "{}\n".format(line)
+        blocks.append(self._usage_section(section))
+
+        return blocks
+
+    @staticmethod
+    def _usage_section(text):
+        return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+    def clear_usage(self):
+        """Drop the rendered usage, after commands changed."""
+        self._usage = None
+
     def get_usage(self, user_is_admin):
         """Return the usage of a handler."""
-        msg = ""
-
-        for command in self.commands:
-            descriptor = self.commands[command]
-
-            if (not descriptor.is_admin_cmd) or user_is_admin:
-                usage = self.parse_command_usage(command, descriptor)
-                msg += "{}\n".format(usage)
-
-        # Return empty message, if no applicable commands were found
-        if msg == "``````":
-            return ""
-
-        return msg
+        usage = self._usage
+        if usage is None:
+            usage = self.build_usage()
+        return usage[bool(user_is_admin)][0]
+
+    def get_usage_blocks(self, user_is_admin):
+        """Return the usage of a handler as Block Kit blocks."""
+        usage = self._usage
+        if usage is None:
+            usage = self.build_usage()
+        return usage[bool(user_is_admin)][1]
 
     def process(
         self, slack_wrapper, storage_service, command, args, timestamp, channel, user, user_is_admin
@@ -104,24 +144,28 @@ class BaseHandler(ABC):
                 return
 
         """Check if enough arguments were passed for this command."""
-        if command in self.aliases:
-            self.process(
-                slack_wrapper,
-                storage_service,
-                self.aliases[command],
-                args,
-                timestamp,
-                channel,
-                user,
-                user_is_admin,
-            )
-        elif command in self.commands:
+        command = self.aliases.get(command, command)
+        if command in self.commands:
             cmd_descriptor = self.commands[command]
 
             if cmd_descriptor:
                 if len(args) < len(cmd_descriptor.arguments):
                     raise InvalidCommand(self.command_usage(command, cmd_descriptor))
-                cmd_descriptor.command.execute(
+
+                execute = cmd_descriptor.command.execute
+                if inspect.iscoroutinefunction(execute):
+                    # Async commands are returned to be awaited on the bot's loop
+                    botserver = handler_factory.botserver
+                    return execute(
+                        botserver.async_slack_wrapper,
+                        botserver.async_storage_service,
+                        args,
+                        timestamp,
+                        channel,
+                        user,
+                        user_is_admin,
+                    )
+                return execute(
                     slack_wrapper, storage_service, args, timestamp, channel, user, user_is_admin
                 )
 
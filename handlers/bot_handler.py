@@ -64,11 +64,10 @@ class InviteCommand(Command):
     def execute(
         cls, slack_wrapper, storage_service, args, timestamp, channel_id, user_id, user_is_admin
     ):
-        current_members = slack_wrapper.get_channel_members(channel_id)
         # strip uid formatting
         invited_users = [user.strip("<>@") for user in args]
         # remove already present members
-        invited_users = [user for user in invited_users if user not in current_members]
+        invited_users = slack_wrapper.get_missing_members(channel_id, invited_users)
         failed_users = []
         for member in invited_users:
             if not slack_wrapper.invite_user(member, channel_id)["ok"]:
@@ -100,6 +99,36 @@ class SysInfoCommand(Command):
         slack_wrapper.post_message(user_id, result.decode(), user_id=user_id)
 
 
+class StatsCommand(Command):
+    """Show runtime statistics of the bot, like cache hit ratios."""
+
+    @classmethod
+    def execute(
+        cls, slack_wrapper, storage_service, args, timestamp, channel_id, user_id, user_is_admin
+    ):
+        message = "*CTF cache*\n"
+        message += cls.format_stats(
+            storage_service.cache_stats(), "Not used by this storage backend."
+        )
+        message += "\n*Slack user cache*\n"
+        message += cls.format_stats(slack_wrapper.user_cache_stats(), "Empty.")
+        message += "\n*Slack rate limiter*\n"
+        message += cls.format_stats(slack_wrapper.rate_limit_stats(), "No calls yet.")
+        message += "\n*Command executor*\n"
+        message += cls.format_stats(
+            handler_factory.botserver.executor.stats(), "Not running."
+        )
+
+        slack_wrapper.post_message(user_id, message, user_id=user_id)
+
+    @staticmethod
+    def format_stats(stats, fallback):
+        if not stats:
+            return fallback
+        lines = "\n".join(f"{key:<10}: {value}" for key, value in stats.items())
+        return f"```\n{lines}\n```"
+
+
 class BotHandler(BaseHandler):
     """Handler for generic bot commands."""
 
@@ -124,6 +153,11 @@ class BotHandler(BaseHandler):
                 description="Show system information",
                 is_admin_cmd=True,
             ),
+            "stats": CommandDesc(
+                command=StatsCommand,
+                description="Show runtime statistics of the bot",
+                is_admin_cmd=True,
+            ),
         }
 
 
@@ -1,4 +1,7 @@
+import asyncio
+import itertools
 import json
+import threading
 import time
 from random import randint
 
@@ -14,7 +17,7 @@ from bottypes.player import Player
 from handlers import handler_factory
 from handlers.base_handler import BaseHandler
 from util.loghandler import log
-from util.storage_service import StorageService
+from util.storage_backend import StorageBackend
 from util.util import (
     get_display_name,
     is_valid_name,
@@ -26,16 +29,43 @@ from util.util import (
 )
 
 
+async def invite_to_ctf(slack_wrapper, storage_service, ctf, members):
+    """
+    Invite the given members to the CTF channel and all of its challenge
+    channels, which are handled concurrently.
+    """
+    channel_ids = [ctf.channel_id] + [
+        chall.channel_id
+        for chall in await storage_service.get_challenges(ctf.channel_id)
+    ]
+    return await slack_wrapper.invite_members(channel_ids, members)
+
+
+def format_invite_summary(results):
+    """Summarize the results of SlackWrapper.invite_members in a message."""
+    invited = sum(len(invites) for _, invites, error in results if not error)
+    failed = [channel_id for channel_id, _, error in results if error]
+    for channel_id, _, error in results:
+        if error:
+            log.warning(f"Failed to invite members to {channel_id}: {error}")
+
+    message = f"Sent {invited} invite(s) to {len(results) - len(failed)} channel(s)."
+    if failed:
+        channels = ", ".join(f"<#{channel_id}>" for channel_id in failed)
+        message += f" Failed to invite to {channels}."
+    return message
+
+
 class SignupCommand(Command):
     """
     Invite the user into the specified CTF channel along with any existing challenge channels.
     """
 
     @classmethod
-    def execute(
+    async def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service,
         args,
         timestamp,
         channel_id,
@@ -43,25 +73,16 @@ class SignupCommand(Command):
         user_is_admin,
     ):
         enabled = handler_factory.botserver.get_config_option("allow_signup")
-        ctf = storage_service.get_ctf(ctf_name=args[0])
+        ctf = await storage_service.get_ctf_summary(ctf_name=args[0])
         if not enabled or not ctf:
             raise InvalidCommand("No CTF by that name")
 
         if ctf.finished:
             raise InvalidCommand("That CTF has already concluded")
 
-        members = [user_id]
-        current = slack_wrapper.get_channel_members(ctf.channel_id)
-        invites = list(set(members) - set(current))
-
-        # Ignore responses, because errors here don't matter
-        if len(invites) > 0:
-            slack_wrapper.invite_user(invites, ctf.channel_id)
-        for chall in storage_service.get_challenges(ctf.channel_id):
-            current = slack_wrapper.get_channel_members(chall.channel_id)
-            invites = list(set(members) - set(current))
-            if len(invites) > 0:
-                slack_wrapper.invite_user(invites, chall.channel_id)
+        results = await invite_to_ctf(slack_wrapper, storage_service, ctf, [user_id])
+        message = f"Signed up for *{ctf.name}*. {format_invite_summary(results)}"
+        await slack_wrapper.post_message(user_id, message)
 
 
 class PopulateCommand(Command):
@@ -71,34 +92,25 @@ class PopulateCommand(Command):
     """
 
     @classmethod
-    def execute(
+    async def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service,
         args,
         timestamp,
         channel_id,
         user_id,
         user_is_admin,
     ):
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf = await storage_service.get_ctf_summary(ctf_id=channel_id)
         if not ctf:
             raise InvalidCommand(
                 "You must be in a CTF or Challenge channel to use this command."
             )
 
         members = [user.strip("<>@") for user in args]
-        current = slack_wrapper.get_channel_members(ctf.channel_id)
-        invites = list(set(members) - set(current))
-
-        # Ignore responses, because errors here don't matter
-        if len(invites) > 0:
-            slack_wrapper.invite_user(invites, ctf.channel_id)
-        for chall in storage_service.get_challenges(ctf.channel_id):
-            current = slack_wrapper.get_channel_members(chall.channel_id)
-            invites = list(set(members) - set(current))
-            if len(invites) > 0:
-                slack_wrapper.invite_user(invites, chall.channel_id)
+        results = await invite_to_ctf(slack_wrapper, storage_service, ctf, members)
+        await slack_wrapper.post_message(channel_id, format_invite_summary(results))
 
 
 class AddChallengeTagCommand(Command):
@@ -108,7 +120,7 @@ class AddChallengeTagCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -119,10 +131,10 @@ class AddChallengeTagCommand(Command):
         tags = None
         challenge = storage_service.get_challenge_from_args_or_channel(args, channel_id)
 
-        if challenge.channel_id == channel_id:
+        if challenge and challenge.channel_id == channel_id:
             # We were called from the Challenge channel
             tags = args if len(args) > 0 else None
-        elif challenge.ctf_channel_id == channel_id:
+        elif challenge and challenge.ctf_channel_id == channel_id:
             # We were called from the CTF channel
             tags = args[1:] if len(args) > 1 else None
         else:
@@ -132,13 +144,15 @@ class AddChallengeTagCommand(Command):
 
         if tags is not None:
             # There may be updates to apply
-            dirty = False
-            for tag in tags:
-                dirty |= challenge.add_tag(tag)
+            def update_func(challenge):
+                dirty = False
+                for tag in tags:
+                    dirty |= challenge.add_tag(tag)
+
+                # Save challenge iff it was modified
+                return dirty
 
-            # Save challenge iff it was modified
-            if dirty:
-                storage_service.add_challenge(challenge, challenge.ctf_channel_id)
+            storage_service.update_challenge(challenge.channel_id, update_func)
 
 
 class RemoveChallengeTagCommand(Command):
@@ -148,7 +162,7 @@ class RemoveChallengeTagCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -159,10 +173,10 @@ class RemoveChallengeTagCommand(Command):
         tags = None
         challenge = storage_service.get_challenge_from_args_or_channel(args, channel_id)
 
-        if challenge.channel_id == channel_id:
+        if challenge and challenge.channel_id == channel_id:
             # We were called from the Challenge channel
             tags = args if len(args) > 0 else None
-        elif challenge.ctf_channel_id == channel_id:
+        elif challenge and challenge.ctf_channel_id == channel_id:
             # We were called from the CTF channel
             tags = args[1:] if len(args) > 1 else None
         else:
@@ -172,13 +186,15 @@ class RemoveChallengeTagCommand(Command):
 
         if tags is not None:
             # There may be updates to apply
-            dirty = False
-            for tag in tags:
-                dirty |= challenge.remove_tag(tag)
+            def update_func(challenge):
+                dirty = False
+                for tag in tags:
+                    dirty |= challenge.remove_tag(tag)
 
-            # Save challenge iff it was modified
-            if dirty:
-                storage_service.add_challenge(challenge, challenge.ctf_channel_id)
+                # Save challenge iff it was modified
+                return dirty
+
+            storage_service.update_challenge(challenge.channel_id, update_func)
 
 
 class RollCommand(Command):
@@ -188,7 +204,7 @@ class RollCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -208,6 +224,7 @@ class RollCommand(Command):
 
 MAX_CHANNEL_NAME_LENGTH = 80
 MAX_CTF_NAME_LENGTH = 40
+RENAME_PROGRESS_STEP = 10
 
 
 class AddCTFCommand(Command):
@@ -217,7 +234,7 @@ class AddCTFCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -292,7 +309,7 @@ class RenameChallengeCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -303,7 +320,7 @@ class RenameChallengeCommand(Command):
         new_name = args[1].lower()
 
         # Validate that the user is in a CTF channel
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
 
         if not ctf:
             raise InvalidCommand(
@@ -369,7 +386,7 @@ class RenameCTFCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -412,7 +429,8 @@ class RenameCTFCommand(Command):
             )
 
         text = "Renaming the CTF might take some time depending on active channels..."
-        slack_wrapper.post_message(ctf.channel_id, text)
+        response = slack_wrapper.post_message(ctf.channel_id, text)
+        thread_ts = response["ts"] if response else ""
 
         # Rename the ctf channel
         response = slack_wrapper.rename_channel(ctf.channel_id, new_name)
@@ -424,25 +442,34 @@ class RenameCTFCommand(Command):
                 )
             )
 
-        # Update channel purpose
-        slack_wrapper.update_channel_purpose_name(ctf.channel_id, new_name)
-
-        # Update database
+        # Update channel purpose and database. Challenge purposes and names
+        # don't contain the CTF name, so only the channel names change for them.
+        ctf.name = new_name
+        ChallengeHandler.update_ctf_purpose(slack_wrapper, ctf)
         storage_service.update_ctf_name(ctf.channel_id, new_name)
 
         # Rename all challenge channels for this ctf
-        for chall in ctf.challenges:
-            RenameChallengeCommand().execute(
-                slack_wrapper,
-                storage_service,
-                [chall.name, chall.name],
-                timestamp,
-                ctf.channel_id,
-                user_id,
-                user_is_admin,
+        def rename(chall):
+            channel_name = "{}-{}".format(new_name, chall.name)
+            return slack_wrapper.rename_channel(
+                chall.channel_id, channel_name, is_private=True
             )
 
+        def progress(done, total):
+            if done % RENAME_PROGRESS_STEP == 0 and done < total:
+                text = "Renamed {}/{} challenge channels...".format(done, total)
+                slack_wrapper.post_message(ctf.channel_id, text, thread_ts)
+
+        results = slack_wrapper.run_concurrently(rename, ctf.challenges, progress)
+        failed = []
+        for chall, _, error in results:
+            if error:
+                log.warning("Failed to rename channel of %s: %s", chall.name, error)
+                failed.append(chall.name)
+
         text = "CTF `{}` renamed to `{}` (#{})".format(old_name, new_name, new_name)
+        if failed:
+            text += "\nFailed to rename the channels of: {}".format(", ".join(failed))
         slack_wrapper.post_message(ctf.channel_id, text)
 
 
@@ -455,7 +482,7 @@ class AddChallengeCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -467,7 +494,7 @@ class AddChallengeCommand(Command):
         category = args[1] if len(args) > 1 else ""
 
         # Validate that the user is in a CTF channel
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
 
         if not ctf:
             raise InvalidCommand("Add challenge failed: You are not in a CTF channel.")
@@ -556,7 +583,7 @@ class RemoveChallengeCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -567,7 +594,7 @@ class RemoveChallengeCommand(Command):
         challenge_name = args[0].lower() if args else None
 
         # Validate that current channel is a CTF channel
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
 
         if not ctf:
             raise InvalidCommand(
@@ -757,7 +784,7 @@ class StatusCommand(Command):
     def build_status_message(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         channel_id,
         user_id,
@@ -766,8 +793,6 @@ class StatusCommand(Command):
         category="",
     ):
         """Gathers the ctf information and builds the status response."""
-        ctfs = storage_service.get_ctfs()
-
         # Check if the user is in a ctf channel
         current_ctf = storage_service.get_ctf(ctf_id=channel_id)
 
@@ -776,7 +801,11 @@ class StatusCommand(Command):
             check_for_finish = False
             verbose = True  # override verbose for ctf channels
         else:
-            ctf_list = ctfs
+            # Running CTFs are listed before finished ones
+            ctf_list = itertools.chain(
+                storage_service.iter_ctfs(finished=False),
+                storage_service.iter_ctfs(finished=True),
+            )
             check_for_finish = True
 
         if verbose:
@@ -792,7 +821,7 @@ class StatusCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -830,10 +859,10 @@ class WorkonCommand(Command):
     """
 
     @classmethod
-    def execute(
+    async def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service,
         args,
         timestamp,
         channel_id,
@@ -844,15 +873,16 @@ class WorkonCommand(Command):
         challenge_name = args[0].lower().strip("*") if args else None
 
         # Validate that current channel is a CTF channel
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf, challenge = await asyncio.gather(
+            storage_service.get_ctf_summary(ctf_id=channel_id),
+            storage_service.get_challenge(
+                challenge_name=challenge_name, ctf_id=channel_id
+            ),
+        )
 
         if not ctf:
             raise InvalidCommand("Workon failed: You are not in a CTF channel.")
 
-        challenge = storage_service.get_challenge(
-            challenge_name=challenge_name, ctf_id=channel_id
-        )
-
         if not challenge:
             raise InvalidCommand("This challenge does not exist.")
 
@@ -860,12 +890,14 @@ class WorkonCommand(Command):
         if challenge.is_solved and not ctf.finished and not user_is_admin:
             raise InvalidCommand("This challenge is already solved.")
 
-        # Invite user to challenge channel
-        slack_wrapper.invite_user(user_id, challenge.channel_id, is_private=True)
-
-        # Update database
-        challenge.add_player(Player(user_id=user_id))
-        storage_service.add_challenge(challenge, challenge.ctf_channel_id)
+        # Invite user to challenge channel and update database
+        await asyncio.gather(
+            slack_wrapper.invite_user(user_id, challenge.channel_id, is_private=True),
+            storage_service.update_challenge(
+                challenge.channel_id,
+                lambda challenge: challenge.add_player(Player(user_id=user_id)),
+            ),
+        )
 
 
 class SolveCommand(Command):
@@ -874,10 +906,10 @@ class SolveCommand(Command):
     """
 
     @classmethod
-    def execute(
+    async def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service,
         args,
         timestamp,
         channel_id,
@@ -886,34 +918,42 @@ class SolveCommand(Command):
     ):
         """Execute the Solve command."""
         if args:
-            challenge = storage_service.get_challenge(
+            challenge = await storage_service.get_challenge(
                 challenge_name=args[0].lower().strip("*"), ctf_id=channel_id
             )
 
             if not challenge:
-                challenge = storage_service.get_challenge(challenge_id=channel_id)
+                challenge = await storage_service.get_challenge(challenge_id=channel_id)
                 additional_args = args if args else []
             else:
                 additional_args = args[1:] if len(args) > 1 else []
         else:
             # No arguments => direct way of resolving challenge
-            challenge = storage_service.get_challenge(challenge_id=channel_id)
+            challenge = await storage_service.get_challenge(challenge_id=channel_id)
 
             additional_args = []
 
         if not challenge:
             raise InvalidCommand("This challenge does not exist.")
 
-        additional_solver = []
+        if challenge.is_solved:
+            raise InvalidCommand("This challenge is already solved.")
 
-        # Get solving member
-        member = slack_wrapper.get_member(user_id)
+        # Load the CTF, the solving member and additional members at once
+        ctf, member, *additional_members = await asyncio.gather(
+            storage_service.get_ctf_summary(ctf_id=challenge.ctf_channel_id),
+            slack_wrapper.get_member(user_id),
+            *(
+                resolve_user_by_user_id(slack_wrapper, add_solve)
+                for add_solve in additional_args
+            ),
+        )
+
+        additional_solver = []
         solver_list = [get_display_name(member)]
 
         # Find additional members to add
-        for add_solve in additional_args:
-            user_obj = resolve_user_by_user_id(slack_wrapper, add_solve)
-
+        for add_solve, user_obj in zip(additional_args, additional_members):
             if user_obj["ok"]:
                 add_solve = get_display_name(user_obj)
 
@@ -921,49 +961,58 @@ class SolveCommand(Command):
                 solver_list.append(add_solve)
                 additional_solver.append(add_solve)
 
-        # Update database
-        if not challenge.is_solved:
-            # Check for finished ctf
-            ctf = storage_service.get_ctf(ctf_id=challenge.ctf_channel_id)
-            if ctf.finished and not user_is_admin:
-                raise InvalidCommand(
-                    "Solve challenge faild: CTF *{}* is over...".format(ctf.name)
-                )
+        # Check for finished ctf
+        if ctf.finished and not user_is_admin:
+            raise InvalidCommand(
+                "Solve challenge faild: CTF *{}* is over...".format(ctf.name)
+            )
 
-            member = slack_wrapper.get_member(user_id)
-            solver_list = [get_display_name(member)] + additional_solver
+        solved = False
 
+        def mark_as_solved(challenge):
+            nonlocal solved
+            # Someone else might have solved it since it was read
+            if challenge.is_solved:
+                return False
             challenge.mark_as_solved(solver_list)
-            ctf.add_challenge(challenge)
-            storage_service.add_ctf(ctf)
+            solved = True
 
-            # Update channel purpose
-            purpose = dict(ChallengeHandler.CHALL_PURPOSE)
-            purpose["name"] = challenge.name
-            purpose["ctf_id"] = ctf.channel_id
-            purpose["solved"] = str(solver_list)
-            purpose["solve_date"] = str(challenge.solve_date)
-            purpose["category"] = challenge.category
+        challenge = await storage_service.update_challenge(
+            challenge.channel_id, mark_as_solved
+        )
 
-            slack_wrapper.set_purpose(
-                challenge.channel_id, json.dumps(purpose), is_private=True
-            )
+        if not challenge:
+            raise InvalidCommand("This challenge does not exist.")
+        if not solved:
+            raise InvalidCommand("This challenge is already solved.")
 
-            # Announce the CTF channel
-            help_members = ""
+        # Update channel purpose
+        purpose = dict(ChallengeHandler.CHALL_PURPOSE)
+        purpose["name"] = challenge.name
+        purpose["ctf_id"] = ctf.channel_id
+        purpose["solved"] = str(solver_list)
+        purpose["solve_date"] = str(challenge.solve_date)
+        purpose["category"] = challenge.category
+
+        await slack_wrapper.set_purpose(
+            challenge.channel_id, json.dumps(purpose), is_private=True
+        )
 
-            if additional_solver:
-                help_members = "(together with {})".format(", ".join(additional_solver))
+        # Announce the CTF channel
+        help_members = ""
 
-            message = '@here *{}* : {} has solved the "{}" challenge {}'.format(
-                challenge.name,
-                get_display_name(member),
-                challenge.name,
-                help_members,
-            )
-            message += "."
+        if additional_solver:
+            help_members = "(together with {})".format(", ".join(additional_solver))
 
-            slack_wrapper.post_message(ctf.channel_id, message)
+        message = '@here *{}* : {} has solved the "{}" challenge {}'.format(
+            challenge.name,
+            get_display_name(member),
+            challenge.name,
+            help_members,
+        )
+        message += "."
+
+        await slack_wrapper.post_message(ctf.channel_id, message)
 
 
 class UnsolveCommand(Command):
@@ -975,7 +1024,7 @@ class UnsolveCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -1000,11 +1049,13 @@ class UnsolveCommand(Command):
         if challenge.is_solved:
             member = slack_wrapper.get_member(user_id)
 
-            challenge.unmark_as_solved()
+            challenge = storage_service.update_challenge(
+                challenge.channel_id,
+                lambda challenge: challenge.unmark_as_solved(),
+            )
 
-            ctf = storage_service.get_ctf(ctf_id=challenge.ctf_channel_id)
-            ctf.add_challenge(challenge)
-            storage_service.add_ctf(ctf)
+            if not challenge:
+                raise InvalidCommand("This challenge does not exist.")
 
             # Update channel purpose
             purpose = dict(ChallengeHandler.CHALL_PURPOSE)
@@ -1022,7 +1073,7 @@ class UnsolveCommand(Command):
                     challenge.name, get_display_name(member), challenge.name
                 )
             )
-            slack_wrapper.post_message(ctf.channel_id, message)
+            slack_wrapper.post_message(challenge.ctf_channel_id, message)
 
             return
 
@@ -1036,7 +1087,7 @@ class ArchiveCTFCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -1046,21 +1097,29 @@ class ArchiveCTFCommand(Command):
         """Execute the ArchiveCTF command."""
         no_post = args[0].lower() if args else None
 
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
         if not ctf or ctf.channel_id != channel_id:
             raise InvalidCommand("Archive CTF failed: You are not in a CTF channel.")
 
         # Get list of challenges
         challenges = storage_service.get_challenges(channel_id)
 
+        # Archive the challenge channels concurrently, paced by the rate limiter
+        results = slack_wrapper.run_concurrently(
+            lambda challenge: slack_wrapper.archive_channel(challenge.channel_id),
+            challenges,
+        )
+
         message = "Archived the following channels :\n"
-        for challenge in challenges:
-            message += "- #{}-{}\n".format(ctf.name, challenge.name)
-            try:
-                slack_wrapper.archive_channel(challenge.channel_id)
-            except SlackApiError as e:
-                log.warning(f"Error archiving channel {challenge.channel_id}: {e}")
-            storage_service.remove_challenge(challenge.channel_id, ctf.channel_id)
+        failed = ""
+        for challenge, _, error in results:
+            if error:
+                log.warning(f"Error archiving channel {challenge.channel_id}: {error}")
+                failed += "- #{}-{}\n".format(ctf.name, challenge.name)
+            else:
+                message += "- #{}-{}\n".format(ctf.name, challenge.name)
+        if failed:
+            message += "Failed to archive the following channels :\n" + failed
 
         # Remove possible configured reminders for this ctf
         try:
@@ -1068,9 +1127,12 @@ class ArchiveCTFCommand(Command):
         except SlackApiError as e:
             log.error(f"Error cleaning up reminders: {e}")
 
-        # Stop tracking the main CTF channel
+        # Stop tracking the main CTF channel and its challenges
         slack_wrapper.set_purpose(channel_id, "")
-        storage_service.remove_ctf(ctf.channel_id)
+        storage_service.bulk_delete(
+            ctf_ids=[ctf.channel_id],
+            challenge_ids=[challenge.channel_id for challenge in challenges],
+        )
 
         # Show confirmation message
         slack_wrapper.post_message(channel_id, message)
@@ -1117,7 +1179,7 @@ class EndCTFCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -1126,7 +1188,7 @@ class EndCTFCommand(Command):
     ):
         """Execute the EndCTF command."""
 
-        ctf = storage_service.get_ctf(ctf_id=channel_id)
+        ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
         if not ctf:
             raise InvalidCommand("End CTF failed: You are not in a CTF channel.")
 
@@ -1158,7 +1220,7 @@ class ReloadCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -1167,9 +1229,16 @@ class ReloadCommand(Command):
     ):
         """Execute the Reload command."""
 
+        full = bool(args) and args[0].lower() == "full"
+
         slack_wrapper.post_message(channel_id, "Updating CTFs and challenges...")
-        ChallengeHandler.update_database_from_slack(slack_wrapper, storage_service)
-        slack_wrapper.post_message(channel_id, "Update finished...")
+        updated, timings = ChallengeHandler.update_database_from_slack(
+            slack_wrapper, storage_service, full=full
+        )
+        stages = ", ".join(f"{name} {seconds}s" for name, seconds in timings.items())
+        slack_wrapper.post_message(
+            channel_id, "Update finished, {} CTF(s) updated ({})...".format(updated, stages)
+        )
 
 
 class AddCredsCommand(Command):
@@ -1179,7 +1248,7 @@ class AddCredsCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -1188,7 +1257,7 @@ class AddCredsCommand(Command):
     ):
         """Execute the AddCreds command."""
 
-        cur_ctf = storage_service.get_ctf(ctf_id=channel_id)
+        cur_ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
         if not cur_ctf:
             raise InvalidCommand("Add Creds failed:. You are not in a CTF channel.")
 
@@ -1218,7 +1287,7 @@ class ShowCredsCommand(Command):
     def execute(
         cls,
         slack_wrapper,
-        storage_service: StorageService,
+        storage_service: StorageBackend,
         args,
         timestamp,
         channel_id,
@@ -1227,7 +1296,7 @@ class ShowCredsCommand(Command):
     ):
         """Execute the ShowCreds command."""
 
-        cur_ctf = storage_service.get_ctf(ctf_id=channel_id)
+        cur_ctf = storage_service.get_ctf_summary(ctf_id=channel_id)
         if not cur_ctf:
             raise InvalidCommand("Show creds failed: You are not in a CTF channel.")
 
@@ -1262,6 +1331,11 @@ class ChallengeHandler(BaseHandler):
     """
 
     DB = "databases/challenge_handler.bin"
+
+    # Fingerprints of the channels seen by the last reload, reloads running at
+    # the same time on command workers take turns comparing and replacing them
+    channel_fingerprints = {}
+    reload_lock = threading.Lock()
     CTF_PURPOSE = {
         "ctf_bot": "CTFBOT",
         "name": "",
@@ -1328,7 +1402,8 @@ class ChallengeHandler(BaseHandler):
             ),
             "reload": CommandDesc(
                 command=ReloadCommand,
-                description="Reload ctf information from slack",
+                description="Reload changed ctf information from slack, everything with full",
+                opt_arguments=["full"],
                 is_admin_cmd=True,
             ),
             "archivectf": CommandDesc(
@@ -1407,79 +1482,205 @@ class ChallengeHandler(BaseHandler):
         slack_wrapper.set_purpose(ctf.channel_id, json.dumps(purpose))
 
     @staticmethod
-    def update_database_from_slack(slack_wrapper, storage_service):
+    def parse_ctf_channel(channel):
+        """Return the CTF tracked by a channel, or None if it isn't a CTF channel."""
+        try:
+            purpose = load_json(channel["purpose"]["value"])
+
+            if (
+                not channel["is_archived"]
+                and purpose
+                and "ctf_bot" in purpose
+                and purpose["type"] == "CTF"
+            ):
+                ctf = CTF(
+                    channel_id=channel["id"],
+                    name=purpose["name"],
+                    long_name=purpose["long_name"],
+                )
+
+                ctf.cred_user = purpose.get("cred_user", "")
+                ctf.cred_pw = purpose.get("cred_pw", "")
+                ctf.finished = purpose.get("finished", False)
+                ctf.finished_on = purpose.get("finished_on", 0)
+                return ctf
+        except:
+            pass
+        return None
+
+    @staticmethod
+    def parse_challenge_channel(channel):
+        """
+        Return the challenge tracked by a channel without its players, or None
+        if it isn't a challenge channel.
+        """
+        try:
+            purpose = load_json(channel["purpose"]["value"])
+
+            if (
+                not channel["is_archived"]
+                and purpose
+                and "ctf_bot" in purpose
+                and purpose["type"] == "CHALLENGE"
+            ):
+                challenge = Challenge(
+                    ctf_channel_id=purpose["ctf_id"],
+                    channel_id=channel["id"],
+                    name=purpose["name"],
+                    category=purpose.get("category")
+                    if purpose.get("category") is not None
+                    else "",
+                )
+                solvers = purpose["solved"]
+
+                # Mark solved challenges
+                if solvers:
+                    challenge.mark_as_solved(solvers, purpose.get("solve_date"))
+                return challenge
+        except Exception as e:
+            log.warning(e)
+        return None
+
+    @staticmethod
+    def channel_fingerprint(channel):
+        """
+        Return what reload compares to detect a changed channel: its purpose,
+        member count and archive state.
+        """
+        return (
+            channel["purpose"]["value"],
+            channel.get("num_members"),
+            channel["is_archived"],
+        )
+
+    @staticmethod
+    def update_database_from_slack(slack_wrapper, storage_service, full=True):
         """
         Reload the ctf and challenge information from slack.
+        Unless full is set, only CTFs with channels that changed since the last
+        reload are stored again, and only members of changed channels are fetched.
+        Return the number of stored CTFs and the seconds spent in each stage.
         """
-        database = {}
+        with ChallengeHandler.reload_lock:
+            return ChallengeHandler._update_database_from_slack(
+                slack_wrapper, storage_service, full
+            )
+
+    @staticmethod
+    def _update_database_from_slack(slack_wrapper, storage_service, full):
+        timings = {}
+        started = time.monotonic()
+
+        def stage(name):
+            nonlocal started
+            now = time.monotonic()
+            timings[name] = round(now - started, 3)
+            started = now
+
+        # Stage 1: List channels
         privchans = slack_wrapper.get_private_channels()
         pubchans = slack_wrapper.get_public_channels()
+        stage("list")
 
-        # Find active CTF channels
-        for channel in [*privchans, *pubchans]:
-            try:
-                purpose = load_json(channel["purpose"]["value"])
-
-                if (
-                    not channel["is_archived"]
-                    and purpose
-                    and "ctf_bot" in purpose
-                    and purpose["type"] == "CTF"
-                ):
-                    ctf = CTF(
-                        channel_id=channel["id"],
-                        name=purpose["name"],
-                        long_name=purpose["long_name"],
-                    )
+        # Stage 2: Parse purposes
+        database = {}
 
-                    ctf.cred_user = purpose.get("cred_user", "")
-                    ctf.cred_pw = purpose.get("cred_pw", "")
-                    ctf.finished = purpose.get("finished", False)
-                    ctf.finished_on = purpose.get("finished_on", 0)
+        # Fingerprints of all tracked channels, along with the id of their CTF
+        fingerprints = {}
 
-                    database[ctf.channel_id] = ctf
-            except:
-                pass
+        # Find active CTF channels
+        for channel in [*privchans, *pubchans]:
+            ctf = ChallengeHandler.parse_ctf_channel(channel)
+            if ctf:
+                database[ctf.channel_id] = ctf
+                fingerprints[channel["id"]] = (
+                    ctf.channel_id,
+                    ChallengeHandler.channel_fingerprint(channel),
+                )
 
         # Find active challenge channels
+        challenges = []
         for channel in privchans:
-            try:
-                purpose = load_json(channel["purpose"]["value"])
-
-                if (
-                    not channel["is_archived"]
-                    and purpose
-                    and "ctf_bot" in purpose
-                    and purpose["type"] == "CHALLENGE"
-                ):
-                    challenge = Challenge(
-                        ctf_channel_id=purpose["ctf_id"],
-                        channel_id=channel["id"],
-                        name=purpose["name"],
-                        category=purpose.get("category")
-                        if purpose.get("category") is not None
-                        else "",
-                    )
-                    ctf_channel_id = purpose["ctf_id"]
-                    solvers = purpose["solved"]
-                    ctf = database.get(ctf_channel_id)
-
-                    # Mark solved challenges
-                    if solvers:
-                        challenge.mark_as_solved(solvers, purpose.get("solve_date"))
-
-                    if ctf:
-                        members = slack_wrapper.get_channel_members(channel["id"])
-                        for member_id in members:
-                            challenge.add_player(Player(user_id=member_id))
-
-                        ctf.add_challenge(challenge)
-            except Exception as e:
-                log.warning(e)
-
-        # Create the database accordingly
-        for _ctf in database.values():
-            storage_service.add_ctf(_ctf)
+            challenge = ChallengeHandler.parse_challenge_channel(channel)
+            if challenge and challenge.ctf_channel_id in database:
+                challenges.append(challenge)
+                fingerprints[channel["id"]] = (
+                    challenge.ctf_channel_id,
+                    ChallengeHandler.channel_fingerprint(channel),
+                )
+
+        # Find CTFs with added, changed or removed channels
+        previous = ChallengeHandler.channel_fingerprints
+        if full:
+            changed_channels = set(fingerprints)
+            changed_ctfs = set(database)
+        else:
+            changed_channels = {
+                channel_id
+                for channel_id, fingerprint in fingerprints.items()
+                if previous.get(channel_id) != fingerprint
+            }
+            changed_ctfs = {fingerprints[channel_id][0] for channel_id in changed_channels}
+            changed_ctfs |= {
+                ctf_id
+                for channel_id, (ctf_id, _) in previous.items()
+                if channel_id not in fingerprints and ctf_id in database
+            }
+
+        challenges = [
+            challenge
+            for challenge in challenges
+            if challenge.ctf_channel_id in changed_ctfs
+        ]
+
+        # Players of unchanged challenges of changed CTFs are kept from storage,
+        # CTFs without unchanged challenge channels don't need to be read
+        stored_challenges = {}
+        for ctf_id in {
+            challenge.ctf_channel_id
+            for challenge in challenges
+            if challenge.channel_id not in changed_channels
+        }:
+            for challenge in storage_service.get_challenges(ctf_id):
+                stored_challenges[challenge.channel_id] = challenge
+        fetch = []
+        for challenge in challenges:
+            stored = stored_challenges.get(challenge.channel_id)
+            if challenge.channel_id not in changed_channels and stored:
+                challenge.players = stored.players
+            else:
+                fetch.append(challenge)
+        stage("parse")
+
+        # Stage 3: Fetch members of the remaining challenge channels concurrently
+        results = slack_wrapper.run_concurrently(
+            lambda challenge: slack_wrapper.get_channel_members(challenge.channel_id),
+            fetch,
+        )
+        for challenge, members, error in results:
+            if error:
+                # Retried on the next reload, as the channel isn't fingerprinted
+                log.warning(error)
+                del fingerprints[challenge.channel_id]
+                continue
+
+            for member_id in members:
+                challenge.add_player(Player(user_id=member_id))
+        stage("members")
+
+        # Stage 4: Create the database accordingly
+        for challenge in challenges:
+            if challenge.channel_id in fingerprints:
+                database[challenge.ctf_channel_id].add_challenge(challenge)
+
+        storage_service.bulk_upsert_ctfs(
+            [database[ctf_id] for ctf_id in changed_ctfs]
+        )
+        ChallengeHandler.channel_fingerprints = fingerprints
+        stage("store")
+
+        log.debug(f"Reloaded {len(changed_ctfs)} CTF(s) in {timings}")
+        return len(changed_ctfs), timings
 
 
 # Register this handler
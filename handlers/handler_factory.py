@@ -5,7 +5,9 @@ can handle and the corresponding command class
 The handler factory will then check if the handler can process a command,
 resolve it and execute it
 """
+import inspect
 import shlex
+from typing import Any, NamedTuple
 
 from unidecode import unidecode
 
@@ -15,6 +17,20 @@ from util.loghandler import log
 handlers = {}
 botserver = None
 
+# Maximum number of Block Kit blocks in a message
+MAX_BLOCKS = 50
+
+
+class DispatchEntry(NamedTuple):
+    handler: Any
+    command: str
+    descriptor: Any
+
+
+# (handler name, command or alias, admin flag) -> DispatchEntry, commands given
+# without a handler name are keyed by None as handler name
+dispatch_table = {}
+
 
 def register(handler_name, handler):
     log.info(
@@ -23,6 +39,8 @@ def register(handler_name, handler):
 
     handlers[handler_name] = handler
     handler.handler_name = handler_name
+    # Commands and usage of a handler registered late are available right away
+    build_dispatch_table()
 
 
 def initialize(slack_wrapper, _botserver, storage_service):
@@ -35,6 +53,72 @@ def initialize(slack_wrapper, _botserver, storage_service):
     botserver = _botserver
     for handler in handlers:
         handlers[handler].init(slack_wrapper, storage_service)
+    build_dispatch_table()
+
+
+def build_dispatch_table():
+    """
+    Resolve the commands and aliases of all handlers for admins and non-admins
+    into the dispatch table and drop their rendered usage. Must be called again
+    after commands changed. Commands offered by more than one handler are
+    reported and can only be used with a handler name.
+    """
+    table = {}
+    for handler_name, handler in handlers.items():
+        handler.clear_usage()
+        names = {name: name for name in handler.commands}
+        names.update(
+            (alias, command)
+            for alias, command in handler.aliases.items()
+            if command in handler.commands
+        )
+        for name, command in names.items():
+            descriptor = handler.commands[command]
+            entry = DispatchEntry(handler, command, descriptor)
+            for user_is_admin in (False, True):
+                if user_is_admin or not descriptor.is_admin_cmd:
+                    table[(handler_name, name, user_is_admin)] = entry
+
+    # Commands without handler name, None marks ambiguous ones
+    for (handler_name, name, user_is_admin), entry in list(table.items()):
+        key = (None, name, user_is_admin)
+        if key not in table:
+            table[key] = entry
+        elif table[key] is not None and table[key].handler is not entry.handler:
+            log.warning(
+                "Command %s is offered by %s and %s, it needs a handler name",
+                name,
+                table[key].handler,
+                entry.handler,
+            )
+            table[key] = None
+
+    global dispatch_table
+    dispatch_table = table
+
+
+def command_name(command, message):
+    """
+    Return the name of the command in a message, as reported by `/bot stats`:
+    "<handler> <command>" for known commands and aliases, "<handler> help" and
+    "help" for usage requests and "unknown" for anything else.
+    """
+    words = [command or "", *(message or "").split()[:1]]
+    handler_name = words[0].lower()
+
+    if handler_name in handlers:
+        if len(words) < 2 or words[1] == "help":
+            return f"{handler_name} help"
+        key = (handler_name, words[1].lower())
+    elif handler_name == "help":
+        return "help"
+    else:
+        key = (None, handler_name)
+
+    entry = dispatch_table.get((*key, True)) or dispatch_table.get((*key, False))
+    if entry:
+        return f"{entry.handler.handler_name} {entry.command}"
+    return "unknown"
 
 
 def process(slack_wrapper, storage_service, command, message, timestamp, channel_id, user_id):
@@ -55,7 +139,7 @@ def process(slack_wrapper, storage_service, command, message, timestamp, channel
         slack_wrapper.post_message(channel_id, message, timestamp)
         return
 
-    process_command(
+    return process_command(
         slack_wrapper, storage_service, command, message, args, timestamp, channel_id, user_id
     )
 
@@ -71,11 +155,17 @@ def process_command(
     user_id,
     admin_override=False,
 ):
+    """
+    Run a command. Async commands aren't awaited, their coroutine is returned
+    to be awaited on the bot's event loop (see await_command).
+    """
 
     try:
         handler_name = args[0].lower()
         processed = False
+        result = None
         usage_msg = ""
+        usage_blocks = []
 
         admin_users = botserver.get_config_option("admin_users")
         user_is_admin = admin_users and user_id in admin_users
@@ -93,16 +183,19 @@ def process_command(
             if len(args) < 2 or args[1] == "help":
                 log.debug(f"Sending usage info")
                 usage_msg += handler.get_usage(user_is_admin)
+                usage_blocks += handler.get_usage_blocks(user_is_admin)
                 processed = True
 
             else:  # Send command to specified handler
-                command = args[1].lower()
-                if handler.can_handle(command, user_is_admin):
+                entry = dispatch_table.get(
+                    (handler_name, args[1].lower(), bool(user_is_admin))
+                )
+                if entry:
                     log.debug(f"Handler {handler} can handle {args}")
-                    handler.process(
+                    result = entry.handler.process(
                         slack_wrapper,
                         storage_service,
-                        command,
+                        entry.command,
                         args[2:],
                         timestamp,
                         channel_id,
@@ -113,29 +206,34 @@ def process_command(
                 else:
                     log.debug(f"Handler {handler} can not handle {args}")
 
-
-        else:  # Pass the command to every available handler
+        else:  # Look up the command among all available handlers
             command = args[0].lower()
 
-            for handler_name, handler in handlers.items():
-                if command == "help":  # Setup usage message
+            if command == "help":  # Setup usage message
+                for handler in handlers.values():
                     usage_msg += "{}\n".format(handler.get_usage(user_is_admin))
-                    processed = True
+                    usage_blocks += handler.get_usage_blocks(user_is_admin)
+                processed = True
 
-                elif handler.can_handle(
-                    command, user_is_admin
-                ):  # Send command to handler
-                    handler.process(
-                        slack_wrapper,
-                        storage_service,
-                        command,
-                        args[1:],
-                        timestamp,
-                        channel_id,
-                        user_id,
-                        user_is_admin,
+            elif (None, command, bool(user_is_admin)) in dispatch_table:
+                entry = dispatch_table[(None, command, bool(user_is_admin))]
+                if entry is None:
+                    raise InvalidCommand(
+                        "Command `{}` is ambiguous, prefix it with a handler name.".format(
+                            command
+                        )
                     )
-                    processed = True
+                result = entry.handler.process(
+                    slack_wrapper,
+                    storage_service,
+                    entry.command,
+                    args[1:],
+                    timestamp,
+                    channel_id,
+                    user_id,
+                    user_is_admin,
+                )
+                processed = True
 
         if not processed:  # Send error message
             message = "Unknown handler or command : `{}`".format(message)
@@ -144,10 +242,26 @@ def process_command(
         if usage_msg:  # Send usage message
             send_help_as_dm = botserver.get_config_option("send_help_as_dm") == "1"
             target_id = user_id if send_help_as_dm else channel_id
-            slack_wrapper.post_message(target_id, usage_msg)
+            # The text is shown in notifications and if the blocks don't fit
+            if len(usage_blocks) > MAX_BLOCKS:
+                usage_blocks = None
+            slack_wrapper.post_message(target_id, usage_msg, blocks=usage_blocks)
+
+        if inspect.isawaitable(result):
+            return await_command(result, channel_id, timestamp)
 
     except InvalidCommand as e:
         slack_wrapper.post_message(channel_id, str(e), timestamp)
 
     except Exception:
         log.exception("An error has occured while processing a command")
+
+
+async def await_command(command, channel_id, timestamp):
+    """Await an async command, reporting its errors like process_command."""
+    try:
+        await command
+    except InvalidCommand as e:
+        await botserver.async_slack_wrapper.post_message(channel_id, str(e), timestamp)
+    except Exception:
+        log.exception("An error has occured while processing a command")
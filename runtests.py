@@ -1,10 +1,38 @@
 #!/usr/bin/env python3
-from unittest import TestCase
-from tests.slackwrapper_mock import SlackWrapperMock
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from unittest import IsolatedAsyncioTestCase, TestCase
+from tests.slackwrapper_mock import AsyncSlackWrapperMock, SlackWrapperMock
 import unittest
 from util.loghandler import log, logging
 from botserver import BotServer
 from bottypes.invalid_command import InvalidCommand
+from bottypes.challenge import Challenge
+from bottypes.command import Command
+from bottypes.command_descriptor import CommandDesc
+from bottypes.ctf import CTF
+from handlers import handler_factory
+from handlers.base_handler import BaseHandler
+from handlers.challenge_handler import ChallengeHandler
+from unittest.mock import AsyncMock, MagicMock, patch
+from slack_sdk.errors import SlackApiError
+from util.command_executor import AsyncCommandExecutor, CommandExecutor
+from util.memory_storage import MemoryStorageService
+from util.async_slack_wrapper import AsyncSlackWrapper
+from util.rate_limiter import RateLimitedClient, RateLimiter, TokenBucket
+from util.slack_wrapper import SlackWrapper
+from util.sqlite_storage import SQLiteStorageService
+from util.storage_service import StorageService
+from tests.opensearch_mock import AsyncOpenSearchMock, OpenSearchMock
+from opensearchpy.exceptions import ConflictError
+
+# Run the bot on the hermetic in-memory storage, unless told otherwise
+os.environ.setdefault("STORAGE_BACKEND", "memory")
 
 
 class BotBaseTest(TestCase):
@@ -19,6 +47,9 @@ class BotBaseTest(TestCase):
         }
 
         self.botserver.slack_wrapper = SlackWrapperMock()
+        self.botserver._async_slack_wrapper = AsyncSlackWrapperMock(
+            self.botserver.slack_wrapper
+        )
         self.botserver.init_bot_data()
 
         # replace set_config_option to avoid overwriting original bot configuration.
@@ -35,6 +66,19 @@ class BotBaseTest(TestCase):
     def create_slack_wrapper_mock(self):
         return SlackWrapperMock()
 
+    def add_ctf(self, ctf_id, name, challenges=0):
+        """Store a CTF with the given number of challenges in CHALL<i> channels."""
+        ctf = CTF(
+            channel_id=ctf_id,
+            name=name,
+            challenges=[
+                Challenge(channel_id=f"CHALL{i}", ctf_channel_id=ctf_id, name=f"c{i}")
+                for i in range(challenges)
+            ],
+        )
+        self.botserver.storage_service.add_ctf(ctf)
+        return ctf
+
     def exec_command(
         self, command, msg, exec_user="normal_user", channel="UNITTESTCHANNELID"
     ):
@@ -135,6 +179,160 @@ class TestBotHandler(BotBaseTest):
             self.check_for_response("Pong!"), msg="Ping command didn't reply with pong."
         )
 
+    def test_dispatch_ping(self):
+        self.botserver.dispatch_message(
+            {"command": "/bot", "text": "ping", "user_id": "normal_user", "channel_id": "C1"}
+        )
+        self.assertTrue(self.botserver.executor.join(5))
+
+        self.assertTrue(
+            self.check_for_response("Pong!"), msg="Dispatched ping didn't reply with pong."
+        )
+        self.assertIn("bot ping", self.botserver.executor.stats())
+
+    def test_dispatch_per_ctf(self):
+        self.add_ctf("ORDERCTF", "orderctf", challenges=1)
+        calls = []
+
+        def handle_message(body):
+            calls.append(("start", body["channel_id"]))
+            time.sleep(0.05)
+            calls.append(("end", body["channel_id"]))
+
+        self.botserver.handle_message = handle_message
+        for channel in ("ORDERCTF", "CHALL0"):
+            self.botserver.dispatch_message(
+                {"command": "/bot", "text": "ping", "user_id": "normal_user", "channel_id": channel}
+            )
+        self.assertTrue(self.botserver.executor.join(5))
+
+        # Commands of the CTF channel and its challenge channels take turns
+        self.assertEqual(
+            calls,
+            [
+                ("start", "ORDERCTF"),
+                ("end", "ORDERCTF"),
+                ("start", "CHALL0"),
+                ("end", "CHALL0"),
+            ],
+        )
+        self.assertEqual(self.botserver.channel_ctfs.peek("CHALL0"), "ORDERCTF")
+
+    def test_dispatch_async_command(self):
+        self.add_ctf("SOLVECTF", "solvectf", challenges=1)
+        # Run commands on the (background) loop, like the async server does
+        self.botserver.run_coroutine(asyncio.sleep(0))
+        self.botserver.run_on_loop(self.botserver.loop)
+
+        self.botserver.dispatch_message(
+            {"command": "/ctf", "text": "solve", "user_id": "normal_user", "channel_id": "CHALL0"}
+        )
+        self.assertTrue(self.botserver.executor.join(5))
+
+        self.assertTrue(self.check_for_response('has solved the "c0" challenge'))
+        self.assertIn("ctf solve", self.botserver.executor.stats())
+
+    def test_command_name(self):
+        names = [
+            handler_factory.command_name(command, message)
+            for command, message in [
+                ("bot", "ping"),
+                ("ctf", "ADD web1 web"),
+                ("ctf", ""),
+                ("ctf", "no-such-command"),
+                ("ctf", "x" * 100),
+            ]
+        ]
+        self.assertEqual(
+            names, ["bot ping", "ctf addchallenge", "ctf help", "unknown", "unknown"]
+        )
+
+    def test_async_command(self):
+        class AsyncPingCommand(Command):
+            @classmethod
+            async def execute(
+                cls, slack_wrapper, storage_service, args, timestamp, channel_id, user_id, user_is_admin
+            ):
+                ctf = await storage_service.get_ctf_summary(ctf_id=channel_id)
+                await slack_wrapper.post_message(channel_id, f"Pong {ctf}")
+
+        commands = handler_factory.handlers["bot"].commands
+        commands["asyncping"] = CommandDesc(command=AsyncPingCommand, description="")
+        self.addCleanup(handler_factory.build_dispatch_table)
+        self.addCleanup(commands.pop, "asyncping")
+        handler_factory.build_dispatch_table()
+        self.botserver._async_slack_wrapper = AsyncMock()
+
+        self.exec_command("/bot", "asyncping")
+
+        self.botserver._async_slack_wrapper.post_message.assert_awaited_once_with(
+            "UNITTESTCHANNELID", "Pong None"
+        )
+
+    def test_dispatch_table(self):
+        table = handler_factory.dispatch_table
+        ctf_handler = handler_factory.handlers["ctf"]
+
+        self.assertEqual(table[("ctf", "add", False)].command, "addchallenge")
+        self.assertIs(table[(None, "add", False)].handler, ctf_handler)
+        self.assertIn(("ctf", "reload", True), table)
+        self.assertNotIn(("ctf", "reload", False), table)
+
+    def test_dispatch_ambiguous_command(self):
+        class DummyHandler(BaseHandler):
+            commands = {"ping": CommandDesc(command=Command, description="")}
+
+        handler_factory.handlers["dummy"] = DummyHandler()
+        self.addCleanup(handler_factory.build_dispatch_table)
+        self.addCleanup(handler_factory.handlers.pop, "dummy")
+        handler_factory.build_dispatch_table()
+
+        self.exec_command("ping", "")
+
+        self.assertTrue(self.check_for_response("Command `ping` is ambiguous"))
+        self.assertFalse(self.check_for_response("Pong!"))
+
+    def test_usage_cached(self):
+        handler = handler_factory.handlers["ctf"]
+
+        usage = handler.get_usage(False)
+        self.assertIs(handler.get_usage(False), usage)
+        self.assertIn("/ctf addchallenge", usage)
+        self.assertIn("(Alias: addchall, add)", usage)
+        self.assertNotIn("/ctf reload", usage)
+        self.assertIn("/ctf reload", handler.get_usage(True))
+
+        blocks = handler.get_usage_blocks(True)
+        self.assertEqual(blocks[0]["text"]["text"], "/ctf")
+        self.assertEqual(
+            "".join(block["text"]["text"] for block in blocks[1:]),
+            handler.get_usage(True),
+        )
+        self.assertTrue(all(len(block["text"]["text"]) <= 3000 for block in blocks))
+
+    def test_usage_after_register(self):
+        class PongCommand(Command):
+            @classmethod
+            def execute(
+                cls, slack_wrapper, storage_service, args, timestamp, channel_id, user_id, user_is_admin
+            ):
+                slack_wrapper.post_message(channel_id, "Ping!")
+
+        class DummyHandler(BaseHandler):
+            commands = {"pong": CommandDesc(command=PongCommand, description="")}
+
+        self.exec_command("/help", "")
+        self.assertFalse(self.check_for_response("/dummy pong"))
+
+        self.addCleanup(handler_factory.build_dispatch_table)
+        self.addCleanup(handler_factory.handlers.pop, "dummy")
+        handler_factory.register("dummy", DummyHandler())
+
+        self.exec_command("/help", "")
+        self.assertTrue(self.check_for_response("/dummy pong"))
+        self.exec_command("/pong", "")
+        self.assertTrue(self.check_for_response("Ping!"))
+
     def test_intro(self):
         self.exec_command("/bot", "intro")
 
@@ -159,6 +357,18 @@ class TestBotHandler(BotBaseTest):
             msg="Version didn't execute properly.",
         )
 
+    def test_stats(self):
+        self.exec_command("/bot", "stats", "admin_user")
+
+        self.assertTrue(
+            self.check_for_response_available(),
+            msg="Bot didn't react on unit test. Check for possible exceptions.",
+        )
+        self.assertTrue(
+            self.check_for_response("CTF cache"),
+            msg="Stats command didn't show the cache statistics.",
+        )
+
 
 class TestAdminHandler(BotBaseTest):
     def test_show_admins(self):
@@ -335,6 +545,23 @@ class TestChallengeHandler(BotBaseTest):
             msg="Status command didn't execute properly.",
         )
 
+    def test_status_running_first(self):
+        storage_service = self.botserver.storage_service
+        storage_service.add_ctf(CTF(channel_id="OLDCTF", name="oldctf", finished=True))
+        self.add_ctf("NEWCTF", "newctf")
+
+        with patch.object(
+            storage_service, "iter_ctfs", wraps=storage_service.iter_ctfs
+        ) as iter_ctfs:
+            self.exec_command("/ctf", "status -v")
+
+        self.assertEqual(
+            [call.kwargs for call in iter_ctfs.call_args_list],
+            [{"finished": False}, {"finished": True}],
+        )
+        response = self.botserver.slack_wrapper.message_list[-1].message
+        self.assertLess(response.index("#newctf"), response.index("#oldctf"))
+
     def test_solve(self):
         self.exec_command("/ctf", "solve testchall")
 
@@ -359,6 +586,33 @@ class TestChallengeHandler(BotBaseTest):
             msg="Solve with supporter didn't execute properly.",
         )
 
+    def test_solve_announced(self):
+        self.add_ctf("SOLVECTF", "solvectf", challenges=1)
+
+        self.exec_command("/ctf", "solve", channel="CHALL0")
+
+        self.assertTrue(
+            self.check_for_response('UNITTEST_USER_NAME1 has solved the "c0" challenge')
+        )
+        challenge = self.botserver.storage_service.get_challenge(challenge_id="CHALL0")
+        self.assertEqual(challenge.solver, ["UNITTEST_USER_NAME1"])
+
+    def test_solve_already_solved(self):
+        storage_service = self.botserver.storage_service
+        challenge = self.add_ctf("SOLVECTF", "solvectf", challenges=1).challenges[0]
+        storage_service.update_challenge(
+            "CHALL0", lambda challenge: challenge.mark_as_solved(["first"])
+        )
+
+        # The challenge was read before the other solve was stored
+        with patch.object(storage_service, "get_challenge", return_value=challenge):
+            self.exec_command("/ctf", "solve", channel="CHALL0")
+
+        self.assertTrue(self.check_for_response("This challenge is already solved."))
+        self.assertEqual(
+            storage_service.get_challenge(challenge_id="CHALL0").solver, ["first"]
+        )
+
     def test_rename_challenge_name(self):
         self.exec_command("/ctf", "renamechallenge testchall test1")
 
@@ -383,6 +637,39 @@ class TestChallengeHandler(BotBaseTest):
             msg="RenameCTF didn't execute properly.",
         )
 
+    def test_renamectf_challenges(self):
+        storage_service = self.botserver.storage_service
+        self.add_ctf("RENAMECTF", "renamectf", challenges=12)
+        slack_wrapper = self.botserver.slack_wrapper
+        slack_wrapper.rename_channel = MagicMock(return_value={"ok": True})
+        slack_wrapper.set_purpose = MagicMock()
+
+        self.exec_command("/ctf", "renamectf renamectf renamed")
+
+        self.assertTrue(self.check_for_response("renamed to `renamed`"))
+        self.assertTrue(self.check_for_response("Renamed 10/12 challenge channels"))
+        self.assertEqual(slack_wrapper.rename_channel.call_count, 13)
+        slack_wrapper.rename_channel.assert_any_call(
+            "CHALL11", "renamed-c11", is_private=True
+        )
+        slack_wrapper.set_purpose.assert_called_once()
+        self.assertEqual(storage_service.get_ctf(ctf_name="renamed").channel_id, "RENAMECTF")
+
+    def test_archivectf(self):
+        storage_service = self.botserver.storage_service
+        self.add_ctf("ARCHIVECTF", "archivectf", challenges=3)
+        slack_wrapper = self.botserver.slack_wrapper
+        slack_wrapper.archive_channel = MagicMock(
+            side_effect=[None, SlackApiError("", {}), None]
+        )
+
+        self.exec_command("/ctf", "archivectf", "admin_user", channel="ARCHIVECTF")
+
+        self.assertEqual(slack_wrapper.archive_channel.call_count, 3)
+        self.assertTrue(self.check_for_response("Failed to archive the following"))
+        self.assertIsNone(storage_service.get_ctf(ctf_id="ARCHIVECTF"))
+        self.assertEqual(storage_service.get_challenges("ARCHIVECTF"), [])
+
     def test_reload(self):
         self.exec_command("/ctf", "reload", "admin_user")
 
@@ -395,6 +682,114 @@ class TestChallengeHandler(BotBaseTest):
             msg="Reload didn't execute properly.",
         )
 
+    def test_reload_incremental(self):
+        def channel(channel_id, purpose, num_members=1):
+            return {
+                "id": channel_id,
+                "is_archived": False,
+                "num_members": num_members,
+                "purpose": {"value": json.dumps(purpose)},
+            }
+
+        ctf_purpose = {"ctf_bot": "CTFBOT", "type": "CTF", "name": "ctf", "long_name": ""}
+        challenges = [
+            channel(
+                f"CHALL{i}",
+                {
+                    "ctf_bot": "CTFBOT",
+                    "type": "CHALLENGE",
+                    "ctf_id": "RELOADCTF",
+                    "name": f"c{i}",
+                    "solved": "",
+                },
+            )
+            for i in range(3)
+        ]
+        slack_wrapper = self.botserver.slack_wrapper
+        slack_wrapper.get_private_channels = MagicMock(
+            return_value=[channel("RELOADCTF", ctf_purpose), *challenges]
+        )
+        slack_wrapper.get_public_channels = MagicMock(return_value=[])
+        slack_wrapper.get_channel_members = MagicMock(return_value=["U1"])
+        storage_service = self.botserver.storage_service
+        storage_service.get_challenges = MagicMock(wraps=storage_service.get_challenges)
+        ChallengeHandler.channel_fingerprints = {}
+
+        def update(*args, **kwargs):
+            updated, timings = ChallengeHandler.update_database_from_slack(
+                *args, **kwargs
+            )
+            self.assertEqual(list(timings), ["list", "parse", "members", "store"])
+            return updated
+
+        self.assertEqual(update(slack_wrapper, storage_service, full=False), 1)
+        self.assertEqual(slack_wrapper.get_channel_members.call_count, 3)
+        # All channels are new, so no stored challenge is kept
+        storage_service.get_challenges.assert_not_called()
+
+        self.assertEqual(update(slack_wrapper, storage_service, full=False), 0)
+        self.assertEqual(slack_wrapper.get_channel_members.call_count, 3)
+
+        challenges[1]["num_members"] = 2
+        slack_wrapper.get_channel_members.return_value = ["U1", "U2"]
+        self.assertEqual(update(slack_wrapper, storage_service, full=False), 1)
+        self.assertEqual(slack_wrapper.get_channel_members.call_count, 4)
+        storage_service.get_challenges.assert_called_once_with("RELOADCTF")
+
+        stored = storage_service.get_challenges("RELOADCTF")
+        self.assertEqual(
+            {challenge.name: len(challenge.players) for challenge in stored},
+            {"c0": 1, "c1": 2, "c2": 1},
+        )
+
+        self.assertEqual(update(slack_wrapper, storage_service, full=True), 1)
+        self.assertEqual(slack_wrapper.get_channel_members.call_count, 7)
+        # Only the check of the stored players above read them since
+        self.assertEqual(storage_service.get_challenges.call_count, 2)
+
+    def test_reload_concurrently(self):
+        ctf_channel = {
+            "id": "RELOADCTF",
+            "is_archived": False,
+            "purpose": {
+                "value": json.dumps(
+                    {"ctf_bot": "CTFBOT", "type": "CTF", "name": "ctf", "long_name": ""}
+                )
+            },
+        }
+
+        slack_wrapper = self.botserver.slack_wrapper
+        slack_wrapper.get_private_channels = MagicMock(return_value=[ctf_channel])
+        slack_wrapper.get_public_channels = MagicMock(return_value=[])
+        storage_service = self.botserver.storage_service
+        ChallengeHandler.channel_fingerprints = {}
+
+        bulk_upsert_ctfs = storage_service.bulk_upsert_ctfs
+
+        def slow_bulk_upsert_ctfs(ctfs):
+            # Let the other reload compare fingerprints before these are stored
+            time.sleep(0.05)
+            bulk_upsert_ctfs(ctfs)
+
+        storage_service.bulk_upsert_ctfs = slow_bulk_upsert_ctfs
+
+        updated = []
+
+        def reload():
+            updated.append(
+                ChallengeHandler.update_database_from_slack(
+                    slack_wrapper, storage_service, full=False
+                )[0]
+            )
+
+        threads = [threading.Thread(target=reload) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(updated), [0, 1])
+
     def test_addcreds(self):
         self.exec_command("/ctf", "addcreds user pw url")
 
@@ -468,6 +863,749 @@ class TestChallengeHandler(BotBaseTest):
         )
 
 
+class StorageBackendTest(ABC):
+    """Tests every storage backend has to pass, mixed into a TestCase per backend."""
+
+    @abstractmethod
+    def create_storage(self):
+        """Return an empty storage of the backend under test."""
+
+    def setUp(self):
+        self.storage = self.create_storage()
+        self.storage.add_ctf(
+            CTF(
+                channel_id="CTFCHANNEL",
+                name="testctf",
+                challenges=[
+                    Challenge(
+                        channel_id="CHALLCHANNEL",
+                        ctf_channel_id="CTFCHANNEL",
+                        name="testchall",
+                    )
+                ],
+            )
+        )
+
+    def test_get_ctf(self):
+        for lookup in (
+            {"ctf_id": "CTFCHANNEL"},
+            {"ctf_name": "testctf"},
+            {"challenge_id": "CHALLCHANNEL"},
+        ):
+            ctf = self.storage.get_ctf(**lookup)
+            self.assertEqual(ctf.channel_id, "CTFCHANNEL", msg=f"Lookup by {lookup}")
+            self.assertEqual([chall.name for chall in ctf.challenges], ["testchall"])
+        self.assertIsNone(self.storage.get_ctf(ctf_id="NOCHANNEL"))
+
+    def test_get_challenge(self):
+        challenge = self.storage.get_challenge(
+            challenge_name="testchall", ctf_id="CTFCHANNEL"
+        )
+        self.assertEqual(challenge.channel_id, "CHALLCHANNEL")
+        self.assertIsNone(
+            self.storage.get_challenge(challenge_id="CHALLCHANNEL", ctf_id="OTHER")
+        )
+        self.assertIsNone(self.storage.get_challenge(challenge_id="CTFCHANNEL"))
+
+    def test_returns_copies(self):
+        self.storage.get_ctf(ctf_id="CTFCHANNEL").challenges[0].name = "changed"
+        self.storage.get_challenge(challenge_id="CHALLCHANNEL").tags.append("tag")
+
+        challenge = self.storage.get_challenge(challenge_id="CHALLCHANNEL")
+        self.assertEqual(challenge.name, "testchall")
+        self.assertEqual(challenge.tags, [])
+
+    def test_update_challenge(self):
+        challenge = self.storage.update_challenge(
+            "CHALLCHANNEL", lambda challenge: challenge.mark_as_solved(["solver"])
+        )
+        self.assertTrue(challenge.is_solved)
+        self.assertTrue(self.storage.get_challenge(challenge_id="CHALLCHANNEL").is_solved)
+
+        self.storage.update_challenge("CHALLCHANNEL", lambda challenge: False)
+        self.storage.update_challenge_name("CHALLCHANNEL", "renamed")
+        self.assertEqual(
+            self.storage.get_challenges("CTFCHANNEL")[0].name, "renamed"
+        )
+        self.assertIsNone(self.storage.update_challenge("NOCHANNEL", lambda c: None))
+
+    def test_get_ctf_summary(self):
+        for lookup in ({"ctf_id": "CTFCHANNEL"}, {"ctf_name": "testctf"}):
+            ctf = self.storage.get_ctf_summary(**lookup)
+            self.assertEqual(ctf.channel_id, "CTFCHANNEL", msg=f"Lookup by {lookup}")
+            self.assertFalse(hasattr(ctf, "challenges"))
+        self.assertIsNone(self.storage.get_ctf_summary(ctf_name="nonexisting"))
+
+    def test_update_ctf(self):
+        ctf = self.storage.update_ctf(
+            "CTFCHANNEL", lambda ctf: setattr(ctf, "finished", True)
+        )
+        self.assertTrue(ctf.finished)
+        ctf = self.storage.get_ctf(ctf_id="CTFCHANNEL")
+        self.assertTrue(ctf.finished)
+        self.assertEqual(len(ctf.challenges), 1)
+
+        self.storage.update_ctf_name("CTFCHANNEL", "renamed")
+        self.assertEqual(self.storage.get_ctf(ctf_name="renamed").channel_id, "CTFCHANNEL")
+
+    def test_add_and_remove_challenge(self):
+        with self.assertRaises(ValueError):
+            self.storage.add_challenge(
+                Challenge(channel_id="X", ctf_channel_id="NOCTF", name="x"), "NOCTF"
+            )
+
+        self.storage.add_challenge(
+            Challenge(channel_id="NEWCHANNEL", ctf_channel_id="CTFCHANNEL", name="new"),
+            "CTFCHANNEL",
+        )
+        self.assertEqual(len(self.storage.get_challenges("CTFCHANNEL")), 2)
+
+        self.storage.remove_challenge("CHALLCHANNEL", "CTFCHANNEL")
+        self.assertEqual(
+            [chall.name for chall in self.storage.get_challenges("CTFCHANNEL")], ["new"]
+        )
+
+    def test_bulk_upsert_and_delete(self):
+        self.storage.bulk_upsert_ctfs(
+            [
+                CTF(channel_id="CTFCHANNEL", name="testctf"),
+                CTF(channel_id="CTF2", name="ctf2"),
+            ]
+        )
+        self.assertEqual(len(self.storage.get_ctfs()), 2)
+        self.assertEqual(self.storage.get_challenges("CTFCHANNEL"), [])
+
+        self.storage.remove_ctf("CTFCHANNEL")
+        self.assertEqual([ctf.name for ctf in self.storage.get_ctfs()], ["ctf2"])
+
+    def test_iter_ctfs(self):
+        self.storage.bulk_upsert_ctfs(
+            [
+                CTF(channel_id=f"CTF{i}", name=f"ctf{i}", finished=i % 2 == 0)
+                for i in range(5)
+            ]
+        )
+        self.assertEqual(len(list(self.storage.iter_ctfs())), 6)
+        self.assertEqual(
+            sorted(ctf.name for ctf in self.storage.iter_ctfs(finished=True)),
+            ["ctf0", "ctf2", "ctf4"],
+        )
+        running = self.storage.get_ctfs(finished=False)
+        self.assertEqual(
+            sorted(ctf.name for ctf in running), ["ctf1", "ctf3", "testctf"]
+        )
+        self.assertEqual(
+            [len(ctf.challenges) for ctf in running if ctf.name == "testctf"], [1]
+        )
+
+
+class TestMemoryStorage(StorageBackendTest, TestCase):
+    def create_storage(self):
+        return MemoryStorageService()
+
+
+class TestSQLiteStorage(StorageBackendTest, TestCase):
+    def create_storage(self):
+        # Small pages to test iterating over several pages
+        return SQLiteStorageService(":memory:", page_size=2)
+
+
+class TestOpenSearchStorage(StorageBackendTest, TestCase):
+    def create_storage(self, refresh="true"):
+        # Small pages to test iterating over several pages
+        env = {"STORAGE_REFRESH": refresh, "STORAGE_PAGE_SIZE": "2"}
+        with patch("util.storage_service.OpenSearch", OpenSearchMock), patch.dict(
+            os.environ, env
+        ):
+            return StorageService()
+
+    def test_migrate(self):
+        client = self.storage.client
+        self.assertEqual(client.aliases, {"ctf": "ctf-v1", "challenge": "challenge-v1"})
+        self.assertEqual(self.storage.migrate(), [])
+
+        # A new INDEX_VERSION reindexes and moves the aliases over
+        with patch("util.storage_service.INDEX_VERSION", 2):
+            self.assertEqual(
+                self.storage.migrate(),
+                [
+                    "Reindexed ctf-v1 into ctf-v2",
+                    "Reindexed challenge-v1 into challenge-v2",
+                ],
+            )
+        self.assertEqual(client.aliases, {"ctf": "ctf-v2", "challenge": "challenge-v2"})
+        self.assertFalse(client.indices.exists("ctf-v1"))
+        self.assertEqual(len(self.storage.get_ctf(ctf_id="CTFCHANNEL").challenges), 1)
+
+    def test_migrate_embedded_challenges(self):
+        storage = self.create_storage()
+        # CTF with embedded challenges in the unversioned ctf index
+        ctf = CTF(
+            channel_id="OLDCTF",
+            name="oldctf",
+            challenges=[
+                Challenge(channel_id="OLDCHALL", ctf_channel_id="OLDCTF", name="old")
+            ],
+        )
+        storage.client._write("ctf", "OLDCTF", ctf.dict(), True)
+
+        with patch.object(
+            storage.client, "reindex", wraps=storage.client.reindex
+        ) as reindex:
+            self.assertTrue(storage.wait_until_ready(1))
+        # Challenges are written into challenge-v1, not a dynamically mapped index
+        self.assertEqual(
+            [call.kwargs["body"]["source"]["index"] for call in reindex.call_args_list],
+            ["ctf"],
+        )
+        self.assertEqual(
+            storage.client.aliases, {"ctf": "ctf-v1", "challenge": "challenge-v1"}
+        )
+        self.assertFalse(storage.client.indices.exists("ctf"))
+        self.assertNotIn(
+            "challenges", storage.client.get(index="ctf", id="OLDCTF")["_source"]
+        )
+        self.assertEqual(
+            [chall.name for chall in storage.get_ctf(ctf_id="OLDCTF").challenges],
+            ["old"],
+        )
+
+    def test_update_conflict_retry(self):
+        client = self.storage.client
+        get = client.get
+        attempts = []
+
+        def get_and_race(**kwargs):
+            # Another bot instance writes right after the first read
+            result = get(**kwargs)
+            if not attempts:
+                source = {**result["_source"], "tags": ["concurrent"]}
+                client.index(index="challenge", body=source, id="CHALLCHANNEL")
+            return result
+
+        def update_func(challenge):
+            attempts.append(challenge.tags)
+            challenge.mark_as_solved(["solver"])
+
+        with patch.object(client, "get", side_effect=get_and_race):
+            challenge = self.storage.update_challenge("CHALLCHANNEL", update_func)
+
+        self.assertEqual(attempts, [[], ["concurrent"]])
+        challenge = self.storage.get_challenge(challenge_id="CHALLCHANNEL")
+        self.assertTrue(challenge.is_solved)
+        self.assertEqual(challenge.tags, ["concurrent"])
+
+    def test_update_conflict_gives_up(self):
+        self.storage.conflict_retries = 1
+        with patch.object(
+            self.storage.client,
+            "index",
+            side_effect=ConflictError(409, "version_conflict_engine_exception", {}),
+        ), patch("util.storage_service.time.sleep"):
+            with self.assertRaises(InvalidCommand):
+                self.storage.update_ctf("CTFCHANNEL", lambda ctf: None)
+
+    def test_cached_challenge_of_other_ctf(self):
+        self.storage.get_ctf(ctf_id="CTFCHANNEL")
+
+        with patch.object(self.storage.client, "get") as get:
+            self.assertIsNone(
+                self.storage.get_challenge(challenge_id="CHALLCHANNEL", ctf_id="OTHER")
+            )
+            self.assertEqual(
+                self.storage.get_challenge(
+                    challenge_id="CHALLCHANNEL", ctf_id="CTFCHANNEL"
+                ).name,
+                "testchall",
+            )
+            get.assert_not_called()
+
+    def test_ctf_channel_lookup_stats(self):
+        self.storage.get_ctf(ctf_id="CTFCHANNEL")
+        stats = self.storage.cache_stats()
+
+        # Looking up a CTF channel as challenge channel is no CTF cache lookup
+        self.assertIsNone(self.storage.get_challenge(challenge_id="CTFCHANNEL"))
+        self.assertEqual(self.storage.cache_stats(), stats)
+
+    def test_cache_invalidation(self):
+        self.storage.get_ctf(ctf_id="CTFCHANNEL")
+        self.storage.update_ctf(
+            "CTFCHANNEL", lambda ctf: setattr(ctf, "name", "x") or False
+        )
+        self.assertEqual(self.storage.get_ctf(ctf_id="CTFCHANNEL").name, "testctf")
+
+        self.storage.remove_ctf("CTFCHANNEL")
+        self.assertIsNone(self.storage.get_ctf(ctf_id="CTFCHANNEL"))
+        self.assertIsNone(self.storage.get_challenge(challenge_id="CHALLCHANNEL"))
+        self.assertEqual(self.storage.cache_stats()["size"], 0)
+
+    def test_refresh_modes(self):
+        storage = self.create_storage(refresh="wait_for")
+        storage.add_ctf(CTF(channel_id="CTF1", name="ctf1"))
+        self.assertEqual(storage.get_ctf(ctf_name="ctf1").channel_id, "CTF1")
+        self.assertEqual(storage.client.refreshed, [])
+
+        storage = self.create_storage(refresh="false")
+        storage.add_ctf(CTF(channel_id="CTF1", name="ctf1"))
+        self.assertEqual(storage.get_ctf(ctf_id="CTF1").name, "ctf1")
+        self.assertEqual(storage.client.refreshed, [])
+
+        # Searches refresh an index with writes once
+        storage.ctf_cache.clear()
+        self.assertEqual(storage.get_ctf(ctf_name="ctf1").channel_id, "CTF1")
+        storage.ctf_cache.clear()
+        self.assertEqual(storage.get_ctf(ctf_name="ctf1").channel_id, "CTF1")
+        self.assertEqual(storage.client.refreshed, ["ctf"])
+
+
+class TestAsyncOpenSearchStorage(IsolatedAsyncioTestCase):
+    def setUp(self):
+        with patch("util.storage_service.OpenSearch", OpenSearchMock), patch.dict(
+            os.environ, {"STORAGE_REFRESH": "false", "STORAGE_PAGE_SIZE": "2"}
+        ):
+            self.sync_storage = StorageService()
+        with patch(
+            "util.async_storage_service.AsyncOpenSearch",
+            lambda **kwargs: AsyncOpenSearchMock(self.sync_storage.client),
+        ):
+            self.storage = self.sync_storage.create_async_service()
+
+        self.sync_storage.add_ctf(
+            CTF(
+                channel_id="CTFCHANNEL",
+                name="testctf",
+                challenges=[
+                    Challenge(
+                        channel_id="CHALLCHANNEL",
+                        ctf_channel_id="CTFCHANNEL",
+                        name="testchall",
+                    )
+                ],
+            )
+        )
+
+    async def test_get_ctf(self):
+        for lookup in (
+            {"ctf_id": "CTFCHANNEL"},
+            {"ctf_name": "testctf"},
+            {"challenge_id": "CHALLCHANNEL"},
+        ):
+            self.storage.ctf_cache.clear()
+            ctf = await self.storage.get_ctf(**lookup)
+            self.assertEqual(ctf.channel_id, "CTFCHANNEL", msg=f"Lookup by {lookup}")
+            self.assertEqual([chall.name for chall in ctf.challenges], ["testchall"])
+        self.assertIsNone(await self.storage.get_ctf(ctf_id="NOCHANNEL"))
+
+        summary = await self.storage.get_ctf_summary(ctf_name="testctf")
+        self.assertEqual(summary.channel_id, "CTFCHANNEL")
+        challenge = await self.storage.get_challenge(
+            challenge_name="testchall", ctf_id="CTFCHANNEL"
+        )
+        self.assertEqual(challenge.channel_id, "CHALLCHANNEL")
+        self.assertIsNone(await self.storage.get_challenge(challenge_id="CTFCHANNEL"))
+
+    async def test_shares_cache(self):
+        await self.storage.get_ctf(ctf_id="CTFCHANNEL")
+
+        # Both services see the writes of the other one through the cache
+        with patch.object(self.sync_storage.client, "search") as search:
+            await self.storage.update_challenge(
+                "CHALLCHANNEL", lambda challenge: challenge.mark_as_solved(["solver"])
+            )
+            self.assertTrue(
+                self.sync_storage.get_challenge(challenge_id="CHALLCHANNEL").is_solved
+            )
+            self.sync_storage.update_ctf_name("CTFCHANNEL", "renamed")
+            self.assertEqual(
+                (await self.storage.get_ctf(ctf_id="CTFCHANNEL")).name, "renamed"
+            )
+            search.assert_not_called()
+        self.assertEqual((await self.storage.cache_stats())["size"], 1)
+
+    async def test_writes(self):
+        await self.storage.add_challenge(
+            Challenge(channel_id="NEWCHANNEL", ctf_channel_id="CTFCHANNEL", name="new"),
+            "CTFCHANNEL",
+        )
+        await self.storage.bulk_upsert_ctfs(
+            [CTF(channel_id=f"CTF{i}", name=f"ctf{i}", finished=True) for i in range(3)]
+        )
+
+        # Writes without refresh are searchable once a search refreshes them
+        self.assertEqual(
+            sorted(ctf.name for ctf in await self.storage.get_ctfs(finished=True)),
+            ["ctf0", "ctf1", "ctf2"],
+        )
+        self.assertEqual(len(await self.storage.get_challenges("CTFCHANNEL")), 2)
+        self.assertEqual(self.sync_storage._dirty_indices, set())
+
+        await self.storage.remove_ctf("CTFCHANNEL")
+        self.assertIsNone(self.sync_storage.get_ctf(ctf_id="CTFCHANNEL"))
+        self.assertIsNone(await self.storage.get_challenge(challenge_id="NEWCHANNEL"))
+
+
+class TestSlackWrapperUserCache(TestCase):
+    def setUp(self):
+        self.slack_wrapper = SlackWrapper()
+        self.slack_wrapper.client = MagicMock()
+        self.client = self.slack_wrapper.client
+        self.client.users_info.return_value = {"ok": True, "user": {"id": "U1"}}
+        self.client.users_list.side_effect = [
+            {"members": [{"id": "U1"}], "response_metadata": {"next_cursor": "c"}},
+            {"members": [{"id": "U2"}], "response_metadata": {"next_cursor": ""}},
+        ]
+
+    def test_get_member_cached(self):
+        self.slack_wrapper.get_member("U1")
+        member = self.slack_wrapper.get_member("U1")
+
+        self.assertEqual(member["user"]["id"], "U1")
+        self.assertEqual(self.client.users_info.call_count, 1)
+        self.assertEqual(self.slack_wrapper.user_cache_stats()["hits"], 1)
+
+    def test_get_members_paginated(self):
+        members = self.slack_wrapper.get_members()["members"]
+        self.slack_wrapper.get_members()
+        self.slack_wrapper.get_member("U2")
+
+        self.assertEqual([member["id"] for member in members], ["U1", "U2"])
+        self.assertEqual(self.client.users_list.call_count, 2)
+        self.client.users_info.assert_not_called()
+
+    def test_get_members_exceeding_cache(self):
+        self.slack_wrapper.user_cache.maxsize = 1
+        self.slack_wrapper.get_members()
+        members = self.slack_wrapper.get_members()["members"]
+
+        self.assertEqual([member["id"] for member in members], ["U1", "U2"])
+        self.assertEqual(self.client.users_list.call_count, 2)
+
+    def test_update_member(self):
+        self.slack_wrapper.get_members()
+        self.slack_wrapper.update_member({"id": "U3"})
+
+        members = self.slack_wrapper.get_members()["members"]
+        self.assertEqual(len(members), 3)
+        self.assertEqual(self.client.users_list.call_count, 2)
+
+
+class TestSlackWrapperPagination(TestCase):
+    def setUp(self):
+        self.slack_wrapper = SlackWrapper()
+        self.slack_wrapper.client = MagicMock()
+        self.client = self.slack_wrapper.client
+        self.client.conversations_list.side_effect = [
+            {
+                "channels": [{"id": "C1", "name": "one"}],
+                "response_metadata": {"next_cursor": "c"},
+            },
+            {
+                "channels": [{"id": "C2", "name": "two"}],
+                "response_metadata": {"next_cursor": ""},
+            },
+        ]
+        self.client.conversations_members.side_effect = [
+            {"members": ["U1", "U2"], "response_metadata": {"next_cursor": "c"}},
+            {"members": ["U3"], "response_metadata": {"next_cursor": ""}},
+        ]
+
+    def test_get_channels(self):
+        channels = self.slack_wrapper.get_public_channels()
+
+        self.assertEqual([channel["id"] for channel in channels], ["C1", "C2"])
+        self.assertEqual(self.client.conversations_list.call_count, 2)
+
+    def test_get_channel_by_name_stops_early(self):
+        channel = self.slack_wrapper.get_channel_by_name("one")
+
+        self.assertEqual(channel["id"], "C1")
+        self.assertEqual(self.client.conversations_list.call_count, 1)
+
+    def test_get_missing_members(self):
+        missing = self.slack_wrapper.get_missing_members("C1", ["U4", "U1"])
+
+        self.assertEqual(missing, ["U4"])
+        self.assertEqual(self.client.conversations_members.call_count, 2)
+
+        self.client.conversations_members.side_effect = [
+            {"members": ["U1", "U2"], "response_metadata": {"next_cursor": "c"}},
+        ]
+        self.assertEqual(self.slack_wrapper.get_missing_members("C1", ["U2"]), [])
+
+    def test_invite_members(self):
+        members = {"C1": ["U1"], "C2": ["U1", "U2"], "C3": []}
+        self.client.conversations_members.side_effect = lambda channel, **kwargs: {
+            "members": members[channel],
+            "response_metadata": {"next_cursor": ""},
+        }
+        self.client.conversations_invite.side_effect = [None, SlackApiError("", {})]
+
+        results = self.slack_wrapper.invite_members(["C1", "C2", "C3"], ["U1", "U2"])
+
+        self.assertEqual([channel_id for channel_id, _, _ in results], ["C1", "C2", "C3"])
+        self.assertEqual(results[1], ("C2", [], None))
+        self.assertEqual(self.client.conversations_invite.call_count, 2)
+        self.assertEqual(sum(1 for _, _, error in results if error), 1)
+
+
+class TestAsyncSlackWrapper(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sync_wrapper = SlackWrapper()
+        self.sync_wrapper.client = MagicMock()
+        self.slack_wrapper = AsyncSlackWrapper(
+            rate_limiter=self.sync_wrapper.rate_limiter,
+            members=self.sync_wrapper.members,
+        )
+        self.slack_wrapper.client = AsyncMock()
+        self.client = self.slack_wrapper.client
+        self.client.users_list.side_effect = [
+            {"members": [{"id": "U1"}], "response_metadata": {"next_cursor": "c"}},
+            {"members": [{"id": "U2"}], "response_metadata": {"next_cursor": ""}},
+        ]
+
+    async def test_members_shared(self):
+        members = (await self.slack_wrapper.get_members())["members"]
+        self.assertEqual([member["id"] for member in members], ["U1", "U2"])
+        self.assertEqual(self.client.users_list.await_count, 2)
+
+        # Loaded by the async wrapper, updated through the sync one
+        self.sync_wrapper.update_member({"id": "U3", "name": "new"})
+        self.assertEqual(len(self.sync_wrapper.get_members()["members"]), 3)
+        self.assertEqual(len((await self.slack_wrapper.get_members())["members"]), 3)
+        member = await self.slack_wrapper.get_member("U3")
+        self.assertEqual(member["user"]["name"], "new")
+        self.client.users_info.assert_not_awaited()
+        self.sync_wrapper.client.users_list.assert_not_called()
+
+    async def test_get_missing_members(self):
+        self.client.conversations_members.side_effect = [
+            {"members": ["U1", "U2"], "response_metadata": {"next_cursor": "c"}},
+            {"members": ["U3"], "response_metadata": {"next_cursor": ""}},
+        ]
+
+        missing = await self.slack_wrapper.get_missing_members("C1", ["U2"])
+
+        self.assertEqual(missing, [])
+        self.assertEqual(self.client.conversations_members.await_count, 1)
+
+    async def test_invite_members(self):
+        members = {"C1": ["U1"], "C2": ["U1", "U2"], "C3": []}
+        self.client.conversations_members.side_effect = lambda channel, **kwargs: {
+            "members": members[channel],
+            "response_metadata": {"next_cursor": ""},
+        }
+        self.client.conversations_invite.side_effect = [None, SlackApiError("", {})]
+
+        results = await self.slack_wrapper.invite_members(["C1", "C2", "C3"], ["U1", "U2"])
+
+        self.assertEqual([channel_id for channel_id, _, _ in results], ["C1", "C2", "C3"])
+        self.assertEqual(results[1], ("C2", [], None))
+        self.assertEqual(sum(1 for _, _, error in results if error), 1)
+
+    async def test_post_message_to_user(self):
+        self.client.chat_postMessage.side_effect = [SlackApiError("", {}), {"ok": True}]
+
+        response = await self.slack_wrapper.post_message("C1", "text", user_id="U1")
+
+        self.assertEqual(response, {"ok": True})
+        self.assertEqual(
+            [call.kwargs["channel"] for call in self.client.chat_postMessage.await_args_list],
+            ["C1", "U1"],
+        )
+
+    async def test_update_channel_purpose_name(self):
+        self.client.conversations_info.return_value = {
+            "channel": {"purpose": {"value": json.dumps({"name": "old", "x": 1})}}
+        }
+
+        await self.slack_wrapper.update_channel_purpose_name("C1", "new")
+
+        purpose = self.client.conversations_setPurpose.await_args.kwargs["purpose"]
+        self.assertEqual(json.loads(purpose), {"name": "new", "x": 1})
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        self.rate_limiter = RateLimiter(max_retries=2)
+        self.rate_limiter.wait = MagicMock()
+        self.client = MagicMock()
+        self.limited_client = RateLimitedClient(self.client, self.rate_limiter)
+
+    def throttled(self, retry_after):
+        response = MagicMock(status_code=429, headers={"Retry-After": retry_after})
+        return SlackApiError("ratelimited", response)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 2, places=2)
+
+        bucket.pause(10)
+        self.assertAlmostEqual(bucket.reserve(), 13, places=2)
+
+    def test_retry_after(self):
+        self.client.conversations_rename.side_effect = [self.throttled("30"), "ok"]
+
+        self.assertEqual(self.limited_client.conversations_rename(channel="C1"), "ok")
+        self.assertEqual(self.client.conversations_rename.call_count, 2)
+        self.assertGreaterEqual(self.rate_limiter.wait.call_args[0][0], 29)
+        self.assertEqual(self.rate_limiter.stats()["throttled"], 1)
+
+    def test_retries_exhausted(self):
+        self.client.users_info.side_effect = self.throttled("1")
+
+        with self.assertRaises(SlackApiError):
+            self.limited_client.users_info(user="U1")
+        self.assertEqual(self.client.users_info.call_count, 3)
+
+    def test_tiers(self):
+        self.assertEqual(self.rate_limiter.bucket("users.list").rate, 20 / 60)
+        self.assertEqual(self.rate_limiter.bucket("users.info").rate, 100 / 60)
+
+
+class TestCommandExecutor(TestCase):
+    def setUp(self):
+        self.executor = CommandExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_same_key_in_order(self):
+        calls = []
+        release = threading.Event()
+        self.executor.submit("CTF1", lambda: release.wait(5) and calls.append(1), "a")
+        self.executor.submit("CTF1", lambda: calls.append(2), "b")
+        self.executor.submit("CTF2", lambda: calls.append(3), "c")
+
+        self.executor.submit("CTF2", release.set, "d")
+        self.executor.shutdown()
+
+        self.assertEqual(calls, [3, 1, 2])
+        stats = self.executor.stats()
+        self.assertEqual(stats["queued"], 0)
+        self.assertTrue(stats["a"].startswith("1x"))
+
+    def test_failing_task(self):
+        calls = []
+        self.executor.submit("CTF1", lambda: 1 / 0, "fail")
+        self.executor.submit("CTF1", lambda: calls.append(1), "ok")
+        self.executor.shutdown()
+
+        self.assertEqual(calls, [1])
+
+    def test_routed_in_order(self):
+        calls = []
+        release = threading.Event()
+        self.executor.submit("CTF1", lambda: release.wait(5) and calls.append(1), "a")
+        # Routed behind the running task of CTF1, in the order submitted
+        self.executor.submit(
+            "CHALL1", lambda: calls.append(2), "b", route=lambda: time.sleep(0.05) or "CTF1"
+        )
+        self.executor.submit("CHALL1", lambda: calls.append(3), "c", route=lambda: "CTF1")
+        self.executor.submit("CHALL2", lambda: calls.append(4), "d", route=lambda: 1 / 0)
+
+        time.sleep(0.1)
+        self.assertEqual(calls, [4])
+        release.set()
+        self.executor.shutdown()
+
+        self.assertEqual(calls, [4, 1, 2, 3])
+        self.assertEqual(self.executor.stats()["queued"], 0)
+
+
+class TestAsyncCommandExecutor(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # A single worker, which async tasks must not hold on to
+        self.executor = AsyncCommandExecutor(asyncio.get_running_loop(), max_workers=1)
+
+    async def asyncTearDown(self):
+        self.executor.shutdown(wait=False)
+
+    async def test_awaits_on_loop(self):
+        calls = []
+        released = asyncio.Event()
+        done = asyncio.Event()
+
+        async def wait_for_release():
+            calls.append("a")
+            await released.wait()
+            calls.append("a done")
+
+        async def release():
+            calls.append("b")
+            released.set()
+
+        async def after_release():
+            calls.append("c")
+            done.set()
+
+        # Functions return the coroutine of an async command, like process_message
+        self.executor.submit("CTF1", lambda: wait_for_release(), "a")
+        self.executor.submit("CHALL1", lambda: after_release(), "c", route=lambda: "CTF1")
+        self.executor.submit("CTF2", lambda: release(), "b")
+        await asyncio.wait_for(done.wait(), 5)
+
+        # Tasks of CTF1 wait for the awaited task, tasks of CTF2 don't
+        self.assertEqual(sorted(calls[:2]), ["a", "b"])
+        self.assertEqual(calls[2:], ["a done", "c"])
+        self.assertTrue(self.executor.stats()["a"].startswith("1x"))
+
+    async def test_failing_task(self):
+        done = asyncio.Event()
+
+        async def fail():
+            raise ValueError("failed")
+
+        async def succeed():
+            done.set()
+
+        self.executor.submit("CTF1", lambda: fail(), "fail")
+        self.executor.submit("CTF1", lambda: succeed(), "ok")
+        await asyncio.wait_for(done.wait(), 5)
+
+
+class TestBotServerConfig(TestCase):
+    def setUp(self):
+        config_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(config_dir.cleanup)
+        self.config_path = os.path.join(config_dir.name, "config.json")
+        with open(self.config_path, "w") as f:
+            json.dump({"maintenance_mode": False, "admin_users": ["U1"]}, f)
+
+        patcher = patch("botserver.CONFIG_PATH", self.config_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.botserver = BotServer()
+        self.addCleanup(setattr, self.botserver, "running", False)
+
+    def test_set_config_option(self):
+        snapshot = self.botserver.config
+        self.botserver.set_config_option("maintenance_mode", True)
+
+        self.assertFalse(snapshot["maintenance_mode"])
+        self.assertTrue(self.botserver.get_config_option("maintenance_mode"))
+        with open(self.config_path) as f:
+            self.assertTrue(json.load(f)["maintenance_mode"])
+        with self.assertRaises(TypeError):
+            self.botserver.config["maintenance_mode"] = False
+
+    def test_watch_config(self):
+        self.botserver.watch_config(0.01)
+        with open(self.config_path, "w") as f:
+            json.dump({"maintenance_mode": True, "admin_users": []}, f)
+        os.utime(self.config_path, (0, 0))
+
+        deadline = time.monotonic() + 5
+        while not self.botserver.get_config_option("maintenance_mode"):
+            self.assertLess(time.monotonic(), deadline, msg="Config wasn't reloaded.")
+            time.sleep(0.01)
+        self.assertEqual(self.botserver.get_config_option("admin_users"), [])
+
+
 def run_tests():
     # borrowed from gef test suite (https://github.com/hugsy/gef/blob/dev/tests/runtests.py)
     test_instances = [
@@ -475,6 +1613,17 @@ def run_tests():
         TestBotHandler,
         TestAdminHandler,
         TestChallengeHandler,
+        TestMemoryStorage,
+        TestSQLiteStorage,
+        TestOpenSearchStorage,
+        TestAsyncOpenSearchStorage,
+        TestSlackWrapperUserCache,
+        TestSlackWrapperPagination,
+        TestAsyncSlackWrapper,
+        TestRateLimiter,
+        TestCommandExecutor,
+        TestAsyncCommandExecutor,
+        TestBotServerConfig,
     ]
 
     # don't show bot debug messages for running tests
@@ -0,0 +1,277 @@
+import copy
+import json
+from types import SimpleNamespace
+
+from opensearchpy.exceptions import ConflictError, NotFoundError, RequestError
+from opensearchpy.serializer import JSONSerializer
+
+
+class OpenSearchMock:
+    """
+    OpenSearch client mock, keeping indices in memory.
+    Covers the requests StorageService sends. Gets are realtime, while searches
+    only see documents as of the last refresh of their index, like on a cluster.
+    """
+
+    def __init__(self, **kwargs):
+        # Physical index => document id => stored document with its version
+        self.documents = {}
+        # Physical index => document id => source visible to searches
+        self.searchable = {}
+        self.aliases = {}
+        self.templates = {}
+
+        # Indices refreshed explicitly with indices.refresh, in call order
+        self.refreshed = []
+
+        self._seq_no = 0
+
+        self.cluster = SimpleNamespace(health=lambda **kwargs: {"status": "green"})
+        self.indices = IndicesMock(self)
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+
+    def resolve(self, name):
+        """Return the physical index behind an alias or index name."""
+        return self.aliases.get(name, name)
+
+    def refresh(self, index):
+        index = self.resolve(index)
+        self.searchable[index] = {
+            doc_id: copy.deepcopy(doc["_source"])
+            for doc_id, doc in self.documents.get(index, {}).items()
+        }
+
+    def _write(self, index, doc_id, source, refresh):
+        index = self.resolve(index)
+        self._seq_no += 1
+        self.documents.setdefault(index, {})[doc_id] = {
+            "_source": copy.deepcopy(source),
+            "_seq_no": self._seq_no,
+            "_primary_term": 1,
+        }
+        if refresh:
+            self.refresh(index)
+        return {"_index": index, "_id": doc_id, "result": "updated"}
+
+    def _remove(self, index, doc_id, refresh):
+        index = self.resolve(index)
+        if doc_id not in self.documents.get(index, {}):
+            raise NotFoundError(404, "not_found", {"_id": doc_id})
+        del self.documents[index][doc_id]
+        if refresh:
+            self.refresh(index)
+
+    def index(
+        self, index, body, id, refresh=False, if_seq_no=None, if_primary_term=None
+    ):
+        if if_seq_no is not None:
+            document = self.documents.get(self.resolve(index), {}).get(id)
+            if not document or document["_seq_no"] != if_seq_no:
+                raise ConflictError(409, "version_conflict_engine_exception", {})
+        return self._write(index, id, body, refresh)
+
+    def update(self, index, body, id, refresh=False, retry_on_conflict=0):
+        document = self.get(index=index, id=id)["_source"]
+        return self._write(index, id, {**document, **body["doc"]}, refresh)
+
+    def get(self, index, id, _source_includes=None):
+        document = self.documents.get(self.resolve(index), {}).get(id)
+        if document is None:
+            raise NotFoundError(404, "not_found", {"_id": id, "found": False})
+
+        source = copy.deepcopy(document["_source"])
+        if _source_includes is not None:
+            source = {key: source[key] for key in _source_includes if key in source}
+        return {
+            "_index": self.resolve(index),
+            "_id": id,
+            "found": True,
+            "_source": source,
+            "_seq_no": document["_seq_no"],
+            "_primary_term": document["_primary_term"],
+        }
+
+    def delete(self, index, id, refresh=False):
+        self._remove(index, id, refresh)
+
+    def bulk(self, body, refresh=False, **kwargs):
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        items = []
+        while lines:
+            op_type, action = lines.pop(0).popitem()
+            item = {"_index": action["_index"], "_id": action["_id"], "status": 200}
+            if op_type == "delete":
+                try:
+                    self._remove(action["_index"], action["_id"], False)
+                except NotFoundError:
+                    item["status"] = 404
+            else:
+                self._write(action["_index"], action["_id"], lines.pop(0), False)
+            items.append((op_type, item))
+
+        if refresh:
+            for index in {item["_index"] for _, item in items}:
+                self.refresh(index)
+        return {
+            "errors": any(item["status"] >= 300 for _, item in items),
+            "items": [{op_type: item} for op_type, item in items],
+        }
+
+    def search(self, index=None, body=None, scroll=None, size=None, **kwargs):
+        body = body or {}
+        index = self.resolve(index)
+        hits = [
+            {"_index": index, "_id": doc_id, "_source": copy.deepcopy(source)}
+            for doc_id, source in self.searchable.get(index, {}).items()
+            if matches(body.get("query", {"match_all": {}}), source)
+        ]
+
+        sort = body.get("sort")
+        if isinstance(sort, list):
+            field = next(iter(sort[0]))
+            hits.sort(key=lambda hit: hit["_source"].get(field))
+            for hit in hits:
+                hit["sort"] = [hit["_source"].get(field)]
+            if "search_after" in body:
+                hits = [hit for hit in hits if hit["sort"] > body["search_after"]]
+
+        total = len(hits)
+        if scroll is None:
+            hits = hits[: body.get("size", size or 10)]
+        if "_source" in body:
+            for hit in hits:
+                hit["_source"] = {
+                    key: hit["_source"][key]
+                    for key in body["_source"]
+                    if key in hit["_source"]
+                }
+
+        response = {
+            "_shards": {"total": 1, "successful": 1, "skipped": 0},
+            "hits": {"total": {"value": total}, "hits": hits},
+        }
+        if scroll is not None:
+            response["_scroll_id"] = "scroll"
+        return response
+
+    def scroll(self, body, **kwargs):
+        # All hits are returned by the initial search of a scroll
+        return {"_shards": {"total": 1, "successful": 1}, "hits": {"hits": []}}
+
+    def clear_scroll(self, body, **kwargs):
+        pass
+
+    def delete_by_query(self, index, body, refresh=False):
+        index = self.resolve(index)
+        deleted = [
+            doc_id
+            for doc_id, source in self.searchable.get(index, {}).items()
+            if matches(body["query"], source)
+        ]
+        for doc_id in deleted:
+            self.documents[index].pop(doc_id, None)
+        if refresh:
+            self.refresh(index)
+        return {"deleted": len(deleted)}
+
+    def reindex(self, body, refresh=False, wait_for_completion=True):
+        source = self.resolve(body["source"]["index"])
+        for doc_id, document in self.documents.get(source, {}).items():
+            self._write(body["dest"]["index"], doc_id, document["_source"], False)
+        if refresh:
+            self.refresh(body["dest"]["index"])
+
+
+class IndicesMock:
+    """Mock of the indices API of the OpenSearch client."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, index, body=None):
+        if index in self.client.documents:
+            raise RequestError(400, "resource_already_exists_exception", {})
+        self.client.documents[index] = {}
+        self.client.searchable[index] = {}
+        return {"acknowledged": True, "index": index}
+
+    def exists(self, index):
+        return index in self.client.documents
+
+    def get_alias(self, name):
+        if name not in self.client.aliases:
+            raise NotFoundError(404, "alias_missing", {})
+        return {self.client.aliases[name]: {"aliases": {name: {}}}}
+
+    def put_index_template(self, name, body):
+        self.client.templates[name] = body
+
+    def update_aliases(self, body):
+        for action in body["actions"]:
+            if "remove_index" in action:
+                index = action["remove_index"]["index"]
+                self.client.documents.pop(index, None)
+                self.client.searchable.pop(index, None)
+        for action in body["actions"]:
+            if "add" in action:
+                self.client.aliases[action["add"]["alias"]] = action["add"]["index"]
+
+    def refresh(self, index):
+        for name in index.split(","):
+            self.client.refreshed.append(name)
+            self.client.refresh(name)
+
+
+def matches(query, source):
+    """Return whether a document source matches the (query DSL) query."""
+    query_type, params = next(iter(query.items()))
+    if query_type == "match_all":
+        return True
+    if query_type == "exists":
+        return source.get(params["field"]) is not None
+    if query_type in ("term", "terms"):
+        field, values = next(iter(params.items()))
+        values = values if query_type == "terms" else [values]
+        value = source.get(field)
+        stored = value if isinstance(value, list) else [value]
+        return any(item in values for item in stored)
+    if query_type == "bool":
+        return all(
+            matches(clause, source)
+            for clause in params.get("filter", []) + params.get("must", [])
+        ) and not any(matches(clause, source) for clause in params.get("must_not", []))
+    raise ValueError(f"Unsupported query: {query}")
+
+
+class AsyncOpenSearchMock:
+    """
+    AsyncOpenSearch client mock, sending the requests as coroutines to an
+    OpenSearchMock, e.g. the one of the StorageService the async one shares.
+    """
+
+    def __init__(self, client=None, **kwargs):
+        self.sync_client = client or OpenSearchMock()
+        self.cluster = AsyncMethods(self.sync_client.cluster)
+        self.indices = AsyncMethods(self.sync_client.indices)
+        self.transport = self.sync_client.transport
+
+    def __getattr__(self, name):
+        return getattr(AsyncMethods(self.sync_client), name)
+
+    async def close(self):
+        pass
+
+
+class AsyncMethods:
+    """Offers the methods of an object as coroutines."""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __getattr__(self, name):
+        method = getattr(self.target, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
@@ -57,6 +57,20 @@ class SlackWrapperMock:
         """Read from the real-time messaging API."""
         return "mocked response"
 
+    def run_concurrently(self, func, items, progress=None):
+        results = []
+        for item in items:
+            try:
+                results.append((item, func(item), None))
+            except Exception as e:
+                results.append((item, None, e))
+            if progress:
+                progress(len(results), len(items))
+        return results
+
+    def invite_members(self, channel_ids, user_ids):
+        return self.run_concurrently(lambda channel_id: list(user_ids), channel_ids)
+
     def invite_user(self, user, channel, is_private=False):
         # TODO: Add test response for invite_user
         return None
@@ -74,6 +88,12 @@ class SlackWrapperMock:
     def get_member(self, user_id):
         return json.loads(self.get_member_response)
 
+    def user_cache_stats(self):
+        return {}
+
+    def rate_limit_stats(self):
+        return {}
+
     def create_channel(self, name, is_private=False):
         if is_private:
             return json.loads(
@@ -103,7 +123,9 @@ class SlackWrapperMock:
 
             self.set_purpose(channel_id, json.dumps(purpose), is_private)
 
-    def post_message(self, channel_id, text, timestamp="", parse="full", user_id=None):
+    def post_message(
+        self, channel_id, text, timestamp="", parse="full", user_id=None, blocks=None
+    ):
         """
         Post a message in a given channel.
         channel_id can also be a user_id for private messages.
@@ -142,3 +164,23 @@ class SlackWrapperMock:
         """Set the topic of a given channel."""
 
         return None
+
+
+class AsyncSlackWrapperMock:
+    """
+    Async Slack API wrapper mock, offering the methods of a SlackWrapperMock as
+    coroutines. Messages end up in the message list of the wrapped mock.
+    """
+
+    def __init__(self, slack_wrapper):
+        self.slack_wrapper = slack_wrapper
+
+    def __getattr__(self, name):
+        attr = getattr(self.slack_wrapper, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return attr(*args, **kwargs)
+
+        return call
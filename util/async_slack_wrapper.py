@@ -0,0 +1,217 @@
+import asyncio
+import os
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+from util.loghandler import log
+from util.rate_limiter import AsyncRateLimitedClient
+from util.slack_wrapper import SlackWrapper
+
+
+class AsyncSlackWrapper(SlackWrapper):
+    """
+    Slack API wrapper for code running on an asyncio event loop. Offers the API
+    of SlackWrapper as coroutines on top of AsyncWebClient, so many Slack calls
+    can be in flight without a thread for each. Needs the aiohttp package.
+
+    Only methods doing more than passing a call on to the client are overridden
+    here, the inherited ones return the client's coroutine.
+    """
+
+    def __init__(self, rate_limiter=None, members=None):
+        super().__init__(rate_limiter, members)
+        self._members_lock = asyncio.Lock()
+
+    def create_client(self):
+        return AsyncRateLimitedClient(
+            AsyncWebClient(token=os.environ.get("SLACK_BOT_TOKEN")), self.rate_limiter
+        )
+
+    async def paginate(self, method, key, limit=None, **kwargs):
+        """
+        Yield the items under key of a cursor-paginated Web API method, with
+        limit items per page. The next page is only fetched once the items of
+        the previous one are used up.
+        """
+
+        cursor = None
+        while True:
+            response = await method(
+                cursor=cursor, limit=limit or self.page_size, **kwargs
+            )
+            for item in response[key]:
+                yield item
+            cursor = self.next_cursor(response)
+            if not cursor:
+                return
+
+    async def run_concurrently(self, func, items, progress=None):
+        """
+        Await func for each of the given items concurrently.
+        Return a list of (item, result, error) tuples in the order of the items.
+        progress is called with the number of finished and of all calls, each
+        time a call finishes.
+        """
+
+        items = list(items)
+        done = 0
+
+        async def run(item):
+            nonlocal done
+            try:
+                return item, await func(item), None
+            except Exception as e:
+                return item, None, e
+            finally:
+                done += 1
+                if progress:
+                    progress(done, len(items))
+
+        return list(await asyncio.gather(*(run(item) for item in items)))
+
+    async def get_members(self):
+        """
+        Return a list of all members, as users.list response.
+        """
+
+        async with self._members_lock:
+            if self.members.expired():
+                await self.load_members()
+        return {"ok": True, "members": self.members.list()}
+
+    async def load_members(self, limit=None):
+        """
+        Load all members page by page from users.list into the user cache.
+        """
+
+        members = [
+            member
+            async for member in self.paginate(self.client.users_list, "members", limit)
+        ]
+        self.members.load(members)
+        return members
+
+    async def get_member(self, user_id):
+        """
+        Return a member for a given user_id, as users.info response.
+        """
+
+        user = self.members.get(user_id)
+        if user is not None:
+            return {"ok": True, "user": user}
+
+        response = await self.client.users_info(user=user_id)
+        if response["ok"]:
+            self.members.update(response["user"])
+        return response
+
+    async def get_channel_members(self, channel_id, limit=None):
+        """Fetch all members of the given channel."""
+
+        return [
+            member async for member in self.iter_channel_members(channel_id, limit)
+        ]
+
+    async def get_missing_members(self, channel_id, user_ids):
+        """
+        Return the given users, which aren't members of the given channel.
+        Stops fetching members as soon as all of them are found.
+        """
+
+        missing = set(user_ids)
+        async for member in self.iter_channel_members(channel_id):
+            missing.discard(member)
+            if not missing:
+                break
+        return [user_id for user_id in user_ids if user_id in missing]
+
+    async def invite_members(self, channel_ids, user_ids):
+        """
+        Invite the given users to each of the given channels, skipping users who
+        are already members. Channels are handled concurrently.
+        Return a list of (channel_id, invited user ids, error) tuples.
+        """
+
+        async def invite(channel_id):
+            invites = await self.get_missing_members(channel_id, user_ids)
+            if invites:
+                await self.invite_user(invites, channel_id)
+            return invites
+
+        return await self.run_concurrently(invite, channel_ids)
+
+    async def update_channel_purpose_name(
+        self, channel_id, new_name, is_private=False
+    ):
+        """
+        Updates the channel purpose 'name' field for a given channel ID.
+        """
+
+        channel_info = await self.get_channel_info(channel_id, is_private)
+
+        purpose = self.renamed_purpose(channel_info, new_name)
+        if purpose:
+            await self.set_purpose(channel_id, purpose, is_private)
+
+    async def post_message(
+        self, channel_id, text, timestamp="", parse="full", user_id=None, blocks=None
+    ):
+        """
+        Post a message in a given channel.
+        channel_id can also be a user_id for private messages.
+        Add timestamp for replying to a specific message.
+        blocks are shown instead of text, which is the fallback for notifications.
+        Return the chat.postMessage response.
+        """
+
+        message = self.message_args(text, timestamp, parse, blocks)
+        try:
+            return await self.client.chat_postMessage(channel=channel_id, **message)
+        except SlackApiError as e:
+            log.debug(e)
+            if user_id is not None:
+                return await self.client.chat_postMessage(channel=user_id, **message)
+
+    async def post_message_with_react(
+        self, channel_id, text, reaction, parse="full", user_id=None
+    ):
+        """Post a message in a given channel and add the specified reaction to it."""
+
+        result = await self.client.chat_postMessage(
+            channel=channel_id,
+            text=text,
+            as_user=True,
+            parse=parse,
+        )
+
+        try:
+            if result["ok"]:
+                await self.client.reactions_add(
+                    channel=channel_id,
+                    name=reaction,
+                    timestamp=result["ts"],
+                )
+        except SlackApiError as e:
+            log.warning(e)
+
+    async def get_channels(self, types, limit=None):
+        """Fetch all channels of the given types."""
+
+        return [channel async for channel in self.iter_channels(types, limit)]
+
+    async def get_channel_by_name(self, name):
+        """Fetch a channel with a given name."""
+
+        async for channel in self.iter_channels(["public_channel", "private_channel"]):
+            if channel["name"] == name:
+                return channel
+        return None
+
+    async def remove_reminders_by_text(self, text):
+        """Remove all reminders that contain the specified text."""
+        reminders = await self.get_reminders()
+
+        if reminders and "reminders" in reminders:
+            for reminder in reminders["reminders"]:
+                if text in reminder["text"]:
+                    await self.remove_reminder(reminder["id"])
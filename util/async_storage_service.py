@@ -0,0 +1,463 @@
+import asyncio
+import random
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.exceptions import ConflictError, NotFoundError
+from opensearchpy.helpers import async_bulk
+
+from bottypes.challenge import Challenge
+from bottypes.ctf import CTF
+from bottypes.ctf_summary import CTFSummary
+from bottypes.invalid_command import InvalidCommand
+from util.loghandler import log
+from util.storage_service import (
+    CHALLENGE_INDEX,
+    CTF_INDEX,
+    OpenSearchStorageBase,
+    StorageService,
+)
+
+
+class AsyncStorageService(OpenSearchStorageBase):
+    """
+    Storage for ctfs and challenges, backed by OpenSearch, for code running on
+    an asyncio event loop. Offers the API of StorageService as coroutines, so
+    requests don't block the loop and independent lookups can run concurrently.
+    Needs the aiohttp package.
+
+    Shares its configuration, cache and write bookkeeping with the given
+    StorageService, so writes of either one are seen by both. Setting up and
+    migrating the indices, as well as the periodic refresh, are left to it.
+    """
+
+    def __init__(self, storage_service: StorageService):
+        self.storage_service = storage_service
+
+        self.refresh_mode = storage_service.refresh_mode
+        self.refresh = storage_service.refresh
+        self.refresh_interval = storage_service.refresh_interval
+        self.page_size = storage_service.page_size
+        self.conflict_retries = storage_service.conflict_retries
+
+        self._dirty_lock = storage_service._dirty_lock
+        self._dirty_indices = storage_service._dirty_indices
+        self.ctf_cache = storage_service.ctf_cache
+        self._cache_lock = storage_service._cache_lock
+
+        self.client = AsyncOpenSearch(**self._client_options())
+
+    @property
+    def _cache_generation(self) -> int:
+        return self.storage_service._cache_generation
+
+    @_cache_generation.setter
+    def _cache_generation(self, generation: int):
+        self.storage_service._cache_generation = generation
+
+    @property
+    def _indices_ready(self) -> bool:
+        return self.storage_service._indices_ready
+
+    async def close(self):
+        """Close the connections to the cluster."""
+        await self.client.close()
+
+    async def wait_until_ready(self, timeout: float) -> bool:
+        return await asyncio.to_thread(self.storage_service.wait_until_ready, timeout)
+
+    async def _ensure_indices(self):
+        if not self._indices_ready:
+            await asyncio.to_thread(self.storage_service._ensure_indices)
+
+    async def migrate(self) -> List[str]:
+        return await asyncio.to_thread(self.storage_service.migrate)
+
+    async def cache_stats(self) -> Dict[str, Any]:
+        return super().cache_stats()
+
+    async def add_ctf(self, ctf: CTF, replace_challenges: bool = False):
+        await self.bulk_upsert_ctfs([ctf], replace_challenges=replace_challenges)
+
+    async def bulk_upsert_ctfs(self, ctfs: List[CTF], replace_challenges: bool = True):
+        if not ctfs:
+            return
+
+        await self.bulk(self._upsert_actions(ctfs))
+        if replace_challenges:
+            await self.delete_by_query(
+                CHALLENGE_INDEX, self._stale_challenges_query(ctfs)
+            )
+        self._cache_upserted_ctfs(ctfs, replace_challenges)
+
+    async def bulk_delete(self, ctf_ids: List[str] = (), challenge_ids: List[str] = ()):
+        actions = self._delete_actions(ctf_ids, challenge_ids)
+        if not actions:
+            return
+        await self.bulk(actions)
+
+        if ctf_ids:
+            await self.delete_by_query(
+                CHALLENGE_INDEX,
+                {"query": {"terms": {"ctf_channel_id": list(ctf_ids)}}},
+            )
+        self._cache_deleted(ctf_ids, challenge_ids)
+
+    async def remove_ctf(self, ctf_id: str):
+        await self.bulk_delete(ctf_ids=[ctf_id])
+
+    async def iter_ctfs(self, finished: bool | None = None) -> AsyncIterator[CTF]:
+        async for ctf_docs in self._search_pages(CTF_INDEX, self._ctfs_query(finished)):
+            generation = self._cache_generation
+            challenges = await self._get_challenges_by_ctf(
+                [ctf_doc.get("channel_id") for ctf_doc in ctf_docs]
+            )
+            for ctf_doc in ctf_docs:
+                ctf = self._parse_ctf(
+                    ctf_doc, challenges.get(ctf_doc.get("channel_id"), [])
+                )
+                if ctf:
+                    self._fill_cache(ctf, generation)
+                    yield ctf
+
+    async def get_ctfs(self, finished: bool | None = None) -> List[CTF]:
+        return [ctf async for ctf in self.iter_ctfs(finished)]
+
+    async def get_ctf(
+        self, ctf_id: str = "", ctf_name: str = "", challenge_id=""
+    ) -> CTF | None:
+        if not (ctf_id or ctf_name or challenge_id):
+            raise ValueError("One of ctf_id, ctf_name or challenge_id must be specified.")
+
+        ctf = self._lookup_cached_ctf(ctf_id, ctf_name, challenge_id)
+        if ctf:
+            return ctf
+
+        generation = self._cache_generation
+        if challenge_id and not ctf_id:
+            ctf_id = await self._get_ctf_id_for_challenge("channel_id", challenge_id)
+
+        if ctf_id:
+            # The id is known up front, so fetch the CTF and its challenges at once
+            ctf_doc, challenges = await asyncio.gather(
+                self._get_ctf_doc(ctf_id, ctf_name),
+                self._get_challenges_by_ctf([ctf_id]),
+            )
+        else:
+            ctf_doc = await self._get_ctf_doc(ctf_id, ctf_name)
+            challenges = (
+                await self._get_challenges_by_ctf([ctf_doc["channel_id"]])
+                if ctf_doc
+                else {}
+            )
+
+        if ctf_doc:
+            ctf = self._parse_ctf(ctf_doc, challenges.get(ctf_doc["channel_id"], []))
+            if ctf:
+                self._fill_cache(ctf, generation)
+            return ctf
+        return None
+
+    async def get_ctf_summary(
+        self, ctf_id: str = "", ctf_name: str = ""
+    ) -> CTFSummary | None:
+        if not (ctf_id or ctf_name):
+            raise ValueError("One of ctf_id or ctf_name must be specified.")
+
+        ctf = self._lookup_cached_ctf(ctf_id, ctf_name, "")
+        if ctf:
+            return ctf.summary()
+
+        # Only fetch the fields of the summary, its challenges aren't needed
+        ctf_doc = await self._get_ctf_doc(
+            ctf_id, ctf_name, fields=list(CTFSummary.__fields__)
+        )
+        if ctf_doc:
+            return self._parse_ctf_summary(ctf_doc)
+        return None
+
+    async def _get_ctf_doc(
+        self, ctf_id: str, ctf_name: str, fields: List[str] | None = None
+    ) -> Dict:
+        if ctf_id:
+            try:
+                result = await self.get(CTF_INDEX, ctf_id, fields=fields)
+                if result["found"] is True:
+                    return result["_source"]
+            except NotFoundError as e:
+                log.info(f"CTF with id {ctf_id} not found.")
+        if ctf_name:
+            ctf_doc = self._first_hit(
+                await self.search(CTF_INDEX, self._ctf_name_query(ctf_name, fields))
+            )
+            if ctf_doc:
+                return ctf_doc
+            log.info(f"CTF with name {ctf_name} not found.")
+        return {}
+
+    async def update_ctf(self, ctf_id: str, update_func: Any) -> CTFSummary | None:
+        updated_ctf = None
+
+        def update_doc(ctf_doc):
+            nonlocal updated_ctf
+            updated_ctf = self._parse_ctf_summary(ctf_doc)
+            if not updated_ctf or update_func(updated_ctf) is False:
+                return None
+            return updated_ctf.dict()
+
+        if await self.update_versioned(CTF_INDEX, ctf_id, update_doc) is not None:
+            self._update_cached_ctf(ctf_id, updated_ctf)
+        elif not updated_ctf:
+            self._update_cached_ctf(ctf_id, None)
+        return updated_ctf
+
+    async def update_ctf_name(self, ctf_id: str, ctf_name: str):
+        await self.update(CTF_INDEX, {"doc": {"name": ctf_name}}, ctf_id)
+        self._update_cache(ctf_id, lambda ctf: setattr(ctf, "name", ctf_name))
+
+    async def add_challenge(self, challenge: Challenge, ctf_id: str):
+        ctf_found = self.ctf_cache.peek(ctf_id) is not None
+        if not ctf_found:
+            try:
+                ctf_found = (await self.get(CTF_INDEX, ctf_id))["found"]
+            except NotFoundError as e:
+                ctf_found = False
+        if not ctf_found:
+            raise ValueError(f"No CTF with id {ctf_id}.")
+        await self.add(CHALLENGE_INDEX, challenge.dict(), challenge.channel_id)
+        self._update_cached_challenge(challenge)
+
+    async def get_challenges(self, ctf_id: str) -> List[Challenge]:
+        ctf = self._cached_ctf(ctf_id)
+        if ctf:
+            return ctf.challenges
+        return (await self._get_challenges_by_ctf([ctf_id])).get(ctf_id, [])
+
+    async def _get_challenges_by_ctf(
+        self, ctf_ids: List[str]
+    ) -> Dict[str, List[Challenge]]:
+        challenges: Dict[str, List[Challenge]] = {}
+        if not ctf_ids:
+            return challenges
+        query = {"terms": {"ctf_channel_id": ctf_ids}}
+        async for challenge_docs in self._search_pages(CHALLENGE_INDEX, query):
+            for challenge_doc in challenge_docs:
+                challenge = self._parse_challenge(challenge_doc)
+                if challenge:
+                    challenges.setdefault(challenge.ctf_channel_id, []).append(
+                        challenge
+                    )
+        return challenges
+
+    async def get_challenge(
+        self, challenge_id: str = "", challenge_name: str = "", ctf_id: str = ""
+    ) -> Challenge | None:
+        if not (challenge_id or challenge_name):
+            raise ValueError("One of challenge_id or challenge_name must be specified.")
+
+        # Commands in a CTF channel look it up as challenge channel first
+        if challenge_id and self.ctf_cache.peek(challenge_id) is not None:
+            return None
+        challenge = self._get_cached_challenge(challenge_id, challenge_name, ctf_id)
+        if not challenge:
+            if challenge_id:
+                challenge_doc = await self._get_challenge_doc(challenge_id)
+            else:
+                challenge_doc = self._first_hit(
+                    await self.search(
+                        CHALLENGE_INDEX,
+                        self._challenge_name_query(challenge_name, ctf_id),
+                    )
+                )
+            if challenge_doc:
+                challenge = self._parse_challenge(challenge_doc)
+
+        if challenge and ctf_id and challenge.ctf_channel_id != ctf_id:
+            return None
+        return challenge
+
+    async def get_challenge_from_args_or_channel(
+        self, args, channel_id
+    ) -> Challenge | None:
+        """See StorageBackend.get_challenge_from_args_or_channel."""
+        current_chal = await self.get_challenge(challenge_id=channel_id)
+        if current_chal:
+            return current_chal
+        return await self.get_challenge(
+            challenge_name=args[0].lower().strip("*"), ctf_id=channel_id
+        )
+
+    async def _get_challenge_doc(self, challenge_id: str) -> Dict:
+        try:
+            result = await self.get(CHALLENGE_INDEX, challenge_id)
+            if result["found"] is True:
+                return result["_source"]
+        except NotFoundError as e:
+            log.debug(f"Challenge with id {challenge_id} not found.")
+        return {}
+
+    async def remove_challenge(self, challenge_id: str, ctf_id: str):
+        try:
+            await self.delete(CHALLENGE_INDEX, challenge_id)
+        except NotFoundError as e:
+            log.info(f"Challenge with id {challenge_id} not found.")
+        self._cache_removed_challenge(challenge_id, ctf_id)
+
+    async def update_challenge(
+        self, challenge_id: str, update_func: Any, ctf_id: str = ""
+    ) -> Challenge | None:
+        """See StorageService.update_challenge."""
+        updated_challenge = None
+
+        def update_doc(challenge_doc):
+            nonlocal updated_challenge
+            updated_challenge = self._parse_challenge(challenge_doc)
+            if not updated_challenge or update_func(updated_challenge) is False:
+                return None
+            return updated_challenge.dict()
+
+        if (
+            await self.update_versioned(CHALLENGE_INDEX, challenge_id, update_doc)
+            is not None
+        ):
+            self._update_cached_challenge(updated_challenge)
+        if not updated_challenge:
+            log.warning(f"No challenge with id {challenge_id} found.")
+        return updated_challenge
+
+    async def update_challenge_name(self, challenge_id: str, new_name: str):
+        await self.update(CHALLENGE_INDEX, {"doc": {"name": new_name}}, challenge_id)
+        self._cache_renamed_challenge(challenge_id, new_name)
+
+    async def _get_ctf_id_for_challenge(self, field: str, value: str) -> str:
+        """See StorageService._get_ctf_id_for_challenge."""
+        ctf = self.ctf_cache.find(lambda ctf: self._has_challenge(ctf, field, value))
+        if ctf:
+            return ctf.channel_id
+
+        if field == "channel_id":
+            return (await self._get_challenge_doc(value)).get("ctf_channel_id", "")
+
+        query = {"size": 1, "query": {"term": {field: value}}}
+        return self._first_hit(await self.search(CHALLENGE_INDEX, query)).get(
+            "ctf_channel_id", ""
+        )
+
+    async def add(self, index: str, document: Dict[Any, Any], doc_id: str):
+        await self._ensure_indices()
+        response = await self.client.index(
+            index=index, body=document, id=doc_id, refresh=self.refresh
+        )
+        self._track_write(index)
+        log.debug(f"Adding document: {response}")
+
+    async def update(self, index: str, document: Dict[Any, Any], doc_id: str):
+        await self._ensure_indices()
+        response = await self.client.update(
+            index=index,
+            body=document,
+            id=doc_id,
+            refresh=self.refresh,
+            retry_on_conflict=self.conflict_retries,
+        )
+        self._track_write(index)
+        log.debug(f"Updating document: {response}")
+
+    async def update_versioned(
+        self,
+        index: str,
+        doc_id: str,
+        update_func: Callable[[Dict[Any, Any]], Dict[Any, Any] | None],
+    ) -> Dict[Any, Any] | None:
+        """See StorageService.update_versioned."""
+        await self._ensure_indices()
+        for attempt in range(self.conflict_retries + 1):
+            try:
+                # Always read from the cluster, as we need the current version
+                result = await self.client.get(index=index, id=doc_id)
+            except NotFoundError as e:
+                return None
+            if result["found"] is not True:
+                return None
+
+            document = update_func(result["_source"])
+            if document is None:
+                return None
+
+            try:
+                response = await self.client.index(
+                    index=index,
+                    body=document,
+                    id=doc_id,
+                    refresh=self.refresh,
+                    if_seq_no=result["_seq_no"],
+                    if_primary_term=result["_primary_term"],
+                )
+            except ConflictError as e:
+                log.debug(f"Version conflict on {index}/{doc_id} (attempt {attempt})")
+                await asyncio.sleep(random.uniform(0, 0.05 * 2**attempt))
+                continue
+
+            self._track_write(index)
+            log.debug(f"Updating document: {response}")
+            return document
+
+        log.error(f"Giving up on updating {index}/{doc_id} after version conflicts.")
+        raise InvalidCommand("Storage is busy, please try again.")
+
+    async def bulk(self, actions: List[Dict[str, Any]]):
+        """Execute index/delete actions in a single `_bulk` request."""
+        await self._ensure_indices()
+        # Deleting an already missing document is fine
+        await async_bulk(
+            self.client, actions, refresh=self.refresh, ignore_status=(404,)
+        )
+        self._track_bulk(actions)
+
+    async def get(self, index: str, doc_id: str, fields: List[str] | None = None):
+        """Get a document, only including the top-level fields given, if any."""
+        await self._ensure_indices()
+        if fields is not None:
+            return await self.client.get(
+                index=index, id=doc_id, _source_includes=fields
+            )
+        return await self.client.get(index=index, id=doc_id)
+
+    async def search(self, index: str, query: Any):
+        await self._ensure_indices()
+        if index in self._dirty_indices:
+            await self.refresh_indices([index])
+        return await self.client.search(index=index, body=query)
+
+    async def _search_pages(self, index: str, query: Any) -> AsyncIterator[List[Dict]]:
+        """Yield the documents matching query page by page (see _page_query)."""
+        body = self._page_query(query)
+        while True:
+            hits = (await self.search(index, body))["hits"]["hits"]
+            if hits:
+                yield [hit["_source"] for hit in hits]
+            if len(hits) < self.page_size:
+                return
+            body["search_after"] = hits[-1]["sort"]
+
+    async def delete(self, index, doc_id):
+        await self._ensure_indices()
+        await self.client.delete(index=index, id=doc_id, refresh=self.refresh)
+        self._track_write(index)
+
+    async def delete_by_query(self, index: str, query: Any):
+        await self._ensure_indices()
+        if index in self._dirty_indices:
+            await self.refresh_indices([index])
+        # delete_by_query only knows about true/false refreshes
+        await self.client.delete_by_query(
+            index=index, body=query, refresh=self.refresh is True
+        )
+        self._track_delete_by_query(index)
+
+    async def refresh_indices(self, indices: List[str] | None = None):
+        """See StorageService.refresh_indices."""
+        indices = self._start_refresh(indices)
+        if not indices:
+            return
+        await self.client.indices.refresh(index=",".join(indices))
@@ -0,0 +1,197 @@
+"""Command executor module - Runs bot commands on a bounded worker pool."""
+import asyncio
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, Set, Tuple
+
+from util.loghandler import log
+
+
+class CommandExecutor:
+    """
+    Runs tasks on a bounded thread pool. Tasks with the same ordering key run
+    one after another in submission order, tasks with different keys run in
+    parallel. Keeps queue depth and latency per task name for reporting.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.pending = 0
+        self.running = 0
+        self.max_pending = 0
+        self._latencies: Dict[str, list] = {}
+        self._queues: Dict[Hashable, Deque] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="command"
+        )
+
+    def submit(
+        self,
+        key: Hashable,
+        func: Callable[[], Any],
+        name: str = "",
+        route: Callable[[], Hashable] | None = None,
+    ):
+        """
+        Queue func behind all tasks submitted before with the same key. Latency
+        is kept per name, so names should come from a small, fixed set.
+        With route, a worker first calls route() to find the final key of the
+        task, e.g. if finding it needs a lookup in storage, and queues the task
+        under that key. Tasks routed from the same key keep their order.
+        """
+        with self._lock:
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+            self._enqueue(key, (func, name, time.monotonic(), route))
+
+    def _enqueue(self, key: Hashable, task: Tuple):
+        """Queue a task for key, starting the key's queue if it was empty."""
+        queue = self._queues.setdefault(key, deque())
+        queue.append(task)
+        if len(queue) == 1:
+            self._start(key)
+
+    def _start(self, key: Hashable):
+        """Run the first task queued for key."""
+        self._executor.submit(self._run, key)
+
+    def _run(self, key: Hashable):
+        """Run the first task queued for key and schedule the next one."""
+        with self._lock:
+            func, name, submitted, route = self._queues[key][0]
+
+        if route is not None and self._reroute(key, self._route(key, route, name)):
+            return
+
+        self._begin()
+        try:
+            func()
+        except Exception:
+            log.exception(f"Command {name} failed")
+        finally:
+            self._finish(key, name, submitted)
+
+    @staticmethod
+    def _route(key: Hashable, route: Callable[[], Hashable], name: str) -> Hashable:
+        """Return the key a task is routed to, its own key if routing fails."""
+        try:
+            return route()
+        except Exception:
+            log.exception(f"Routing command {name} failed")
+            return key
+
+    def _reroute(self, key: Hashable, target: Hashable) -> bool:
+        """
+        Move the first task queued for key behind the tasks queued for target.
+        Return False if the task stays, as target is its own key.
+        """
+        if target == key:
+            return False
+        with self._lock:
+            func, name, submitted, route = self._queues[key][0]
+            self._enqueue(target, (func, name, submitted, None))
+            self._next(key)
+        return True
+
+    def _begin(self):
+        with self._lock:
+            self.pending -= 1
+            self.running += 1
+
+    def _finish(self, key: Hashable, name: str, submitted: float):
+        """Record the latency of a finished task and schedule the next one."""
+        latency = time.monotonic() - submitted
+        with self._lock:
+            self.running -= 1
+            stats = self._latencies.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += latency
+            stats[2] = max(stats[2], latency)
+            self._next(key)
+
+    def _next(self, key: Hashable):
+        """Drop the first task queued for key and schedule the next one."""
+        queue = self._queues[key]
+        queue.popleft()
+        if queue:
+            self._start(key)
+        else:
+            del self._queues[key]
+            if not self._queues:
+                self._idle.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and the latency of each task name."""
+        with self._lock:
+            stats = {
+                "workers": self.max_workers,
+                "running": self.running,
+                "queued": self.pending,
+                "max_queued": self.max_pending,
+            }
+            for name, (count, total, longest) in sorted(self._latencies.items()):
+                stats[name] = f"{count}x avg {total / count:.2f}s max {longest:.2f}s"
+            return stats
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until all submitted tasks are done, return False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._queues, timeout)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers, after running all submitted tasks if wait is set."""
+        if wait:
+            self.join()
+        self._executor.shutdown(wait=wait)
+
+
+class AsyncCommandExecutor(CommandExecutor):
+    """
+    CommandExecutor for a server running on an asyncio event loop. Tasks are
+    run as asyncio tasks on the loop: a task's function still runs on a worker
+    thread, but if it returns an awaitable, e.g. the coroutine of an async
+    command, it is awaited on the loop without holding on to the worker. The
+    next task of the same key starts once the awaitable is done.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_workers: int = 4):
+        super().__init__(max_workers)
+        self.loop = loop
+        # The loop only keeps weak references to running tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _start(self, key: Hashable):
+        # Tasks are submitted from the loop and from worker threads
+        self.loop.call_soon_threadsafe(self._create_task, key)
+
+    def _create_task(self, key: Hashable):
+        task = self.loop.create_task(self._run_async(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_async(self, key: Hashable):
+        """Run the first task queued for key and schedule the next one."""
+        with self._lock:
+            func, name, submitted, route = self._queues[key][0]
+
+        if route is not None:
+            target = await self.loop.run_in_executor(
+                self._executor, self._route, key, route, name
+            )
+            if self._reroute(key, target):
+                return
+
+        self._begin()
+        try:
+            result = await self.loop.run_in_executor(self._executor, func)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            log.exception(f"Command {name} failed")
+        finally:
+            self._finish(key, name, submitted)
@@ -0,0 +1,168 @@
+import threading
+from typing import Any, Dict, Iterator, List
+
+from bottypes.challenge import Challenge
+from bottypes.ctf import CTF
+from bottypes.ctf_summary import CTFSummary
+from util.loghandler import log
+from util.storage_backend import StorageBackend
+
+
+class MemoryStorageService(StorageBackend):
+    """
+    Storage for ctfs and challenges, kept in memory only. Nothing survives a
+    restart, which makes it a hermetic backend for tests and benchmarks.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # CTFs are stored without their challenges
+        self.ctfs: Dict[str, CTF] = {}
+        self.challenges: Dict[str, Challenge] = {}
+
+    def bulk_upsert_ctfs(self, ctfs: List[CTF], replace_challenges: bool = True):
+        with self.lock:
+            for ctf in ctfs:
+                if replace_challenges:
+                    self._remove_challenges_of(ctf.channel_id)
+                self.ctfs[ctf.channel_id] = ctf.copy(
+                    deep=True, update={"challenges": []}
+                )
+                for challenge in ctf.challenges:
+                    self.challenges[challenge.channel_id] = challenge.copy(deep=True)
+
+    def bulk_delete(self, ctf_ids: List[str] = (), challenge_ids: List[str] = ()):
+        with self.lock:
+            for ctf_id in ctf_ids:
+                self.ctfs.pop(ctf_id, None)
+                self._remove_challenges_of(ctf_id)
+            for challenge_id in challenge_ids:
+                self.challenges.pop(challenge_id, None)
+
+    def _remove_challenges_of(self, ctf_id: str):
+        self.challenges = {
+            challenge_id: challenge
+            for challenge_id, challenge in self.challenges.items()
+            if challenge.ctf_channel_id != ctf_id
+        }
+
+    def _with_challenges(self, ctf: CTF) -> CTF:
+        return ctf.copy(
+            deep=True, update={"challenges": self.get_challenges(ctf.channel_id)}
+        )
+
+    def iter_ctfs(self, finished: bool | None = None) -> Iterator[CTF]:
+        with self.lock:
+            ctfs = [
+                self._with_challenges(ctf)
+                for ctf in self.ctfs.values()
+                if finished is None or ctf.finished == finished
+            ]
+        return iter(ctfs)
+
+    def get_ctf(
+        self, ctf_id: str = "", ctf_name: str = "", challenge_id=""
+    ) -> CTF | None:
+        if not (ctf_id or ctf_name or challenge_id):
+            raise ValueError("One of ctf_id, ctf_name or challenge_id must be specified.")
+
+        with self.lock:
+            if challenge_id and not ctf_id:
+                challenge = self.challenges.get(challenge_id)
+                ctf_id = challenge.ctf_channel_id if challenge else ""
+            ctf = self.ctfs.get(ctf_id) if ctf_id else None
+            if not ctf and ctf_name:
+                ctf = next(
+                    (ctf for ctf in self.ctfs.values() if ctf.name == ctf_name), None
+                )
+            if not ctf:
+                log.info(f"CTF {ctf_id or ctf_name or challenge_id} not found.")
+                return None
+            return self._with_challenges(ctf)
+
+    def get_ctf_summary(self, ctf_id: str = "", ctf_name: str = "") -> CTFSummary | None:
+        if not (ctf_id or ctf_name):
+            raise ValueError("One of ctf_id or ctf_name must be specified.")
+
+        with self.lock:
+            ctf = self.ctfs.get(ctf_id) if ctf_id else None
+            if not ctf and ctf_name:
+                ctf = next(
+                    (ctf for ctf in self.ctfs.values() if ctf.name == ctf_name), None
+                )
+            return ctf.summary() if ctf else None
+
+    def update_ctf(self, ctf_id: str, update_func: Any) -> CTFSummary | None:
+        with self.lock:
+            ctf = self.ctfs.get(ctf_id)
+            if not ctf:
+                return None
+            summary = ctf.summary()
+            if update_func(summary) is not False:
+                self.ctfs[ctf_id] = CTF.parse_obj(summary.dict())
+            return summary
+
+    def update_ctf_name(self, ctf_id: str, ctf_name: str):
+        with self.lock:
+            if ctf_id in self.ctfs:
+                self.ctfs[ctf_id].name = ctf_name
+
+    def add_challenge(self, challenge: Challenge, ctf_id: str):
+        with self.lock:
+            if ctf_id not in self.ctfs:
+                raise ValueError(f"No CTF with id {ctf_id}.")
+            self.challenges[challenge.channel_id] = challenge.copy(deep=True)
+
+    def get_challenges(self, ctf_id: str) -> List[Challenge]:
+        with self.lock:
+            return [
+                challenge.copy(deep=True)
+                for challenge in self.challenges.values()
+                if challenge.ctf_channel_id == ctf_id
+            ]
+
+    def get_challenge(
+        self, challenge_id: str = "", challenge_name: str = "", ctf_id: str = ""
+    ) -> Challenge | None:
+        if not (challenge_id or challenge_name):
+            raise ValueError("One of challenge_id or challenge_name must be specified.")
+
+        with self.lock:
+            if challenge_id:
+                challenge = self.challenges.get(challenge_id)
+            else:
+                challenge = next(
+                    (
+                        challenge
+                        for challenge in self.challenges.values()
+                        if challenge.name == challenge_name
+                        and (not ctf_id or challenge.ctf_channel_id == ctf_id)
+                    ),
+                    None,
+                )
+            if not challenge or (ctf_id and challenge.ctf_channel_id != ctf_id):
+                return None
+            return challenge.copy(deep=True)
+
+    def remove_challenge(self, challenge_id: str, ctf_id: str):
+        with self.lock:
+            if self.challenges.pop(challenge_id, None) is None:
+                log.info(f"Challenge with id {challenge_id} not found.")
+
+    def update_challenge(
+        self, challenge_id: str, update_func: Any, ctf_id: str = ""
+    ) -> Challenge | None:
+        with self.lock:
+            challenge = self.challenges.get(challenge_id)
+            if not challenge:
+                log.warning(f"No challenge with id {challenge_id} found.")
+                return None
+            challenge = challenge.copy(deep=True)
+            if update_func(challenge) is not False:
+                self.challenges[challenge_id] = challenge.copy(deep=True)
+            return challenge
+
+    def update_challenge_name(self, challenge_id: str, new_name: str):
+        with self.lock:
+            if challenge_id in self.challenges:
+                self.challenges[challenge_id].name = new_name
@@ -0,0 +1,217 @@
+"""Rate limiter module - Paces Slack Web API calls by their rate limit tier."""
+import asyncio
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from slack_sdk.errors import SlackApiError
+from util.loghandler import log
+
+# Requests per minute and burst size of the Slack rate limit tiers, see
+# https://api.slack.com/docs/rate-limits
+TIERS = {
+    1: (1, 1),
+    2: (20, 3),
+    3: (50, 5),
+    4: (100, 10),
+    "post": (60, 5),
+}
+
+# Tiers of the methods used by the bot, others are paced as tier 3
+METHOD_TIERS = {
+    "chat.postMessage": "post",
+    "chat.update": 3,
+    "conversations.archive": 2,
+    "conversations.create": 2,
+    "conversations.history": 3,
+    "conversations.info": 3,
+    "conversations.invite": 3,
+    "conversations.list": 2,
+    "conversations.members": 4,
+    "conversations.rename": 2,
+    "conversations.setPurpose": 2,
+    "conversations.setTopic": 2,
+    "reactions.add": 3,
+    "reminders.add": 2,
+    "reminders.delete": 2,
+    "reminders.list": 2,
+    "users.info": 4,
+    "users.list": 2,
+}
+
+
+class TokenBucket:
+    """
+    Token bucket refilled with rate tokens per second up to capacity.
+    Tokens are reserved in order, so concurrent callers queue up behind each other.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait, before it may be used."""
+        with self._lock:
+            now = time.monotonic()
+            if now > self.updated:
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+            self.tokens -= 1
+            return self.updated - now + max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the given seconds and drop the burst."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Schedules calls with one token bucket per method, sized by the method's tier.
+    Calls rejected with HTTP 429 pause the method for Retry-After seconds and are
+    retried up to max_retries times.
+    """
+
+    def __init__(self, max_retries: int = 3):
+        self.max_retries = max_retries
+        self.calls = 0
+        self.throttled = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, method: str) -> TokenBucket:
+        """Return the token bucket of the given Web API method."""
+        with self._lock:
+            bucket = self._buckets.get(method)
+            if bucket is None:
+                per_minute, burst = TIERS[METHOD_TIERS.get(method, 3)]
+                bucket = self._buckets[method] = TokenBucket(per_minute / 60, burst)
+            return bucket
+
+    def call(self, method: str, func: Callable, *args, **kwargs) -> Any:
+        """Call func for the given Web API method, as soon as its rate limit allows."""
+        bucket = self.bucket(method)
+        for attempt in range(self.max_retries + 1):
+            self.wait(bucket.reserve())
+            self._count_call()
+            try:
+                return func(*args, **kwargs)
+            except SlackApiError as e:
+                self._handle_error(method, bucket, e, attempt)
+
+    async def call_async(self, method: str, func: Callable, *args, **kwargs) -> Any:
+        """Await func for the given Web API method, as soon as its rate limit allows."""
+        bucket = self.bucket(method)
+        for attempt in range(self.max_retries + 1):
+            await self.wait_async(bucket.reserve())
+            self._count_call()
+            try:
+                return await func(*args, **kwargs)
+            except SlackApiError as e:
+                self._handle_error(method, bucket, e, attempt)
+
+    def _count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def _handle_error(
+        self, method: str, bucket: TokenBucket, error: SlackApiError, attempt: int
+    ):
+        """Pause the method for Retry-After seconds if it was throttled, else raise."""
+        if error.response.status_code != 429 or attempt == self.max_retries:
+            raise error
+        headers = error.response.headers or {}
+        retry_after = float(headers.get("Retry-After", headers.get("retry-after", 1)))
+        log.warning(f"{method} is rate limited, retrying in {retry_after}s")
+        with self._lock:
+            self.throttled += 1
+        bucket.pause(retry_after)
+
+    def wait(self, seconds: float):
+        """Sleep for the given seconds, while being counted as queued."""
+        if seconds <= 0:
+            return
+
+        self._enqueue()
+        try:
+            time.sleep(seconds)
+        finally:
+            self._dequeue(seconds)
+
+    async def wait_async(self, seconds: float):
+        """Sleep for the given seconds without blocking the loop, counted as queued."""
+        if seconds <= 0:
+            return
+
+        self._enqueue()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._dequeue(seconds)
+
+    def _enqueue(self):
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+    def _dequeue(self, waited: float):
+        with self._lock:
+            self.queued -= 1
+            self.waited += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call counters, queue depth and wait times."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "waited": f"{self.waited:.1f}s",
+                "max_wait": f"{self.max_wait:.1f}s",
+            }
+
+
+class RateLimitedClient:
+    """
+    Proxy for a WebClient, which runs every API method through a rate limiter.
+    """
+
+    def __init__(self, client, rate_limiter: RateLimiter):
+        self.client = client
+        self.rate_limiter = rate_limiter
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        method = name.replace("_", ".")
+        return functools.partial(self.rate_limiter.call, method, attr)
+
+
+class AsyncRateLimitedClient(RateLimitedClient):
+    """
+    Proxy for an AsyncWebClient, which runs every API method through a rate limiter.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        method = name.replace("_", ".")
+        return functools.partial(self.rate_limiter.call_async, method, attr)
@@ -1,25 +1,158 @@
 import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from json import JSONDecodeError
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from util.cache import TTLCache
 from util.loghandler import log
+from util.rate_limiter import RateLimitedClient, RateLimiter
+
+
+class SlackMembers:
+    """
+    Slack users by id, shared by the sync and the async Slack wrapper. The
+    whole directory is loaded from users.list at most once per ttl, single
+    users expiring in between are refreshed from users.info or by
+    user_change/team_join events.
+    """
+
+    def __init__(self):
+        self.user_cache = TTLCache(
+            maxsize=int(os.environ.get("SLACK_USER_CACHE_SIZE", default=5000)),
+            ttl=float(os.environ.get("SLACK_USER_CACHE_TTL", default=900)),
+        )
+        # Members of the last users.list load by id, as the user cache might
+        # hold fewer users than the workspace has
+        self._members = {}
+        self.loaded_at = None
+
+    def expired(self):
+        """Return whether the directory has to be loaded (again)."""
+        return (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at > self.user_cache.ttl
+        )
+
+    def load(self, members):
+        """Replace the directory by the members of a users.list load."""
+        for member in members:
+            self.user_cache.put(member["id"], member)
+        self._members = {member["id"]: member for member in members}
+        self.loaded_at = time.monotonic()
+        log.debug(f"Loaded {len(members)} members into the user cache")
+
+    def list(self):
+        """Return all members of the last load."""
+        return list(self._members.values())
+
+    def get(self, user_id):
+        """Return a cached user, or None if it isn't cached (anymore)."""
+        return self.user_cache.get(user_id)
+
+    def update(self, user):
+        """Update a user, e.g. from a users.info response or user_change event."""
+        self.user_cache.put(user["id"], user)
+        if self.loaded_at is not None:
+            self._members[user["id"]] = user
+
+    def stats(self):
+        stats = self.user_cache.stats()
+        if self.loaded_at is not None:
+            stats["loaded"] = f"{int(time.monotonic() - self.loaded_at)}s ago"
+        return stats
 
 
 class SlackWrapper:
     """
     Slack API wrapper
+
+    Methods only passing a call on to the client are shared with
+    AsyncSlackWrapper, where they return the client's coroutine.
     """
 
-    def __init__(self):
+    def __init__(self, rate_limiter=None, members=None):
         """
         SlackWrapper constructor.
-        Connect to the real-time messaging API and
-        load the bot's login data.
+        Passing the rate limiter and members of another wrapper shares them.
+        """
+
+        # Every Web API call is paced by the rate limit tier of its method, calls
+        # throttled by Slack anyway are retried after Retry-After seconds.
+        self.rate_limiter = rate_limiter or RateLimiter(
+            max_retries=int(os.environ.get("SLACK_MAX_RETRIES", default=3))
+        )
+        self.client = self.create_client()
+
+        # Workers for fanning out calls over many channels. The rate limiter
+        # still paces them, so more workers only help until the limit is hit.
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("SLACK_WORKERS", default=8)),
+            thread_name_prefix="slack",
+        )
+
+        # Items requested per page from paginated methods
+        self.page_size = int(os.environ.get("SLACK_PAGE_SIZE", default=200))
+
+        self.members = members or SlackMembers()
+        self._members_lock = threading.Lock()
+
+    def create_client(self):
+        """Return the rate limited Web API client."""
+
+        return RateLimitedClient(
+            WebClient(token=os.environ.get("SLACK_BOT_TOKEN")), self.rate_limiter
+        )
+
+    @property
+    def user_cache(self):
+        return self.members.user_cache
+
+    @staticmethod
+    def next_cursor(response):
+        """Return the cursor of the next page of a paginated response, if any."""
+        return response.get("response_metadata", {}).get("next_cursor")
+
+    def paginate(self, method, key, limit=None, **kwargs):
+        """
+        Yield the items under key of a cursor-paginated Web API method, with
+        limit items per page. The next page is only fetched once the items of
+        the previous one are used up, so stopping early saves requests.
         """
 
-        self.client = WebClient(token=os.environ.get("SLACK_BOT_TOKEN"))
+        cursor = None
+        while True:
+            response = method(cursor=cursor, limit=limit or self.page_size, **kwargs)
+            yield from response[key]
+            cursor = self.next_cursor(response)
+            if not cursor:
+                return
+
+    def run_concurrently(self, func, items, progress=None):
+        """
+        Call func for each of the given items on the worker pool.
+        Return a list of (item, result, error) tuples in the order of the items.
+        progress is called with the number of finished and of all calls, each
+        time a call finishes.
+        Must not be called from a worker itself, as this may exhaust the pool.
+        """
+
+        items = list(items)
+        futures = [self.executor.submit(func, item) for item in items]
+        if progress:
+            for done, _ in enumerate(as_completed(futures), start=1):
+                progress(done, len(futures))
+
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append((item, future.result(), None))
+            except Exception as e:
+                results.append((item, None, e))
+        return results
 
     def invite_user(self, users, channel, is_private=False):
         """
@@ -43,17 +176,53 @@ class SlackWrapper:
 
     def get_members(self):
         """
-        Return a list of all members.
+        Return a list of all members, as users.list response.
+        """
+
+        with self._members_lock:
+            if self.members.expired():
+                self.load_members()
+        return {"ok": True, "members": self.members.list()}
+
+    def load_members(self, limit=None):
+        """
+        Load all members page by page from users.list into the user cache.
         """
 
-        return self.client.users_list()
+        members = list(self.paginate(self.client.users_list, "members", limit))
+        self.members.load(members)
+        return members
 
     def get_member(self, user_id):
         """
-        Return a member for a given user_id.
+        Return a member for a given user_id, as users.info response.
         """
 
-        return self.client.users_info(user=user_id)
+        user = self.members.get(user_id)
+        if user is not None:
+            return {"ok": True, "user": user}
+
+        response = self.client.users_info(user=user_id)
+        if response["ok"]:
+            self.members.update(response["user"])
+        return response
+
+    def update_member(self, user):
+        """
+        Update a cached member from a user object, e.g. of a user_change event.
+        """
+
+        self.members.update(user)
+
+    def user_cache_stats(self):
+        """Return statistics of the user cache."""
+
+        return self.members.stats()
+
+    def rate_limit_stats(self):
+        """Return statistics of the rate limiter."""
+
+        return self.rate_limiter.stats()
 
     def create_channel(self, name, is_private=False):
         """
@@ -78,18 +247,45 @@ class SlackWrapper:
 
         return self.client.conversations_info(channel=channel_id)
 
-    def get_channel_members(self, channel_id, next_cursor=None):
-        """Recursively fetch members of the given channel, until none remain to be fetched"""
+    def iter_channel_members(self, channel_id, limit=None):
+        """Iterate over the members of the given channel, fetching page by page."""
 
-        response = self.client.conversations_members(
-            channel=channel_id, cursor=next_cursor
+        return self.paginate(
+            self.client.conversations_members, "members", limit, channel=channel_id
         )
-        members = response["members"]
-        next_cursor = response["response_metadata"]["next_cursor"]
-        if not next_cursor:
-            return members
-        else:
-            return members + self.get_channel_members(channel_id, next_cursor)
+
+    def get_channel_members(self, channel_id, limit=None):
+        """Fetch all members of the given channel."""
+
+        return list(self.iter_channel_members(channel_id, limit))
+
+    def get_missing_members(self, channel_id, user_ids):
+        """
+        Return the given users, which aren't members of the given channel.
+        Stops fetching members as soon as all of them are found.
+        """
+
+        missing = set(user_ids)
+        for member in self.iter_channel_members(channel_id):
+            missing.discard(member)
+            if not missing:
+                break
+        return [user_id for user_id in user_ids if user_id in missing]
+
+    def invite_members(self, channel_ids, user_ids):
+        """
+        Invite the given users to each of the given channels, skipping users who
+        are already members. Channels are handled concurrently.
+        Return a list of (channel_id, invited user ids, error) tuples.
+        """
+
+        def invite(channel_id):
+            invites = self.get_missing_members(channel_id, user_ids)
+            if invites:
+                self.invite_user(invites, channel_id)
+            return invites
+
+        return self.run_concurrently(invite, channel_ids)
 
     def update_channel_purpose_name(self, channel_id, new_name, is_private=False):
         """
@@ -99,40 +295,52 @@ class SlackWrapper:
         # Update channel purpose
         channel_info = self.get_channel_info(channel_id, is_private)
 
+        purpose = self.renamed_purpose(channel_info, new_name)
+        if purpose:
+            self.set_purpose(channel_id, purpose, is_private)
+
+    @staticmethod
+    def renamed_purpose(channel_info, new_name):
+        """
+        Return the purpose of a conversations.info response with its 'name'
+        field set to new_name, or None if it can't be decoded.
+        """
+
         if channel_info:
             try:
                 purpose = json.loads(channel_info["channel"]["purpose"]["value"])
                 purpose["name"] = new_name
-
-                self.set_purpose(channel_id, json.dumps(purpose), is_private)
+                return json.dumps(purpose)
             except JSONDecodeError:
                 log.error(f"Failed to decode {channel_info}")
+        return None
 
-    def post_message(self, channel_id, text, timestamp="", parse="full", user_id=None):
+    def post_message(
+        self, channel_id, text, timestamp="", parse="full", user_id=None, blocks=None
+    ):
         """
         Post a message in a given channel.
         channel_id can also be a user_id for private messages.
         Add timestamp for replying to a specific message.
+        blocks are shown instead of text, which is the fallback for notifications.
+        Return the chat.postMessage response.
         """
 
+        message = self.message_args(text, timestamp, parse, blocks)
         try:
-            self.client.chat_postMessage(
-                channel=channel_id,
-                text=text,
-                as_user=True,
-                parse=parse,
-                thread_ts=timestamp,
-            )
+            return self.client.chat_postMessage(channel=channel_id, **message)
         except SlackApiError as e:
             log.debug(e)
             if user_id is not None:
-                self.client.chat_postMessage(
-                    channel=user_id,
-                    text=text,
-                    as_user=True,
-                    parse=parse,
-                    thread_ts=timestamp,
-                )
+                return self.client.chat_postMessage(channel=user_id, **message)
+
+    @staticmethod
+    def message_args(text, timestamp="", parse="full", blocks=None):
+        """Return the arguments of chat.postMessage for posting a message."""
+
+        return dict(
+            text=text, as_user=True, parse=parse, thread_ts=timestamp, blocks=blocks
+        )
 
     def post_message_with_react(
             self, channel_id, text, reaction, parse="full", user_id=None
@@ -169,7 +377,7 @@ class SlackWrapper:
     def update_message(self, channel_id, msg_timestamp, text, parse="full"):
         """Update a message, identified by the specified timestamp with a new text."""
 
-        self.client.chat_update(
+        return self.client.chat_update(
             channel=channel_id,
             text=text,
             ts=msg_timestamp,
@@ -177,17 +385,18 @@ class SlackWrapper:
             parse=parse,
         )
 
-    def get_channels(self, types, next_cursor=None):
-        """Recursively fetch channels, until there are no more to be fetched."""
+    def iter_channels(self, types, limit=None):
+        """Iterate over channels of the given types, fetching page by page."""
 
         types = [types] if type(types) != list else types
-        response = self.client.conversations_list(types=types, cursor=next_cursor)
-        channels = response["channels"]
-        next_cursor = response["response_metadata"]["next_cursor"]
-        if not next_cursor:
-            return channels
-        else:
-            return channels + self.get_channels(types, next_cursor)
+        return self.paginate(
+            self.client.conversations_list, "channels", limit, types=types
+        )
+
+    def get_channels(self, types, limit=None):
+        """Fetch all channels of the given types."""
+
+        return list(self.iter_channels(types, limit))
 
     def get_all_channels(self):
         """Fetch all channels."""
@@ -197,10 +406,8 @@ class SlackWrapper:
     def get_channel_by_name(self, name):
         """Fetch a channel with a given name."""
 
-        channels = self.get_all_channels()
-        for channel in channels:
-            if channel["name"] == name:
-                return channel
+        channels = self.iter_channels(["public_channel", "private_channel"])
+        return next((channel for channel in channels if channel["name"] == name), None)
 
     def get_public_channels(self):
         """Fetch all public channels."""
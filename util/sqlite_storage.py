@@ -0,0 +1,288 @@
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List
+
+from pydantic import ValidationError
+
+from bottypes.challenge import Challenge
+from bottypes.ctf import CTF
+from bottypes.ctf_summary import CTFSummary
+from util.loghandler import log
+from util.storage_backend import StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ctf (
+    channel_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ctf_name ON ctf (name);
+
+CREATE TABLE IF NOT EXISTS challenge (
+    channel_id TEXT PRIMARY KEY,
+    ctf_channel_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS challenge_ctf_name ON challenge (ctf_channel_id, name);
+CREATE INDEX IF NOT EXISTS challenge_name ON challenge (name);
+"""
+
+
+class SQLiteStorageService(StorageBackend):
+    """
+    Storage for ctfs and challenges in a local SQLite database. Every CTF and
+    challenge is a JSON document in a row, next to the columns it is looked up by.
+    """
+
+    def __init__(self, path: str, page_size: int = 100):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.page_size = page_size
+
+        # The connection is shared between the bot's threads, guarded by a lock
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def _parse_ctf(row) -> CTF | None:
+        try:
+            return CTF.parse_raw(row[0])
+        except ValidationError as e:
+            log.warning(f"Failed to build CTF from obj: {row[0]}")
+            return None
+
+    @staticmethod
+    def _parse_ctf_summary(row) -> CTFSummary | None:
+        try:
+            return CTFSummary.parse_raw(row[0])
+        except ValidationError as e:
+            log.warning(f"Failed to build CTF from obj: {row[0]}")
+            return None
+
+    @staticmethod
+    def _parse_challenge(row) -> Challenge | None:
+        try:
+            return Challenge.parse_raw(row[0])
+        except ValidationError as e:
+            log.warning(f"Failed to build Challenge from obj: {row[0]}")
+            return None
+
+    def _store_ctf(self, ctf: CTFSummary):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO ctf (channel_id, name, document) VALUES (?, ?, ?)",
+            (ctf.channel_id, ctf.name, ctf.json(exclude={"challenges"})),
+        )
+
+    def _store_challenges(self, challenges: List[Challenge]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO challenge (channel_id, ctf_channel_id, name, document) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (
+                    challenge.channel_id,
+                    challenge.ctf_channel_id,
+                    challenge.name,
+                    challenge.json(),
+                )
+                for challenge in challenges
+            ],
+        )
+
+    def bulk_upsert_ctfs(self, ctfs: List[CTF], replace_challenges: bool = True):
+        with self.lock, self.connection:
+            for ctf in ctfs:
+                if replace_challenges:
+                    self.connection.execute(
+                        "DELETE FROM challenge WHERE ctf_channel_id = ?",
+                        (ctf.channel_id,),
+                    )
+                self._store_ctf(ctf)
+                self._store_challenges(ctf.challenges)
+
+    def bulk_delete(self, ctf_ids: List[str] = (), challenge_ids: List[str] = ()):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM ctf WHERE channel_id = ?",
+                [(ctf_id,) for ctf_id in ctf_ids],
+            )
+            self.connection.executemany(
+                "DELETE FROM challenge WHERE ctf_channel_id = ?",
+                [(ctf_id,) for ctf_id in ctf_ids],
+            )
+            self.connection.executemany(
+                "DELETE FROM challenge WHERE channel_id = ?",
+                [(challenge_id,) for challenge_id in challenge_ids],
+            )
+
+    def _get_challenges_by_ctf(self, ctf_ids: List[str]) -> Dict[str, List[Challenge]]:
+        challenges: Dict[str, List[Challenge]] = {}
+        rows = self.connection.execute(
+            "SELECT document FROM challenge WHERE ctf_channel_id IN "
+            f"({', '.join('?' * len(ctf_ids))})",
+            ctf_ids,
+        )
+        for row in rows:
+            challenge = self._parse_challenge(row)
+            if challenge:
+                challenges.setdefault(challenge.ctf_channel_id, []).append(challenge)
+        return challenges
+
+    def iter_ctfs(self, finished: bool | None = None) -> Iterator[CTF]:
+        query = "SELECT channel_id, document FROM ctf WHERE channel_id > ?"
+        params: List[Any] = []
+        if finished is not None:
+            query += " AND json_extract(document, '$.finished') = ?"
+            params.append(finished)
+        query += " ORDER BY channel_id LIMIT ?"
+
+        # Fetch page by page, continuing after the last channel id of the previous
+        # page, so the lock isn't held while the caller processes the CTFs
+        last_id = ""
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    query, [last_id, *params, self.page_size]
+                ).fetchall()
+                if not rows:
+                    return
+                challenges = self._get_challenges_by_ctf([row[0] for row in rows])
+
+            for row in rows:
+                ctf = self._parse_ctf(row[1:])
+                if ctf:
+                    ctf.challenges = challenges.get(ctf.channel_id, [])
+                    yield ctf
+            if len(rows) < self.page_size:
+                return
+            last_id = rows[-1][0]
+
+    def get_ctf(
+        self, ctf_id: str = "", ctf_name: str = "", challenge_id=""
+    ) -> CTF | None:
+        if not (ctf_id or ctf_name or challenge_id):
+            raise ValueError("One of ctf_id, ctf_name or challenge_id must be specified.")
+
+        with self.lock:
+            row = None
+            if challenge_id and not ctf_id:
+                row = self.connection.execute(
+                    "SELECT ctf.document FROM ctf JOIN challenge "
+                    "ON ctf.channel_id = challenge.ctf_channel_id "
+                    "WHERE challenge.channel_id = ?",
+                    (challenge_id,),
+                ).fetchone()
+            if ctf_id:
+                row = self.connection.execute(
+                    "SELECT document FROM ctf WHERE channel_id = ?", (ctf_id,)
+                ).fetchone()
+            if not row and ctf_name:
+                row = self.connection.execute(
+                    "SELECT document FROM ctf WHERE name = ? LIMIT 1", (ctf_name,)
+                ).fetchone()
+
+            ctf = self._parse_ctf(row) if row else None
+            if not ctf:
+                log.info(f"CTF {ctf_id or ctf_name or challenge_id} not found.")
+                return None
+            ctf.challenges = self.get_challenges(ctf.channel_id)
+            return ctf
+
+    def get_ctf_summary(self, ctf_id: str = "", ctf_name: str = "") -> CTFSummary | None:
+        if not (ctf_id or ctf_name):
+            raise ValueError("One of ctf_id or ctf_name must be specified.")
+
+        with self.lock:
+            row = None
+            if ctf_id:
+                row = self.connection.execute(
+                    "SELECT document FROM ctf WHERE channel_id = ?", (ctf_id,)
+                ).fetchone()
+            if not row and ctf_name:
+                row = self.connection.execute(
+                    "SELECT document FROM ctf WHERE name = ? LIMIT 1", (ctf_name,)
+                ).fetchone()
+        return self._parse_ctf_summary(row) if row else None
+
+    def update_ctf(self, ctf_id: str, update_func: Any) -> CTFSummary | None:
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT document FROM ctf WHERE channel_id = ?", (ctf_id,)
+            ).fetchone()
+            ctf = self._parse_ctf_summary(row) if row else None
+            if not ctf:
+                return None
+            if update_func(ctf) is not False:
+                self._store_ctf(ctf)
+            return ctf
+
+    def update_ctf_name(self, ctf_id: str, ctf_name: str):
+        self.update_ctf(ctf_id, lambda ctf: setattr(ctf, "name", ctf_name))
+
+    def add_challenge(self, challenge: Challenge, ctf_id: str):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT 1 FROM ctf WHERE channel_id = ?", (ctf_id,)
+            ).fetchone()
+            if not row:
+                raise ValueError(f"No CTF with id {ctf_id}.")
+            self._store_challenges([challenge])
+
+    def get_challenges(self, ctf_id: str) -> List[Challenge]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT document FROM challenge WHERE ctf_channel_id = ?", (ctf_id,)
+            )
+            return [
+                challenge
+                for challenge in map(self._parse_challenge, rows)
+                if challenge
+            ]
+
+    def get_challenge(
+        self, challenge_id: str = "", challenge_name: str = "", ctf_id: str = ""
+    ) -> Challenge | None:
+        if not (challenge_id or challenge_name):
+            raise ValueError("One of challenge_id or challenge_name must be specified.")
+
+        if challenge_id:
+            query = "SELECT document FROM challenge WHERE channel_id = ?"
+            params = [challenge_id]
+        else:
+            query = "SELECT document FROM challenge WHERE name = ?"
+            params = [challenge_name]
+        if ctf_id:
+            query += " AND ctf_channel_id = ?"
+            params.append(ctf_id)
+
+        with self.lock:
+            row = self.connection.execute(query + " LIMIT 1", params).fetchone()
+        return self._parse_challenge(row) if row else None
+
+    def remove_challenge(self, challenge_id: str, ctf_id: str):
+        self.bulk_delete(challenge_ids=[challenge_id])
+
+    def update_challenge(
+        self, challenge_id: str, update_func: Any, ctf_id: str = ""
+    ) -> Challenge | None:
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT document FROM challenge WHERE channel_id = ?", (challenge_id,)
+            ).fetchone()
+            challenge = self._parse_challenge(row) if row else None
+            if not challenge:
+                log.warning(f"No challenge with id {challenge_id} found.")
+                return None
+            if update_func(challenge) is not False:
+                self._store_challenges([challenge])
+            return challenge
+
+    def update_challenge_name(self, challenge_id: str, new_name: str):
+        self.update_challenge(
+            challenge_id, lambda challenge: setattr(challenge, "name", new_name)
+        )
@@ -0,0 +1,193 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List
+
+from bottypes.challenge import Challenge
+from bottypes.ctf import CTF
+from bottypes.ctf_summary import CTFSummary
+from util.loghandler import log
+
+
+class StorageBackend(ABC):
+    """
+    Interface of the storage for ctfs and challenges.
+    All methods return copies, changing them doesn't change the stored data.
+    """
+
+    def add_ctf(self, ctf: CTF, replace_challenges: bool = False):
+        """
+        Store a CTF along with the challenges it carries. With replace_challenges,
+        stored challenges of this CTF that are missing in ctf.challenges are removed.
+        """
+        self.bulk_upsert_ctfs([ctf], replace_challenges=replace_challenges)
+
+    @abstractmethod
+    def bulk_upsert_ctfs(self, ctfs: List[CTF], replace_challenges: bool = True):
+        """Store many CTFs and their challenges at once (see add_ctf)."""
+
+    @abstractmethod
+    def bulk_delete(self, ctf_ids: List[str] = (), challenge_ids: List[str] = ()):
+        """Remove CTFs (including their challenges) and challenges at once."""
+
+    @abstractmethod
+    def iter_ctfs(self, finished: bool | None = None) -> Iterator[CTF]:
+        """
+        Iterate over all stored CTFs without loading all of them at once.
+        If finished is given, only finished or only running CTFs are returned.
+        """
+
+    def get_ctfs(self, finished: bool | None = None) -> List[CTF]:
+        return list(self.iter_ctfs(finished))
+
+    @abstractmethod
+    def get_ctf(
+        self, ctf_id: str = "", ctf_name: str = "", challenge_id=""
+    ) -> CTF | None:
+        """Get a CTF by its channel id, its name or the channel id of a challenge."""
+
+    def get_ctf_summary(self, ctf_id: str = "", ctf_name: str = "") -> CTFSummary | None:
+        """
+        Get the CTF-level fields of a CTF by its channel id or its name, without
+        loading its challenges.
+        """
+        ctf = self.get_ctf(ctf_id=ctf_id, ctf_name=ctf_name)
+        return ctf.summary() if ctf else None
+
+    def remove_ctf(self, ctf_id: str):
+        self.bulk_delete(ctf_ids=[ctf_id])
+
+    @abstractmethod
+    def update_ctf(self, ctf_id: str, update_func: Any) -> CTFSummary | None:
+        """
+        Apply update_func to the CTF-level fields of a stored CTF and return them.
+        Nothing is written if update_func returns False.
+        """
+
+    @abstractmethod
+    def update_ctf_name(self, ctf_id: str, ctf_name: str):
+        pass
+
+    @abstractmethod
+    def add_challenge(self, challenge: Challenge, ctf_id: str):
+        """Store a challenge, raise ValueError if the CTF doesn't exist."""
+
+    @abstractmethod
+    def get_challenges(self, ctf_id: str) -> List[Challenge]:
+        pass
+
+    @abstractmethod
+    def get_challenge(
+        self, challenge_id: str = "", challenge_name: str = "", ctf_id: str = ""
+    ) -> Challenge | None:
+        """
+        Get a challenge by its channel id or its name. If ctf_id is given, only
+        challenges of this CTF are returned.
+        """
+
+    @abstractmethod
+    def remove_challenge(self, challenge_id: str, ctf_id: str):
+        pass
+
+    @abstractmethod
+    def update_challenge(
+        self, challenge_id: str, update_func: Any, ctf_id: str = ""
+    ) -> Challenge | None:
+        """
+        Apply update_func to a stored challenge and return the updated challenge.
+        Nothing is written if update_func returns False.
+        """
+
+    @abstractmethod
+    def update_challenge_name(self, challenge_id: str, new_name: str):
+        pass
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the storage to be available."""
+        return True
+
+    def migrate(self) -> List[str]:
+        """
+        Migrate stored data to the layout of the running version.
+        Return a description of each migration step.
+        """
+        return []
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return statistics of the cache in front of the storage, if there is one."""
+        return {}
+
+    def create_async_service(self) -> "AsyncStorageAdapter":
+        """
+        Return the storage with its methods as coroutines, for async commands.
+        It shares the stored data and the cache with this storage.
+        """
+        return AsyncStorageAdapter(self)
+
+    def get_challenge_from_args_or_channel(self, args, channel_id) -> Challenge | None:
+        """
+        Helper method for getting a Challenge either from arguments or current channel.
+        Return the corresponding Challenge if called from a challenge channel.
+        Return the Challenge corresponding to the first argument if called from the
+        CTF channel.
+        Return None if no Challenge can be found.
+        """
+
+        # Check if we're currently in a challenge channel
+        current_chal = self.get_challenge(challenge_id=channel_id)
+
+        if current_chal:
+            # User is in the challenge channel
+            challenge = current_chal
+        else:
+            # Assume user is in the ctf channel
+            challenge_name = args[0].lower().strip("*")
+            challenge = self.get_challenge(
+                challenge_name=challenge_name, ctf_id=channel_id
+            )
+        return challenge
+
+
+def create_storage_service() -> StorageBackend:
+    """Create the storage backend selected by STORAGE_BACKEND."""
+    backend = os.environ.get("STORAGE_BACKEND", default="opensearch").lower()
+    log.info(f"Using {backend} storage backend")
+
+    # Only import the backend in use, so the others' dependencies are optional
+    if backend == "opensearch":
+        from util.storage_service import StorageService
+
+        return StorageService()
+    if backend == "memory":
+        from util.memory_storage import MemoryStorageService
+
+        return MemoryStorageService()
+    if backend == "sqlite":
+        from util.sqlite_storage import SQLiteStorageService
+
+        return SQLiteStorageService(
+            os.environ.get("STORAGE_PATH", default="databases/ctfbot.sqlite"),
+            page_size=int(os.environ.get("STORAGE_PAGE_SIZE", default=100)),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+class AsyncStorageAdapter:
+    """
+    Offers the API of a storage backend as coroutines, running each call on a
+    worker thread of the event loop. Async commands use it to share storage and
+    its cache with the rest of the bot, whichever backend is selected.
+    """
+
+    def __init__(self, storage_service: StorageBackend):
+        self.storage_service = storage_service
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.storage_service, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return call
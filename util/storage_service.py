@@ -1,120 +1,757 @@
 import os
-from typing import Any, Dict, List
-
-from opensearchpy import OpenSearch
-from opensearchpy.exceptions import NotFoundError, RequestError
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Set
+
+from opensearchpy import OpenSearch, helpers
+from opensearchpy.exceptions import (
+    ConflictError,
+    NotFoundError,
+    RequestError,
+    TransportError,
+)
 from pydantic import ValidationError
 
 from bottypes.challenge import Challenge
 from bottypes.ctf import CTF
+from bottypes.ctf_summary import CTFSummary
+from bottypes.invalid_command import InvalidCommand
+from util.cache import TTLCache
 from util.loghandler import log
+from util.storage_backend import StorageBackend
 
+# Aliases, pointing to the physical index of the current INDEX_VERSION
 CTF_INDEX = "ctf"
-
-
-class StorageService:
+CHALLENGE_INDEX = "challenge"
+
+# Bump after changing INDEX_MAPPINGS, `/admin migrate_storage` (or a restart)
+# then reindexes into new physical indices and moves the aliases over.
+INDEX_VERSION = 1
+
+# Consistency modes for writes (STORAGE_REFRESH):
+#   true     - refresh the index on every write (default)
+#   wait_for - block each write until the next scheduled refresh
+#   false    - never refresh on write, refresh lazily before a search needs it
+#   interval - like false, but also refresh pending writes periodically
+REFRESH_MODES = {"true": True, "wait_for": "wait_for", "false": False, "interval": False}
+
+# Fields are keywords for exact term lookups, fields never searched aren't
+# indexed at all. Every challenge is its own document, keyed by its channel id.
+INDEX_MAPPINGS = {
+    CTF_INDEX: {
+        "properties": {
+            "channel_id": {"type": "keyword"},
+            "name": {"type": "keyword"},
+            "long_name": {"type": "keyword", "index": False},
+            "cred_user": {"type": "keyword", "index": False, "doc_values": False},
+            "cred_pw": {"type": "keyword", "index": False, "doc_values": False},
+            "finished": {"type": "boolean"},
+            "finished_on": {"type": "long"},
+        }
+    },
+    CHALLENGE_INDEX: {
+        "dynamic": False,
+        "properties": {
+            "channel_id": {"type": "keyword"},
+            "ctf_channel_id": {"type": "keyword"},
+            "name": {"type": "keyword"},
+            "category": {"type": "keyword"},
+            "tags": {"type": "keyword"},
+            "is_solved": {"type": "boolean"},
+            "solver": {"type": "keyword"},
+            "solve_date": {"type": "long"},
+            "players": {"type": "object", "enabled": False},
+        },
+    },
+}
+
+
+class OpenSearchStorageBase:
     """
-    Storage for ctfs and challenges.
+    Configuration, caching, write bookkeeping and query building of the
+    OpenSearch storage, kept apart from the requests StorageService sends.
     """
 
     def __init__(self):
+        self.refresh_mode = os.environ.get("STORAGE_REFRESH", default="true").lower()
+        if self.refresh_mode not in REFRESH_MODES:
+            raise ValueError(f"Unknown STORAGE_REFRESH mode: {self.refresh_mode}")
+        self.refresh = REFRESH_MODES[self.refresh_mode]
+        self.refresh_interval = float(
+            os.environ.get("STORAGE_REFRESH_INTERVAL", default=1.0)
+        )
+
+        # Number of documents fetched per request when iterating over an index
+        self.page_size = int(os.environ.get("STORAGE_PAGE_SIZE", default=100))
+
+        # Bounded retries for writes losing a race against a concurrent write
+        self.conflict_retries = int(
+            os.environ.get("STORAGE_CONFLICT_RETRIES", default=5)
+        )
+
+        # Indices with writes, which searches might not see yet. Gets by id are
+        # realtime, so only searches need a refresh first.
+        self._dirty_lock = threading.Lock()
+        self._dirty_indices: Set[str] = set()
+
+        # Parsed CTFs (including their challenges) keyed by channel id. Every
+        # write going through the service updates or invalidates its entry.
+        self.ctf_cache = TTLCache(
+            maxsize=int(os.environ.get("STORAGE_CACHE_SIZE", default=128)),
+            ttl=float(os.environ.get("STORAGE_CACHE_TTL", default=300)),
+        )
+        self._cache_lock = threading.RLock()
+        self._cache_generation = 0
+
+        # Indices are set up on first use, so a cluster which isn't up yet
+        # doesn't block the bot from starting
+        self._indices_ready = False
+
+    @staticmethod
+    def _client_options() -> Dict[str, Any]:
+        """Return the arguments for creating the OpenSearch client."""
         host = os.environ.get("STORAGE_HOST", default="127.0.0.1")
         port = int(os.environ.get("STORAGE_PORT", default=9200))
 
-        self.client = OpenSearch(
-            hosts=[{"host": host, "port": port}],
-            http_compress=True,
-        )
+        # Commands run in parallel, so keep enough connections alive for them to
+        # reuse. Timed out or failed requests are retried on the next connection,
+        # failing nodes are put aside with an increasing dead_timeout.
+        return {
+            "hosts": [{"host": host, "port": port}],
+            "http_compress": True,
+            "maxsize": int(os.environ.get("STORAGE_POOL_SIZE", default=10)),
+            "timeout": float(os.environ.get("STORAGE_TIMEOUT", default=10)),
+            "max_retries": int(os.environ.get("STORAGE_MAX_RETRIES", default=3)),
+            "retry_on_timeout": True,
+            "retry_on_status": (502, 503, 504),
+            "sniff_on_start": os.environ.get("STORAGE_SNIFF") == "true",
+            "sniff_on_connection_fail": os.environ.get("STORAGE_SNIFF") == "true",
+        }
+
+    @staticmethod
+    def _health_args(deadline: float) -> Dict[str, Any]:
+        """Return the arguments for a cluster health check ending by deadline."""
+        remaining = max(1, int(deadline - time.monotonic()))
+        return {
+            "wait_for_status": "yellow",
+            "timeout": f"{min(remaining, 10)}s",
+            "request_timeout": min(remaining, 10) + 5,
+        }
+
+    @staticmethod
+    def _index_template(alias: str, mappings: Dict) -> Dict:
+        """Return the template for the physical indices of an alias."""
+        return {
+            "index_patterns": [f"{alias}-v*"],
+            "version": INDEX_VERSION,
+            "template": {"mappings": mappings},
+        }
+
+    @staticmethod
+    def _parse_ctf(ctf_doc: Dict, challenges: List[Challenge] | None = None):
+        try:
+            ctf = CTF.parse_obj(ctf_doc)
+        except ValidationError as e:
+            log.warning(f"Failed to build CTF from obj: {ctf_doc}")
+            return None
+        if challenges is not None:
+            ctf.challenges = challenges
+        return ctf
+
+    @staticmethod
+    def _parse_ctf_summary(ctf_doc: Dict) -> CTFSummary | None:
         try:
-            response = self.client.indices.create(CTF_INDEX)
+            return CTFSummary.parse_obj(ctf_doc)
+        except ValidationError as e:
+            log.warning(f"Failed to build CTF from obj: {ctf_doc}")
+            return None
+
+    @staticmethod
+    def _parse_challenge(challenge_doc: Dict) -> Challenge | None:
+        try:
+            return Challenge.parse_obj(challenge_doc)
+        except ValidationError as e:
+            log.warning(f"Failed to build Challenge from obj: {challenge_doc}")
+            return None
+
+    @staticmethod
+    def _ctf_action(ctf: CTF) -> Dict:
+        return {
+            "_index": CTF_INDEX,
+            "_id": ctf.channel_id,
+            "_source": ctf.dict(exclude={"challenges"}),
+        }
+
+    @staticmethod
+    def _challenge_action(challenge: Challenge) -> Dict:
+        return {
+            "_index": CHALLENGE_INDEX,
+            "_id": challenge.channel_id,
+            "_source": challenge.dict(),
+        }
+
+    def _upsert_actions(self, ctfs: List[CTF]) -> List[Dict]:
+        actions = []
+        for ctf in ctfs:
+            actions.append(self._ctf_action(ctf))
+            actions += [self._challenge_action(chall) for chall in ctf.challenges]
+        return actions
+
+    @staticmethod
+    def _stale_challenges_query(ctfs: List[CTF]) -> Dict:
+        """Query the stored challenges of ctfs, which are missing in ctf.challenges."""
+        return {
+            "query": {
+                "bool": {
+                    "filter": [
+                        {"terms": {"ctf_channel_id": [ctf.channel_id for ctf in ctfs]}}
+                    ],
+                    "must_not": [
+                        {
+                            "terms": {
+                                "channel_id": [
+                                    chall.channel_id
+                                    for ctf in ctfs
+                                    for chall in ctf.challenges
+                                ]
+                            }
+                        }
+                    ],
+                }
+            }
+        }
+
+    @staticmethod
+    def _delete_actions(ctf_ids: List[str], challenge_ids: List[str]) -> List[Dict]:
+        actions = [
+            {"_op_type": "delete", "_index": CTF_INDEX, "_id": ctf_id}
+            for ctf_id in ctf_ids
+        ]
+        actions += [
+            {"_op_type": "delete", "_index": CHALLENGE_INDEX, "_id": challenge_id}
+            for challenge_id in challenge_ids
+        ]
+        return actions
+
+    @staticmethod
+    def _ctfs_query(finished: bool | None) -> Dict:
+        if finished is None:
+            return {"match_all": {}}
+        return {"term": {"finished": finished}}
+
+    @staticmethod
+    def _ctf_name_query(ctf_name: str, fields: List[str] | None) -> Dict:
+        query: Dict = {
+            "size": 1,
+            "query": {
+                "term": {
+                    "name": ctf_name,
+                }
+            },
+        }
+        if fields is not None:
+            query["_source"] = fields
+        return query
+
+    @staticmethod
+    def _challenge_name_query(challenge_name: str, ctf_id: str) -> Dict:
+        query_filter: List[Dict] = [{"term": {"name": challenge_name}}]
+        if ctf_id:
+            query_filter.append({"term": {"ctf_channel_id": ctf_id}})
+        return {"size": 1, "query": {"bool": {"filter": query_filter}}}
+
+    def _page_query(self, query: Any) -> Dict:
+        """
+        Return the body for searching query page by page. Pages are sorted by
+        channel id and continue after the last id of the previous page
+        (search_after), so there's no limit on the number of documents.
+        """
+        return {"size": self.page_size, "query": query, "sort": [{"channel_id": "asc"}]}
+
+    @staticmethod
+    def _first_hit(result: Dict) -> Dict:
+        if result["hits"]["total"]["value"] > 0:
+            return result["hits"]["hits"][0]["_source"]
+        return {}
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.ctf_cache.stats()
+
+    def _cached_ctf(self, ctf_id: str) -> CTF | None:
+        """Return a copy of the cached CTF, so callers can't alter the cache."""
+        ctf = self.ctf_cache.get(ctf_id)
+        return ctf.copy(deep=True) if ctf else None
+
+    def _find_cached_ctf(self, match: Callable[[CTF], bool]) -> CTF | None:
+        ctf = self.ctf_cache.find(match)
+        return ctf.copy(deep=True) if ctf else None
+
+    def _lookup_cached_ctf(self, ctf_id: str, ctf_name: str, challenge_id: str):
+        """Look up a CTF in the cache, the way get_ctf looks it up in storage."""
+        if ctf_id:
+            return self._cached_ctf(ctf_id)
+        if challenge_id:
+            return self._find_cached_ctf(
+                lambda ctf: self._has_challenge(ctf, "channel_id", challenge_id)
+            )
+        return self._find_cached_ctf(lambda ctf: ctf.name == ctf_name)
+
+    @staticmethod
+    def _has_challenge(ctf: CTF, field: str, value: str) -> bool:
+        return any(getattr(chall, field) == value for chall in ctf.challenges)
+
+    def _fill_cache(self, ctf: CTF, generation: int):
+        """
+        Cache a CTF read from storage, unless a write happened since the read
+        started, as the CTF might be stale already.
+        """
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self.ctf_cache.put(ctf.channel_id, ctf.copy(deep=True))
+
+    def _update_cache(self, ctf_id: str, update_func: Callable[[CTF], Any] | None):
+        """
+        Apply a write to the cached CTF, if it is cached. Without update_func,
+        the CTF is dropped from the cache.
+        """
+        with self._cache_lock:
+            self._cache_generation += 1
+            ctf = self.ctf_cache.peek(ctf_id)
+            if ctf is None:
+                return
+            if update_func is None:
+                self.ctf_cache.pop(ctf_id)
+                return
+            ctf = ctf.copy(deep=True)
+            update_func(ctf)
+            self.ctf_cache.put(ctf_id, ctf)
+
+    def _update_cached_challenge(self, challenge: Challenge):
+        def update_func(ctf):
+            ctf.challenges = [
+                chall
+                for chall in ctf.challenges
+                if chall.channel_id != challenge.channel_id
+            ] + [challenge.copy(deep=True)]
+
+        self._update_cache(challenge.ctf_channel_id, update_func)
+
+    def _update_cached_ctf(self, ctf_id: str, updated_ctf: CTFSummary | None):
+        def update_func(ctf):
+            for key, value in updated_ctf.dict().items():
+                setattr(ctf, key, value)
+
+        self._update_cache(ctf_id, update_func if updated_ctf else None)
+
+    def _cache_upserted_ctfs(self, ctfs: List[CTF], replace_challenges: bool):
+        with self._cache_lock:
+            self._cache_generation += 1
+            for ctf in ctfs:
+                if replace_challenges:
+                    self.ctf_cache.put(ctf.channel_id, ctf.copy(deep=True))
+                else:
+                    # Stored challenges missing in ctf.challenges are kept
+                    self.ctf_cache.pop(ctf.channel_id)
+
+    def _cache_deleted(self, ctf_ids: List[str], challenge_ids: List[str]):
+        def update_func(ctf):
+            ctf.challenges = [
+                chall for chall in ctf.challenges if chall.channel_id not in challenge_ids
+            ]
+
+        for ctf_id in ctf_ids:
+            self._update_cache(ctf_id, None)
+        for ctf in self.ctf_cache.values():
+            if any(chall.channel_id in challenge_ids for chall in ctf.challenges):
+                self._update_cache(ctf.channel_id, update_func)
+
+    def _cache_removed_challenge(self, challenge_id: str, ctf_id: str):
+        def update_func(ctf):
+            ctf.challenges = [
+                chall for chall in ctf.challenges if chall.channel_id != challenge_id
+            ]
+
+        self._update_cache(ctf_id, update_func)
+
+    def _cache_renamed_challenge(self, challenge_id: str, new_name: str):
+        def update_func(ctf):
+            for challenge in ctf.challenges:
+                if challenge.channel_id == challenge_id:
+                    challenge.name = new_name
+
+        for ctf in self.ctf_cache.values():
+            if self._has_challenge(ctf, "channel_id", challenge_id):
+                self._update_cache(ctf.channel_id, update_func)
+
+    def _get_cached_challenge(
+        self, challenge_id: str, challenge_name: str, ctf_id: str
+    ) -> Challenge | None:
+        if challenge_id:
+            ctf = self._find_cached_ctf(
+                lambda ctf: self._has_challenge(ctf, "channel_id", challenge_id)
+            )
+        else:
+            ctf = self._cached_ctf(ctf_id) if ctf_id else None
+        if not ctf:
+            return None
+
+        for challenge in ctf.challenges:
+            if challenge_id and challenge.channel_id == challenge_id:
+                return challenge
+            if not challenge_id and challenge.name == challenge_name:
+                return challenge
+        return None
+
+    def _track_write(self, index: str):
+        """Remember a write that might not be visible to searches yet."""
+        # Writes with refresh=true or wait_for are searchable once they return
+        if self.refresh is not False:
+            return
+
+        with self._dirty_lock:
+            self._dirty_indices.add(index)
+
+    def _track_bulk(self, actions: List[Dict[str, Any]]):
+        for index in {action["_index"] for action in actions}:
+            self._track_write(index)
+
+    def _track_delete_by_query(self, index: str):
+        """Remember a delete by query, unless it refreshed the index."""
+        if self.refresh is not True:
+            with self._dirty_lock:
+                self._dirty_indices.add(index)
+
+    def _start_refresh(self, indices: List[str] | None) -> List[str]:
+        """
+        Take the indices to refresh out of the dirty ones. Writes tracked after
+        this mark their index dirty again for the next refresh.
+        """
+        with self._dirty_lock:
+            indices = [
+                index
+                for index in (indices or list(self._dirty_indices))
+                if index in self._dirty_indices
+            ]
+            self._dirty_indices.difference_update(indices)
+            return indices
+
+
+class StorageService(OpenSearchStorageBase, StorageBackend):
+    """
+    Storage for ctfs and challenges, backed by OpenSearch.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.client = OpenSearch(**self._client_options())
+
+        if self.refresh_mode == "interval":
+            refresh_thread = threading.Thread(
+                target=self._refresh_periodically,
+                args=(self.refresh_interval,),
+                daemon=True,
+            )
+            refresh_thread.start()
+
+        self._setup_lock = threading.RLock()
+        self._setting_up = False
+
+    def create_async_service(self):
+        """Return an AsyncStorageService sharing the cache of this storage."""
+        from util.async_storage_service import AsyncStorageService
+
+        return AsyncStorageService(self)
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        """
+        Wait until the cluster is available and the indices are set up, backing
+        off between attempts. Return False if the cluster isn't ready in time.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.5
+        while True:
+            try:
+                self.client.cluster.health(**self._health_args(deadline))
+                self._ensure_indices()
+                return True
+            except TransportError as e:
+                log.info(f"Storage not ready yet: {e}")
+
+            if time.monotonic() + delay > deadline:
+                log.warning(f"Storage not ready after {timeout} seconds")
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 10)
+
+    def _ensure_indices(self):
+        """Set up the indices before the first request using them."""
+        if self._indices_ready:
+            return
+        with self._setup_lock:
+            # Setting up uses the storage itself, from the same thread
+            if self._indices_ready or self._setting_up:
+                return
+            self._setting_up = True
+            try:
+                self.migrate()
+                self._indices_ready = True
+            finally:
+                self._setting_up = False
+
+    def create_index(self, index: str, body: Dict | None = None) -> bool:
+        """Create an index, return False if it already exists."""
+        try:
+            response = self.client.indices.create(index, body=body)
             log.debug(f"Creating index: {response}")
+            return True
         except RequestError as e:
             log.debug(f"Creating index: {e}")
+            return False
 
-    def add_ctf(self, ctf: CTF):
-        self.add(CTF_INDEX, ctf.dict(), ctf.channel_id)
+    def put_index_templates(self):
+        """Install the templates for the physical indices of every alias."""
+        for alias, mappings in INDEX_MAPPINGS.items():
+            self.client.indices.put_index_template(
+                name=alias, body=self._index_template(alias, mappings)
+            )
 
-    def get_ctfs(self) -> List[CTF]:
-        ctf_list = []
-        query: Dict = {"query": {"match_all": {}}}
-        result = self.search(CTF_INDEX, query)
-        if result["hits"]["total"]["value"] > 0:
-            for ctf_dict in result["hits"]["hits"]:
-                try:
-                    ctf_list.append(CTF.parse_obj(ctf_dict["_source"]))
-                except ValidationError as e:
-                    log.warning(f"Failed to build Challenge from obj: {ctf_dict}")
-        return ctf_list
+    def _resolve_index(self, alias: str) -> str:
+        """
+        Return the physical index behind an alias, the alias itself if it's still
+        an index of the unversioned layout or an empty string if it doesn't exist.
+        """
+        try:
+            return next(iter(self.client.indices.get_alias(name=alias)))
+        except NotFoundError as e:
+            return alias if self.client.indices.exists(index=alias) else ""
+
+    def migrate(self) -> List[str]:
+        """
+        Move every alias to a physical index of the current INDEX_VERSION,
+        reindexing the documents of its former index.
+        Writes happening while an index gets reindexed might be lost, so this
+        should only run on startup or in maintenance mode.
+        Return a description of each migration step.
+        """
+        self.put_index_templates()
+
+        steps = []
+        if self._resolve_index(CTF_INDEX) == CTF_INDEX:
+            # Embedded challenges go straight into the versioned challenge index
+            steps += self._migrate_index(CHALLENGE_INDEX)
+            self.migrate_embedded_challenges()
+
+        for alias in INDEX_MAPPINGS:
+            steps += self._migrate_index(alias)
+
+        self.ctf_cache.clear()
+        return steps
+
+    def _migrate_index(self, alias: str) -> List[str]:
+        """Move alias to its index of the current INDEX_VERSION (see migrate)."""
+        source = self._resolve_index(alias)
+        target = f"{alias}-v{INDEX_VERSION}"
+        if source == target:
+            return []
+
+        self.create_index(target)
+        actions: List[Dict] = [{"add": {"index": target, "alias": alias}}]
+        if source:
+            log.info(f"Reindexing {source} into {target}")
+            self.client.indices.refresh(index=source)
+            self.client.reindex(
+                body={"source": {"index": source}, "dest": {"index": target}},
+                refresh=True,
+                wait_for_completion=True,
+            )
+            # Swapping the alias and dropping the old index is atomic
+            actions.append({"remove_index": {"index": source}})
+            step = f"Reindexed {source} into {target}"
+        else:
+            step = f"Created {target}"
+        self.client.indices.update_aliases(body={"actions": actions})
+        return [step]
+
+    def migrate_embedded_challenges(self):
+        """
+        Move challenges embedded in CTF documents (the former document model)
+        into the challenge index and strip them from their CTF documents.
+        The challenge alias has to point to its versioned index already.
+        """
+        query: Dict = {"query": {"exists": {"field": "challenges"}}}
+        ctfs = []
+        for ctf_dict in helpers.scan(self.client, query=query, index=CTF_INDEX):
+            ctf = self._parse_ctf(ctf_dict["_source"])
+            if ctf:
+                log.info(f"Migrating challenges of CTF {ctf.channel_id}")
+                ctfs.append(ctf)
+            if len(ctfs) >= self.page_size:
+                self.bulk(self._upsert_actions(ctfs))
+                ctfs = []
+        if ctfs:
+            self.bulk(self._upsert_actions(ctfs))
+        self.ctf_cache.clear()
+
+    def bulk_upsert_ctfs(self, ctfs: List[CTF], replace_challenges: bool = True):
+        """
+        Store many CTFs and their challenges with a single `_bulk` request. With
+        replace_challenges, stored challenges of these CTFs that are missing in
+        their ctf.challenges are removed by a single delete by query.
+        """
+        if not ctfs:
+            return
+
+        self.bulk(self._upsert_actions(ctfs))
+        if replace_challenges:
+            self.delete_by_query(CHALLENGE_INDEX, self._stale_challenges_query(ctfs))
+        self._cache_upserted_ctfs(ctfs, replace_challenges)
+
+    def bulk_delete(self, ctf_ids: List[str] = (), challenge_ids: List[str] = ()):
+        """
+        Remove CTFs and challenges with a single `_bulk` request. Challenges of
+        removed CTFs, which aren't listed in challenge_ids, are removed as well.
+        """
+        actions = self._delete_actions(ctf_ids, challenge_ids)
+        if not actions:
+            return
+        self.bulk(actions)
+
+        if ctf_ids:
+            self.delete_by_query(
+                CHALLENGE_INDEX,
+                {"query": {"terms": {"ctf_channel_id": list(ctf_ids)}}},
+            )
+        self._cache_deleted(ctf_ids, challenge_ids)
+
+    def iter_ctfs(self, finished: bool | None = None) -> Iterator[CTF]:
+        for ctf_docs in self._search_pages(CTF_INDEX, self._ctfs_query(finished)):
+            generation = self._cache_generation
+            challenges = self._get_challenges_by_ctf(
+                [ctf_doc.get("channel_id") for ctf_doc in ctf_docs]
+            )
+            for ctf_doc in ctf_docs:
+                ctf = self._parse_ctf(
+                    ctf_doc, challenges.get(ctf_doc.get("channel_id"), [])
+                )
+                if ctf:
+                    self._fill_cache(ctf, generation)
+                    yield ctf
 
     def get_ctf(
         self, ctf_id: str = "", ctf_name: str = "", challenge_id=""
     ) -> CTF | None:
+        if not (ctf_id or ctf_name or challenge_id):
+            raise ValueError("One of ctf_id, ctf_name or challenge_id must be specified.")
+
+        ctf = self._lookup_cached_ctf(ctf_id, ctf_name, challenge_id)
+        if ctf:
+            return ctf
+
+        generation = self._cache_generation
+        if challenge_id and not ctf_id:
+            ctf_id = self._get_ctf_id_for_challenge("channel_id", challenge_id)
+        ctf_doc = self._get_ctf_doc(ctf_id, ctf_name)
+
+        if ctf_doc:
+            ctf = self._parse_ctf(ctf_doc, self.get_challenges(ctf_doc["channel_id"]))
+            if ctf:
+                self._fill_cache(ctf, generation)
+            return ctf
+        return None
+
+    def get_ctf_summary(self, ctf_id: str = "", ctf_name: str = "") -> CTFSummary | None:
         if not (ctf_id or ctf_name):
             raise ValueError("One of ctf_id or ctf_name must be specified.")
 
-        ctf_doc = {}
-        if challenge_id and not ctf_id:
-            the_chal_dict = self._search_all_ctfs_for_challenge(
-                "channel_id", challenge_id
-            )
-            ctf_id = the_chal_dict.get("ctf_channel_id")
+        ctf = self._lookup_cached_ctf(ctf_id, ctf_name, "")
+        if ctf:
+            return ctf.summary()
+
+        # Only fetch the fields of the summary, its challenges aren't needed
+        ctf_doc = self._get_ctf_doc(
+            ctf_id, ctf_name, fields=list(CTFSummary.__fields__)
+        )
+        if ctf_doc:
+            return self._parse_ctf_summary(ctf_doc)
+        return None
+
+    def _get_ctf_doc(
+        self, ctf_id: str, ctf_name: str, fields: List[str] | None = None
+    ) -> Dict:
+        """Fetch a CTF document by id or name, projected to fields if given."""
         if ctf_id:
             try:
-                result = self.get(CTF_INDEX, ctf_id)
+                result = self.get(CTF_INDEX, ctf_id, fields=fields)
                 if result["found"] is True:
-                    ctf_doc = result["_source"]
+                    return result["_source"]
             except NotFoundError as e:
                 log.info(f"CTF with id {ctf_id} not found.")
-        if not ctf_doc and ctf_name:
-            query = {
-                "query": {
-                    "term": {
-                        "name": ctf_name,
-                    }
-                }
-            }
-            result = self.search(CTF_INDEX, query)
-            if result["hits"]["total"]["value"] > 0:
-                ctf_doc = result["hits"]["hits"][0]["_source"]
-            else:
-                log.info(f"CTF with name {ctf_name} not found.")
-
-        try:
+        if ctf_name:
+            ctf_doc = self._first_hit(
+                self.search(CTF_INDEX, self._ctf_name_query(ctf_name, fields))
+            )
             if ctf_doc:
-                return CTF.parse_obj(ctf_doc)
-        except ValidationError as e:
-            log.warning(f"Failed to build CTF from obj: {ctf_doc}")
-            return None
+                return ctf_doc
+            log.info(f"CTF with name {ctf_name} not found.")
+        return {}
 
-    def remove_ctf(self, ctf_id: str):
-        self.delete(CTF_INDEX, ctf_id)
+    def update_ctf(self, ctf_id: str, update_func: Any) -> CTFSummary | None:
+        """
+        Apply update_func to the CTF-level fields of a stored CTF. The update is
+        retried on a fresh copy if the CTF was modified concurrently.
+        """
+        updated_ctf = None
 
-    def update_ctf(self, ctf_id: str, update_func: Any) -> CTF | None:
-        ctf = self.get_ctf(ctf_id=ctf_id)
-        if ctf:
-            update_func(ctf)
-            self.add_ctf(ctf)
-            return ctf
-        return None
+        def update_doc(ctf_doc):
+            nonlocal updated_ctf
+            updated_ctf = self._parse_ctf_summary(ctf_doc)
+            if not updated_ctf or update_func(updated_ctf) is False:
+                return None
+            return updated_ctf.dict()
+
+        if self.update_versioned(CTF_INDEX, ctf_id, update_doc) is not None:
+            self._update_cached_ctf(ctf_id, updated_ctf)
+        elif not updated_ctf:
+            self._update_cached_ctf(ctf_id, None)
+        return updated_ctf
 
     def update_ctf_name(self, ctf_id: str, ctf_name: str):
         self.update(CTF_INDEX, {"doc": {"name": ctf_name}}, ctf_id)
-        ctf = self.get_ctf(ctf_id=ctf_id)
-        ctf.name = ctf_name
-        self.add_ctf(ctf)
+        self._update_cache(ctf_id, lambda ctf: setattr(ctf, "name", ctf_name))
 
     def add_challenge(self, challenge: Challenge, ctf_id: str):
-        ctf = self.get_ctf(ctf_id)
-        if not ctf:
+        ctf_found = self.ctf_cache.peek(ctf_id) is not None
+        if not ctf_found:
+            try:
+                ctf_found = self.get(CTF_INDEX, ctf_id)["found"]
+            except NotFoundError as e:
+                ctf_found = False
+        if not ctf_found:
             raise ValueError(f"No CTF with id {ctf_id}.")
-        ctf.add_challenge(challenge)
-        self.add_ctf(ctf)
+        self.add(CHALLENGE_INDEX, challenge.dict(), challenge.channel_id)
+        self._update_cached_challenge(challenge)
 
     def get_challenges(self, ctf_id: str) -> List[Challenge]:
-        ctf = self.get_ctf(ctf_id=ctf_id)
+        ctf = self._cached_ctf(ctf_id)
         if ctf:
             return ctf.challenges
-        return []
+        return self._get_challenges_by_ctf([ctf_id]).get(ctf_id, [])
+
+    def _get_challenges_by_ctf(self, ctf_ids: List[str]) -> Dict[str, List[Challenge]]:
+        """Fetch the challenges of the given CTFs, grouped by CTF channel id."""
+        challenges: Dict[str, List[Challenge]] = {}
+        if not ctf_ids:
+            return challenges
+        query = {"terms": {"ctf_channel_id": ctf_ids}}
+        for challenge_docs in self._search_pages(CHALLENGE_INDEX, query):
+            for challenge_doc in challenge_docs:
+                challenge = self._parse_challenge(challenge_doc)
+                if challenge:
+                    challenges.setdefault(challenge.ctf_channel_id, []).append(
+                        challenge
+                    )
+        return challenges
 
     def get_challenge(
         self, challenge_id: str = "", challenge_name: str = "", ctf_id: str = ""
@@ -122,122 +759,215 @@ class StorageService:
         if not (challenge_id or challenge_name):
             raise ValueError("One of challenge_id or challenge_name must be specified.")
 
-        the_chal_dict = {}
-        if challenge_id and ctf_id:
-            ctf = self.get_ctf(ctf_id=ctf_id)
-            if ctf:
-                challenges = ctf.challenges
-                for challenge in challenges:
-                    if challenge.channel_id == challenge_id:
-                        return challenge
-        elif challenge_name and ctf_id:
-            ctf = self.get_ctf(ctf_id=ctf_id)
-            if ctf:
-                challenges = ctf.challenges
-                for challenge in challenges:
-                    if challenge.name == challenge_name:
-                        return challenge
-        elif challenge_id and not ctf_id:
-            the_chal_dict = self._search_all_ctfs_for_challenge(
-                "channel_id", challenge_id
-            )
-        elif challenge_name and not ctf_id:
-            the_chal_dict = self._search_all_ctfs_for_challenge("name", challenge_name)
+        # Commands in a CTF channel look it up as challenge channel first
+        if challenge_id and self.ctf_cache.peek(challenge_id) is not None:
+            return None
+        challenge = self._get_cached_challenge(challenge_id, challenge_name, ctf_id)
+        if not challenge:
+            if challenge_id:
+                challenge_doc = self._get_challenge_doc(challenge_id)
+            else:
+                challenge_doc = self._first_hit(
+                    self.search(
+                        CHALLENGE_INDEX,
+                        self._challenge_name_query(challenge_name, ctf_id),
+                    )
+                )
+            if challenge_doc:
+                challenge = self._parse_challenge(challenge_doc)
+
+        if challenge and ctf_id and challenge.ctf_channel_id != ctf_id:
+            return None
+        return challenge
 
+    def _get_challenge_doc(self, challenge_id: str) -> Dict:
         try:
-            return Challenge.parse_obj(the_chal_dict)
-        except ValidationError as e:
-            log.warning(f"Failed to build Challenge from obj: {the_chal_dict}")
-            return None
+            result = self.get(CHALLENGE_INDEX, challenge_id)
+            if result["found"] is True:
+                return result["_source"]
+        except NotFoundError as e:
+            log.debug(f"Challenge with id {challenge_id} not found.")
+        return {}
 
     def remove_challenge(self, challenge_id: str, ctf_id: str):
-        ctf = self.get_ctf(ctf_id=ctf_id)
-        ctf.challenges = list(
-            filter(
-                lambda challenge: challenge.channel_id != challenge_id,
-                ctf.challenges,
-            )
-        )
-        self.add_ctf(ctf)
+        try:
+            self.delete(CHALLENGE_INDEX, challenge_id)
+        except NotFoundError as e:
+            log.info(f"Challenge with id {challenge_id} not found.")
+        self._cache_removed_challenge(challenge_id, ctf_id)
 
-    def update_challenge(self, challenge_id: str, update_func: Any, ctf_id: str = ""):
-        if ctf_id:
-            ctf = self.get_ctf(ctf_id=ctf_id)
-        else:
-            challenge_dict = self._search_all_ctfs_for_challenge(
-                "channel_id", challenge_id
-            )
-            ctf_id = challenge_dict["ctf_channel_id"]
-            ctf = self.get_ctf(ctf_id=ctf_id)
-        if ctf:
-            for challenge in ctf.challenges:
-                if challenge.channel_id == challenge_id:
-                    update_func(challenge)
-            self.add_ctf(ctf)
-        else:
-            log.warning(f"No CTF with id {ctf_id} found.")
+    def update_challenge(
+        self, challenge_id: str, update_func: Any, ctf_id: str = ""
+    ) -> Challenge | None:
+        """
+        Apply update_func to a stored challenge and return the updated challenge.
+        Nothing is written if update_func returns False. The update is retried on
+        a fresh copy if the challenge was modified concurrently.
+        """
+        updated_challenge = None
+
+        def update_doc(challenge_doc):
+            nonlocal updated_challenge
+            updated_challenge = self._parse_challenge(challenge_doc)
+            if not updated_challenge or update_func(updated_challenge) is False:
+                return None
+            return updated_challenge.dict()
+
+        if self.update_versioned(CHALLENGE_INDEX, challenge_id, update_doc) is not None:
+            self._update_cached_challenge(updated_challenge)
+        if not updated_challenge:
+            log.warning(f"No challenge with id {challenge_id} found.")
+        return updated_challenge
 
     def update_challenge_name(self, challenge_id: str, new_name: str):
-        challenge_dict = self._search_all_ctfs_for_challenge("channel_id", challenge_id)
-        ctf_id = challenge_dict["ctf_channel_id"]
-        ctf = self.get_ctf(ctf_id=ctf_id)
-        for chal in ctf.challenges:
-            if chal.channel_id == challenge_id:
-                chal.name = new_name
-                break
-        self.add_ctf(ctf)
-
-    def _search_all_ctfs_for_challenge(self, field: str, value: str) -> Dict:
-        query: Dict = {"query": {"match_all": {}}}
-        result = self.search(CTF_INDEX, query)
-        the_chal_dict = {}
-        if result["hits"]["total"]["value"] > 0:
-            for ctf_dict in result["hits"]["hits"]:
-                for chal_dict in ctf_dict["_source"]["challenges"]:
-                    if value == chal_dict[field]:
-                        the_chal_dict = chal_dict
-        return the_chal_dict
+        self.update(CHALLENGE_INDEX, {"doc": {"name": new_name}}, challenge_id)
+        self._cache_renamed_challenge(challenge_id, new_name)
 
-    def get_challenge_from_args_or_channel(self, args, channel_id) -> Challenge | None:
+    def _get_ctf_id_for_challenge(self, field: str, value: str) -> str:
         """
-        Helper method for getting a Challenge either from arguments or current channel.
-        Return the corresponding Challenge if called from a challenge channel.
-        Return the Challenge corresponding to the first argument if called from the
-        CTF channel.
-        Return None if no Challenge can be found.
+        Resolve the channel id of the CTF owning a challenge. Challenge channel
+        ids are document ids, names are keywords.
         """
+        ctf = self.ctf_cache.find(lambda ctf: self._has_challenge(ctf, field, value))
+        if ctf:
+            return ctf.channel_id
 
-        # Check if we're currently in a challenge channel
-        current_chal = self.get_challenge(challenge_id=channel_id)
+        if field == "channel_id":
+            return self._get_challenge_doc(value).get("ctf_channel_id", "")
 
-        if current_chal:
-            # User is in the challenge channel
-            challenge = current_chal
-        else:
-            # Assume user is in the ctf channel
-            challenge_name = args[0].lower().strip("*")
-            challenge = self.get_challenge(
-                challenge_name=challenge_name, ctf_id=channel_id
-            )
-        return challenge
+        query = {"size": 1, "query": {"term": {field: value}}}
+        return self._first_hit(self.search(CHALLENGE_INDEX, query)).get(
+            "ctf_channel_id", ""
+        )
 
     def add(self, index: str, document: Dict[Any, Any], doc_id: str):
+        self._ensure_indices()
         response = self.client.index(
-            index=index, body=document, id=doc_id, refresh=True
+            index=index, body=document, id=doc_id, refresh=self.refresh
         )
+        self._track_write(index)
         log.debug(f"Adding document: {response}")
 
     def update(self, index: str, document: Dict[Any, Any], doc_id: str):
+        self._ensure_indices()
         response = self.client.update(
-            index=index, body=document, id=doc_id, refresh=True
+            index=index,
+            body=document,
+            id=doc_id,
+            refresh=self.refresh,
+            retry_on_conflict=self.conflict_retries,
         )
+        self._track_write(index)
         log.debug(f"Updating document: {response}")
 
-    def get(self, index: str, doc_id: str):
+    def update_versioned(
+        self,
+        index: str,
+        doc_id: str,
+        update_func: Callable[[Dict[Any, Any]], Dict[Any, Any] | None],
+    ) -> Dict[Any, Any] | None:
+        """
+        Read-modify-write a document using optimistic concurrency control.
+        update_func gets the current document and returns the document to store,
+        or None to leave it untouched. If another write got in between, the update
+        is retried on the new version of the document.
+        Return the stored document, or None if nothing was written.
+        """
+        self._ensure_indices()
+        for attempt in range(self.conflict_retries + 1):
+            try:
+                # Always read from the cluster, as we need the current version
+                result = self.client.get(index=index, id=doc_id)
+            except NotFoundError as e:
+                return None
+            if result["found"] is not True:
+                return None
+
+            document = update_func(result["_source"])
+            if document is None:
+                return None
+
+            try:
+                response = self.client.index(
+                    index=index,
+                    body=document,
+                    id=doc_id,
+                    refresh=self.refresh,
+                    if_seq_no=result["_seq_no"],
+                    if_primary_term=result["_primary_term"],
+                )
+            except ConflictError as e:
+                log.debug(f"Version conflict on {index}/{doc_id} (attempt {attempt})")
+                time.sleep(random.uniform(0, 0.05 * 2**attempt))
+                continue
+
+            self._track_write(index)
+            log.debug(f"Updating document: {response}")
+            return document
+
+        log.error(f"Giving up on updating {index}/{doc_id} after version conflicts.")
+        raise InvalidCommand("Storage is busy, please try again.")
+
+    def bulk(self, actions: List[Dict[str, Any]]):
+        """Execute index/delete actions in a single `_bulk` request."""
+        self._ensure_indices()
+        # Deleting an already missing document is fine
+        helpers.bulk(self.client, actions, refresh=self.refresh, ignore_status=(404,))
+        self._track_bulk(actions)
+
+    def get(self, index: str, doc_id: str, fields: List[str] | None = None):
+        """Get a document, only including the top-level fields given, if any."""
+        self._ensure_indices()
+        if fields is not None:
+            return self.client.get(index=index, id=doc_id, _source_includes=fields)
         return self.client.get(index=index, id=doc_id)
 
     def search(self, index: str, query: Any):
+        self._ensure_indices()
+        if index in self._dirty_indices:
+            self.refresh_indices([index])
         return self.client.search(index=index, body=query)
 
+    def _search_pages(self, index: str, query: Any) -> Iterator[List[Dict]]:
+        """Yield the documents matching query page by page (see _page_query)."""
+        body = self._page_query(query)
+        while True:
+            hits = self.search(index, body)["hits"]["hits"]
+            if hits:
+                yield [hit["_source"] for hit in hits]
+            if len(hits) < self.page_size:
+                return
+            body["search_after"] = hits[-1]["sort"]
+
     def delete(self, index, doc_id):
-        self.client.delete(index=index, id=doc_id)
+        self._ensure_indices()
+        self.client.delete(index=index, id=doc_id, refresh=self.refresh)
+        self._track_write(index)
+
+    def delete_by_query(self, index: str, query: Any):
+        self._ensure_indices()
+        if index in self._dirty_indices:
+            self.refresh_indices([index])
+        # delete_by_query only knows about true/false refreshes
+        self.client.delete_by_query(
+            index=index, body=query, refresh=self.refresh is True
+        )
+        self._track_delete_by_query(index)
+
+    def refresh_indices(self, indices: List[str] | None = None):
+        """
+        Refresh indices with unrefreshed writes, making them visible to searches.
+        Writes that happen while refreshing are left for the next refresh.
+        """
+        indices = self._start_refresh(indices)
+        if not indices:
+            return
+        self.client.indices.refresh(index=",".join(indices))
+
+    def _refresh_periodically(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh_indices()
+            except Exception:
+                log.exception("Periodic storage refresh failed")